@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Synthetic corpus generator for Minima benchmarks
+Usage: python corpus.py /tmp/minima-corpus --files 500 --paragraphs 20
+"""
+
+import os
+import random
+import zipfile
+import logging
+import argparse
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FILE_TYPES = ["pdf", "docx", "csv", "md", "txt"]
+
+VOCABULARY = [
+    "invoice", "contract", "quarterly", "revenue", "forecast", "budget", "policy",
+    "security", "incident", "deployment", "kubernetes", "database", "migration",
+    "latency", "throughput", "customer", "onboarding", "roadmap", "milestone",
+    "architecture", "embedding", "retrieval", "vector", "index", "payload",
+    "compliance", "audit", "vendor", "procurement", "hiring", "salary", "benefits",
+    "meeting", "summary", "action", "owner", "deadline", "release", "regression",
+    "benchmark", "profiling", "memory", "cluster", "replica", "backup", "restore",
+    "encryption", "certificate", "network", "firewall", "storage", "snapshot",
+]
+
+DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+
+DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(VOCABULARY, k=rng.randint(8, 20))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(3, 7)))
+
+
+def sample_queries(count: int, seed: int = 0) -> list[str]:
+    """Generate queries drawn from the same vocabulary as the corpus"""
+    rng = random.Random(seed)
+    return [" ".join(rng.sample(VOCABULARY, k=rng.randint(2, 5))) for _ in range(count)]
+
+
+def write_txt(path: Path, paragraphs: list[str]) -> None:
+    path.write_text("\n\n".join(paragraphs), encoding="utf-8")
+
+
+def write_md(path: Path, paragraphs: list[str]) -> None:
+    lines = []
+    for i, paragraph in enumerate(paragraphs):
+        lines.append(f"## Section {i + 1}")
+        lines.append(paragraph)
+    path.write_text("\n\n".join(lines), encoding="utf-8")
+
+
+def write_csv(path: Path, paragraphs: list[str]) -> None:
+    lines = ["id,title,body"]
+    for i, paragraph in enumerate(paragraphs):
+        title = paragraph.split(".")[0]
+        lines.append(f'{i},"{title}","{paragraph}"')
+    path.write_text("\n".join(lines), encoding="utf-8")
+
+
+def write_docx(path: Path, paragraphs: list[str]) -> None:
+    body = "".join(f"<w:p><w:r><w:t>{escape(p)}</w:t></w:r></w:p>" for p in paragraphs)
+    document = (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+        f"<w:body>{body}</w:body></w:document>"
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", DOCX_RELS)
+        archive.writestr("word/document.xml", document)
+
+
+def write_pdf(path: Path, paragraphs: list[str]) -> None:
+    import fitz
+
+    doc = fitz.open()
+    for i in range(0, len(paragraphs), 4):
+        page = doc.new_page()
+        rect = fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50)
+        page.insert_textbox(rect, "\n\n".join(paragraphs[i:i + 4]), fontsize=10)
+    doc.save(str(path))
+    doc.close()
+
+
+WRITERS = {
+    "txt": write_txt,
+    "md": write_md,
+    "csv": write_csv,
+    "docx": write_docx,
+    "pdf": write_pdf,
+}
+
+
+def generate_corpus(
+        root: str,
+        files: int = 100,
+        paragraphs: int = 20,
+        folders: int = 5,
+        file_types: list[str] = None,
+        seed: int = 0,
+) -> list[str]:
+    """
+    Generate a deterministic corpus of documents spread across nested folders
+
+    Args:
+        root: Target folder, created if missing
+        files: Number of files to generate
+        paragraphs: Paragraphs per file
+        folders: Number of top-level folders
+        file_types: Subset of FILE_TYPES to generate, all by default
+        seed: Random seed, the same seed always yields the same corpus
+
+    Returns:
+        list: Paths of the generated files
+    """
+    rng = random.Random(seed)
+    file_types = file_types or FILE_TYPES
+    paths = []
+    for i in range(files):
+        file_type = file_types[i % len(file_types)]
+        folder = Path(root) / f"folder_{i % folders}" / f"sub_{(i // folders) % 3}"
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"doc_{i:06d}.{file_type}"
+        WRITERS[file_type](path, [_paragraph(rng) for _ in range(paragraphs)])
+        paths.append(str(path))
+    logger.info(f"Generated {len(paths)} files in {root}")
+    return paths
+
+
+def touch_files(paths: list[str], ratio: float, seed: int = 0) -> list[str]:
+    """Rewrite a fraction of text-based files so the next crawl sees them as updated"""
+    rng = random.Random(seed)
+    candidates = [p for p in paths if Path(p).suffix.lstrip(".") in ("txt", "md", "csv")]
+    touched = rng.sample(candidates, k=min(len(candidates), round(len(paths) * ratio)))
+    for path in touched:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n\n" + _paragraph(rng))
+        mtime = os.path.getmtime(path) + 2
+        os.utime(path, (mtime, mtime))
+    return touched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic Minima corpus")
+    parser.add_argument("root", help="Target folder")
+    parser.add_argument("--files", type=int, default=100)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--folders", type=int, default=5)
+    parser.add_argument("--types", default=",".join(FILE_TYPES), help="Comma separated file types")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_corpus(
+        args.root,
+        files=args.files,
+        paragraphs=args.paragraphs,
+        folders=args.folders,
+        file_types=args.types.split(","),
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Indexing throughput and query latency benchmark for the Minima indexer
+Usage: python harness.py --files 200 --report current.json --baseline previous.json
+"""
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import hashlib
+import logging
+import threading
+import argparse
+import tempfile
+import platform
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import corpus
+import report
+
+logging.basicConfig(level=logging.WARNING, force=True)
+logger = logging.getLogger("benchmark")
+logger.setLevel(logging.INFO)
+
+INDEXER_PATH = Path(__file__).resolve().parent.parent / "indexer"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Minima indexing and /query latency")
+    parser.add_argument("--corpus", help="Existing corpus folder, generated in the work dir when omitted")
+    parser.add_argument("--workdir", help="Folder for the corpus, SQLite store and local Qdrant data")
+    parser.add_argument("--files", type=int, default=100, help="Files to generate")
+    parser.add_argument("--paragraphs", type=int, default=20, help="Paragraphs per generated file")
+    parser.add_argument("--types", default=",".join(corpus.FILE_TYPES), help="Comma separated file types")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--touch-ratio", type=float, default=0.1, help="Share of files changed before the incremental pass")
+    parser.add_argument("--qdrant", default=":memory:", help="':memory:', a local folder, or a Qdrant URL")
+    parser.add_argument("--embedder", choices=["stub", "real"], default="stub")
+    parser.add_argument("--embedding-model-id", default=os.environ.get("EMBEDDING_MODEL_ID", "sentence-transformers/all-mpnet-base-v2"))
+    parser.add_argument("--embedding-size", type=int, default=int(os.environ.get("EMBEDDING_SIZE", 768)))
+    parser.add_argument("--embedding-workers", default="0", help="Embedding pool workers for the real embedder, or 'auto'")
+    parser.add_argument("--index-concurrency", type=int, default=1, help="Files indexed concurrently")
+    parser.add_argument("--queries", type=int, default=200, help="Number of /query requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent /query requests")
+    parser.add_argument("--url", help="Send queries to a running indexer (e.g. http://localhost:8001) instead of in-process")
+    parser.add_argument("--report", default="benchmark_report.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    return parser.parse_args()
+
+
+def configure_environment(args, corpus_path: str, workdir: str) -> None:
+    """The indexer reads its configuration at import time, so this must run before importing it"""
+    os.environ["CONTAINER_PATH"] = corpus_path
+    os.environ["LOCAL_FILES_PATH"] = corpus_path
+    os.environ["EMBEDDING_MODEL_ID"] = args.embedding_model_id
+    os.environ["EMBEDDING_SIZE"] = str(args.embedding_size)
+    os.environ["DATABASE_PATH"] = os.path.join(workdir, "database.db")
+    os.environ["EMBEDDING_WORKERS"] = args.embedding_workers if args.embedder == "real" else "0"
+    os.environ["INDEX_CONCURRENCY"] = str(args.index_concurrency)
+    sys.path.insert(0, str(INDEXER_PATH))
+
+
+def build_indexer(args):
+    from qdrant_client import QdrantClient
+    from langchain_core.embeddings import Embeddings
+    from indexer import Indexer
+
+    class StubEmbeddings(Embeddings):
+        """Deterministic bag-of-words hashing embedder, isolates the pipeline from model cost"""
+
+        def __init__(self, size: int):
+            self.size = size
+
+        def _embed(self, text: str) -> list[float]:
+            vector = [0.0] * self.size
+            for token in text.lower().split():
+                digest = hashlib.md5(token.encode()).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0
+            norm = sum(v * v for v in vector) ** 0.5 or 1.0
+            return [v / norm for v in vector]
+
+        def embed_documents(self, texts: list[str]) -> list[list[float]]:
+            return [self._embed(text) for text in texts]
+
+        def embed_query(self, text: str) -> list[float]:
+            return self._embed(text)
+
+    class BenchIndexer(Indexer):
+        """Indexer wired to a local Qdrant stand-in and counting the work it does"""
+
+        def __init__(self):
+            self.files_indexed = 0
+            self.chunks_indexed = 0
+            self.counters_lock = threading.Lock()
+            super().__init__()
+
+        def _initialize_qdrant(self) -> QdrantClient:
+            if args.qdrant.startswith("http"):
+                return QdrantClient(url=args.qdrant)
+            if args.qdrant == ":memory:":
+                return QdrantClient(location=":memory:")
+            return QdrantClient(path=args.qdrant)
+
+        def _initialize_embeddings(self):
+            if args.embedder == "stub":
+                return StubEmbeddings(args.embedding_size)
+            return super()._initialize_embeddings()
+
+        def _process_file(self, loader):
+            ids = super()._process_file(loader)
+            if ids:
+                with self.counters_lock:
+                    self.files_indexed += 1
+                    self.chunks_indexed += len(ids)
+            return ids
+
+    return BenchIndexer()
+
+
+async def run_indexing_pass(indexer) -> dict:
+    """Crawl the corpus and run index_loop until it has processed everything the crawler produced"""
+    from async_queue import AsyncQueue
+    from async_loop import crawl_loop, index_loop
+
+    queue = AsyncQueue()
+    files_before, chunks_before = indexer.files_indexed, indexer.chunks_indexed
+    bulk_load_before = indexer.bulk_loader.last_report
+
+    start = time.perf_counter()
+    await crawl_loop(queue)
+    crawl_seconds = time.perf_counter() - start
+
+    # everything but the trailing all_files and stop messages
+    files_scanned = queue.size() - 2
+    index_start = time.perf_counter()
+    await index_loop(queue, indexer)
+    index_seconds = time.perf_counter() - index_start
+    total_seconds = time.perf_counter() - start
+
+    files = indexer.files_indexed - files_before
+    chunks = indexer.chunks_indexed - chunks_before
+    bulk_load = indexer.bulk_loader.last_report
+    result = {
+        "files_scanned": files_scanned,
+        "files_indexed": files,
+        "chunks_indexed": chunks,
+        "crawl_seconds": round(crawl_seconds, 3),
+        "index_seconds": round(index_seconds, 3),
+        "total_seconds": round(total_seconds, 3),
+        "files_per_sec": round(files / total_seconds, 2) if total_seconds else 0.0,
+        "chunks_per_sec": round(chunks / total_seconds, 2) if total_seconds else 0.0,
+        "peak_rss_mb": report.peak_rss_mb(),
+    }
+    if bulk_load is not bulk_load_before:
+        result["bulk_load"] = {
+            key: bulk_load[key]
+            for key in ("points", "write_seconds", "optimize_seconds", "estimated_seconds_saved")
+        }
+    return result
+
+
+def run_local_queries(indexer, queries: list[str], concurrency: int) -> list[float]:
+    def timed(query):
+        start = time.perf_counter()
+        indexer.find(query)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, queries))
+
+
+async def run_http_queries(url: str, queries: list[str], concurrency: int) -> list[float]:
+    import httpx
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        async def timed(query):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/query", json={"query": query})
+                response.raise_for_status()
+                return time.perf_counter() - start
+
+        return await asyncio.gather(*(timed(query) for query in queries))
+
+
+def run_query_load(args, indexer) -> dict:
+    queries = corpus.sample_queries(args.queries, seed=args.seed)
+    start = time.perf_counter()
+    if args.url:
+        latencies = asyncio.run(run_http_queries(args.url, queries, args.concurrency))
+    else:
+        latencies = run_local_queries(indexer, queries, args.concurrency)
+    elapsed = time.perf_counter() - start
+    summary = report.latency_summary(latencies)
+    summary["concurrency"] = args.concurrency
+    summary["queries_per_sec"] = round(len(latencies) / elapsed, 2) if elapsed else 0.0
+    return summary
+
+
+def main():
+    args = parse_args()
+    workdir = args.workdir or tempfile.mkdtemp(prefix="minima-bench-")
+    os.makedirs(workdir, exist_ok=True)
+
+    corpus_path = args.corpus
+    if corpus_path is None:
+        corpus_path = os.path.join(workdir, "corpus")
+        shutil.rmtree(corpus_path, ignore_errors=True)
+        corpus.generate_corpus(
+            corpus_path,
+            files=args.files,
+            paragraphs=args.paragraphs,
+            file_types=args.types.split(","),
+            seed=args.seed,
+        )
+    db_path = os.path.join(workdir, "database.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    configure_environment(args, corpus_path, workdir)
+    from storage import MinimaStore
+    MinimaStore.create_db_and_tables()
+    indexer = build_indexer(args)
+
+    logger.info("Running full indexing pass")
+    full = asyncio.run(run_indexing_pass(indexer))
+
+    touched = []
+    if args.corpus is None:
+        touched = corpus.touch_files(
+            [str(p) for p in Path(corpus_path).rglob("*") if p.is_file()],
+            args.touch_ratio,
+            seed=args.seed,
+        )
+    logger.info(f"Running incremental indexing pass, {len(touched)} files changed")
+    incremental = asyncio.run(run_indexing_pass(indexer))
+    incremental["files_changed"] = len(touched)
+
+    logger.info(f"Running {args.queries} queries with concurrency {args.concurrency}")
+    queries = run_query_load(args, indexer)
+
+    result = {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedder": args.embedder,
+            "qdrant": args.qdrant,
+            "query_target": args.url or "in-process",
+            "corpus": corpus_path,
+        },
+        "metrics": {
+            "full_index": full,
+            "incremental_index": incremental,
+            "query": queries,
+            "peak_rss_mb": report.peak_rss_mb(),
+        },
+    }
+    report.save_report(result, args.report)
+
+    comparison = None
+    if args.baseline:
+        comparison = report.compare(result, report.load_report(args.baseline))
+    print(report.format_report(result, comparison))
+
+
+if __name__ == "__main__":
+    main()
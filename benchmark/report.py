@@ -0,0 +1,91 @@
+import json
+import math
+import resource
+import sys
+
+# Metrics where a larger value is an improvement
+HIGHER_IS_BETTER = {"files_per_sec", "chunks_per_sec", "queries_per_sec"}
+# Suffixes of metrics where a smaller value is an improvement, plain counts are not compared
+LOWER_IS_BETTER_SUFFIXES = ("_seconds", "_ms", "_mb")
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    """Summarize latencies given in seconds as milliseconds"""
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies, default=0) * 1000, 2),
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    divider = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divider, 1)
+
+
+def _flatten(report: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(current: dict, baseline: dict) -> list[dict]:
+    """Compare numeric metrics of two reports, positive change_pct is always an improvement"""
+    rows = []
+    current_flat, baseline_flat = _flatten(current["metrics"]), _flatten(baseline["metrics"])
+    for name, value in current_flat.items():
+        leaf = name.rsplit(".", 1)[-1]
+        if name not in baseline_flat:
+            continue
+        if leaf not in HIGHER_IS_BETTER and not leaf.endswith(LOWER_IS_BETTER_SUFFIXES):
+            continue
+        old = baseline_flat[name]
+        if old == 0:
+            change = 0.0
+        elif leaf in HIGHER_IS_BETTER:
+            change = (value - old) / old * 100
+        else:
+            change = (old - value) / old * 100
+        rows.append({"metric": name, "baseline": old, "current": value, "change_pct": round(change, 1)})
+    return rows
+
+
+def format_report(report: dict, comparison: list[dict] = None) -> str:
+    lines = [f"{name}: {value}" for name, value in _flatten(report["metrics"]).items()]
+    if comparison:
+        lines.append("")
+        lines.append(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+        for row in comparison:
+            lines.append(
+                f"{row['metric']:<40} {row['baseline']:>12} {row['current']:>12} {row['change_pct']:>8}%"
+            )
+    return "\n".join(lines)
+
+
+def load_report(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_report(report: dict, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
@@ -18,10 +18,11 @@ const { Link: AntLink, Paragraph, Title } = Typography;
 const { defaultAlgorithm, darkAlgorithm } = theme;
 
 interface Message {
-    type: 'answer' | 'question' | 'full';
+    type: 'answer' | 'answer_delta' | 'question' | 'full' | 'queue_position';
     reporter: 'output_message' | 'user';
     message: string;
     links: string[];
+    position?: number;
 }
 
 const ChatApp: React.FC = () => {
@@ -40,10 +41,42 @@ const ChatApp: React.FC = () => {
         webSocket.onmessage = (event) => {
             const message_curr: Message = JSON.parse(event.data);
 
+            // Questions wait for a free model slot when many are asked at once
+            if (message_curr.type === 'queue_position') {
+                if (message_curr.position) {
+                    toast(`Waiting for the assistant, position ${message_curr.position} in line`, {
+                        toastId: 'queue_position',
+                        position: "top-right",
+                        autoClose: 2000,
+                        hideProgressBar: true,
+                        theme: "light",
+                        transition: Bounce,
+                    });
+                }
+                return;
+            }
+
             if (message_curr.reporter === 'output_message') {
                 setMessages((messages_prev) => {
-                    if (messages_prev.length === 0) return [message_curr];
+                    if (messages_prev.length === 0) return [{ ...message_curr, links: message_curr.links ?? [] }];
                     const last = messages_prev[messages_prev.length - 1];
+                    const streaming = last.type === 'answer_delta';
+
+                    // Streamed tokens grow the answer being generated
+                    if (message_curr.type === 'answer_delta') {
+                        if (streaming) {
+                            return [
+                                ...messages_prev.slice(0, -1),
+                                { ...last, message: last.message + message_curr.message },
+                            ];
+                        }
+                        return [...messages_prev, { ...message_curr, links: [] }];
+                    }
+
+                    // The final answer, with its links, replaces the streamed tokens
+                    if (message_curr.type === 'answer' && streaming) {
+                        return [...messages_prev.slice(0, -1), message_curr];
+                    }
 
                     // If last message is question or 'full', append new
                     if (last.type === 'question' || last.type === 'full') {
@@ -2,22 +2,58 @@ import nltk
 import logging
 import asyncio
 import time
+import os
+import tracing
+import profiler
+import snapshot
+from search_params import SEARCH_PROFILES, BOUNDS
+from search_filters import PAYLOAD_SCHEMA_VERSION
 from indexer import Indexer
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from storage import MinimaStore
 from async_queue import AsyncQueue
+from typing import Literal, Optional
+from datetime import datetime
 from fastapi import FastAPI, APIRouter
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from contextlib import asynccontextmanager
 from fastapi_utilities import repeat_every
-from async_loop import index_loop, crawl_loop
+from work_queue import WorkQueue
+from async_loop import index_loop, crawl_loop, publish_loop, work_loop
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# destructive maintenance endpoints, off unless the indexer is only reachable by its operators
+ADMIN_ENABLED = os.environ.get("ADMIN_ENABLED", "false").lower() in ("1", "true", "yes")
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR", "/indexer/storage/snapshots")
+# all: crawl and index in this process, crawler: publish files to the work queue, worker: index from it
+ROLE_ALL = "all"
+ROLE_CRAWLER = "crawler"
+ROLE_WORKER = "worker"
+INDEXER_ROLE = os.environ.get("INDEXER_ROLE", ROLE_ALL)
+WORK_QUEUE_PATH = os.environ.get("WORK_QUEUE_PATH", "/indexer/storage/work_queue.db")
+WORK_MAX_ATTEMPTS = int(os.environ.get("WORK_MAX_ATTEMPTS", 3))
+
+if INDEXER_ROLE not in (ROLE_ALL, ROLE_CRAWLER, ROLE_WORKER):
+    raise ValueError(f"Unsupported INDEXER_ROLE: {INDEXER_ROLE}")
+
 indexer = Indexer()
 router = APIRouter()
+admin_router = APIRouter(prefix="/admin")
+maintenance_router = APIRouter(prefix="/admin")
+profile_lock = asyncio.Lock()
+snapshot_lock = asyncio.Lock()
+reindex_lock = asyncio.Lock()
+reindex_request: asyncio.Task | None = None
 async_queue = AsyncQueue()
+work_queue = WorkQueue(WORK_QUEUE_PATH, max_attempts=WORK_MAX_ATTEMPTS) if INDEXER_ROLE != ROLE_ALL else None
 MinimaStore.create_db_and_tables()
+stale_files = MinimaStore.migrate_payload_schema(PAYLOAD_SCHEMA_VERSION) + indexer.migrate_sharding()
+if work_queue is not None:
+    work_queue.reopen(stale_files)
 
 def init_loader_dependencies():
     nltk.download('punkt')
@@ -33,17 +69,81 @@ class Query(BaseModel):
     query: str
 
 
+class SearchFilters(BaseModel):
+    extensions: Optional[list[str]] = Field(default=None, max_length=50)
+    path_prefix: Optional[str] = None
+    modified_after: Optional[datetime] = None
+    modified_before: Optional[datetime] = None
+    min_size: Optional[int] = Field(default=None, ge=0)
+    max_size: Optional[int] = Field(default=None, ge=0)
+
+
+class SearchOptions(BaseModel):
+    hnsw_ef: Optional[int] = Field(default=None, ge=BOUNDS["hnsw_ef"][0], le=BOUNDS["hnsw_ef"][1])
+    exact: Optional[bool] = None
+    rescore: Optional[bool] = None
+    oversampling: Optional[float] = Field(default=None, ge=BOUNDS["oversampling"][0], le=BOUNDS["oversampling"][1])
+    mmr: Optional[bool] = None
+    mmr_lambda: Optional[float] = Field(default=None, ge=BOUNDS["mmr_lambda"][0], le=BOUNDS["mmr_lambda"][1])
+    mmr_fetch_k: Optional[int] = Field(default=None, ge=BOUNDS["mmr_fetch_k"][0], le=BOUNDS["mmr_fetch_k"][1])
+
+
+class SearchQuery(Query):
+    folder: Optional[str] = None
+    filters: Optional[SearchFilters] = None
+    profile: Optional[Literal[tuple(SEARCH_PROFILES)]] = None
+    search: Optional[SearchOptions] = None
+    top_k: Optional[int] = Field(default=None, ge=1, le=50)
+    score_threshold: Optional[float] = Field(default=None, ge=-1, le=1)
+    max_chars: Optional[int] = Field(default=None, ge=200, le=200_000)
+    cursor: Optional[str] = None
+
+
+class EmbeddingBatchRequest(BaseModel):
+    texts: list[str] = Field(min_length=1, max_length=256)
+
+
+class ChunksRequest(BaseModel):
+    ids: list[str] = Field(max_length=500)
+
+
+class SnapshotRequest(BaseModel):
+    name: Optional[str] = None
+    remap: Optional[dict[str, str]] = None
+    force: bool = False
+    overwrite: bool = False
+
+
+class ProfileRequest(BaseModel):
+    seconds: float = Field(default=10, gt=0, le=300)
+    interval_ms: float = Field(default=10, ge=1, le=1000)
+    top: int = Field(default=25, ge=1, le=200)
+
+
 @router.post(
     "/query", 
     response_description='Query local data storage',
 )
-async def query(request: Query):
+async def query(request: SearchQuery):
     logger.info(f"Received query: {query}")
     try:
-        result = indexer.find(request.query)
+        with tracing.span("indexer.find"):
+            result = indexer.find(
+                request.query,
+                folder=request.folder,
+                top_k=request.top_k,
+                score_threshold=request.score_threshold,
+                max_chars=request.max_chars,
+                cursor=request.cursor,
+                filters=request.filters.model_dump(exclude_none=True) if request.filters else None,
+                profile=request.profile,
+                search=request.search.model_dump(exclude_none=True) if request.search else None
+            )
         logger.info(f"Found {len(result)} results for query: {query}")
         logger.info(f"Results: {result}")
-        return {"result": result}
+        with tracing.span("serialize"):
+            body = jsonable_encoder({"result": result})
+        return JSONResponse(body)
     except Exception as e:
         logger.error(f"Error in processing query: {e}")
         return {"error": str(e)}
@@ -64,6 +164,131 @@ async def embedding(request: Query):
         return {"error": str(e)}
 
 
+@router.post(
+    "/embedding/batch",
+    response_description='Get embeddings for a batch of texts',
+)
+async def embedding_batch(request: EmbeddingBatchRequest):
+    logger.info(f"Received embedding batch request for {len(request.texts)} texts")
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(None, indexer.embed_batch, request.texts)
+        return {"result": result}
+    except Exception as e:
+        logger.error(f"Error in processing embedding batch: {e}")
+        return {"error": str(e)}
+
+
+@router.post(
+    "/chunks",
+    response_description='Get chunk text and metadata by point ID from the chunk store',
+)
+async def chunks(request: ChunksRequest):
+    try:
+        return {"result": indexer.get_chunks(request.ids)}
+    except Exception as e:
+        logger.error(f"Error in getting chunks: {e}")
+        return {"error": str(e)}
+
+
+@router.get(
+    "/shards",
+    response_description='List index shards',
+)
+async def list_shards():
+    try:
+        return {"result": indexer.shard_info()}
+    except Exception as e:
+        logger.error(f"Error in listing shards: {e}")
+        return {"error": str(e)}
+
+
+@router.get(
+    "/bulk_load",
+    response_description='Bulk load state and the report of the last one',
+)
+async def bulk_load_status():
+    return {
+        "result": {
+            "active": indexer.bulk_loader.active,
+            "last_report": indexer.bulk_loader.last_report,
+        }
+    }
+
+
+def snapshot_path(name: Optional[str]) -> str:
+    """Snapshots are only read and written inside SNAPSHOT_DIR"""
+    name = os.path.basename(name or f"minima-{int(time.time())}.jsonl.gz")
+    if not name or name.startswith("."):
+        raise ValueError(f"Invalid snapshot name: {name}")
+    return os.path.join(SNAPSHOT_DIR, name)
+
+
+@maintenance_router.post(
+    "/snapshot/export",
+    response_description='Export vectors, payloads and MinimaStore state to a snapshot in SNAPSHOT_DIR',
+)
+async def export_snapshot(request: SnapshotRequest):
+    if snapshot_lock.locked():
+        return {"error": "A snapshot export or import is already running"}
+    async with snapshot_lock:
+        try:
+            path = snapshot_path(request.name)
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, snapshot.export_snapshot, indexer, path, request.overwrite
+            )
+            return {"result": result}
+        except Exception as e:
+            logger.error(f"Error in exporting snapshot: {e}")
+            return {"error": str(e)}
+
+
+@maintenance_router.post(
+    "/snapshot/import",
+    response_description='Import a snapshot from SNAPSHOT_DIR without re-embedding',
+)
+async def import_snapshot(request: SnapshotRequest):
+    if snapshot_lock.locked():
+        return {"error": "A snapshot export or import is already running"}
+    async with snapshot_lock:
+        try:
+            if not request.name:
+                raise ValueError("name of the snapshot to import is required")
+            path = snapshot_path(request.name)
+            result = await asyncio.get_running_loop().run_in_executor(
+                None, snapshot.import_snapshot, indexer, path, request.remap, request.force
+            )
+            return {"result": result}
+        except Exception as e:
+            logger.error(f"Error in importing snapshot: {e}")
+            return {"error": str(e)}
+
+
+@router.get(
+    "/index/version",
+    response_description='Generation of the indexed content, changes whenever files are indexed or removed',
+)
+async def index_version():
+    try:
+        return {"result": {"generation": MinimaStore.generation()}}
+    except Exception as e:
+        logger.error(f"Error in getting index version: {e}")
+        return {"error": str(e)}
+
+
+@router.get(
+    "/work_queue",
+    response_description='Work queue state in multi-replica mode',
+)
+async def work_queue_status():
+    if work_queue is None:
+        return {"error": "The work queue is only used with INDEXER_ROLE crawler or worker"}
+    try:
+        return {"result": {"role": INDEXER_ROLE, **work_queue.stats()}}
+    except Exception as e:
+        logger.error(f"Error in getting work queue state: {e}")
+        return {"error": str(e)}
+
+
 @router.get(
     "/health",
     response_description='Health check endpoint',
@@ -91,16 +316,75 @@ async def health_check():
         }    
 
 
+@admin_router.post(
+    "/profile",
+    response_description='Capture a CPU profile and tracemalloc snapshot of the indexer',
+)
+async def profile(request: ProfileRequest):
+    """Sample the live process for the requested duration while traffic and indexing keep running"""
+    if profile_lock.locked():
+        return {"error": "A profile capture is already running"}
+    async with profile_lock:
+        try:
+            result = await profiler.capture(
+                seconds=request.seconds,
+                interval=request.interval_ms / 1000,
+                top=request.top
+            )
+            return {"result": result}
+        except Exception as e:
+            logger.error(f"Error in profile capture: {e}")
+            return {"error": str(e)}
+
+
+@maintenance_router.delete(
+    "/shards/{name}",
+    response_description='Drop an index shard',
+)
+async def drop_shard(name: str):
+    try:
+        files = await drop_shard_files(name)
+        return {"result": {"shard": name, "files": len(files)}}
+    except Exception as e:
+        logger.error(f"Error in dropping shard {name}: {e}")
+        return {"error": str(e)}
+
+
+@maintenance_router.post(
+    "/shards/{name}/reindex",
+    response_description='Rebuild a single index shard',
+)
+async def reindex_shard(name: str):
+    try:
+        files = await drop_shard_files(name)
+        request_re_indexer()
+        return {"result": {"shard": name, "files": len(files)}}
+    except Exception as e:
+        logger.error(f"Error in reindexing shard {name}: {e}")
+        return {"error": str(e)}
+
+
+async def drop_shard_files(name: str) -> list[str]:
+    loop = asyncio.get_running_loop()
+    files = await loop.run_in_executor(None, indexer.drop_shard, name)
+    if work_queue is not None:
+        await loop.run_in_executor(None, work_queue.reopen, files)
+    return files
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    tasks = [
-        asyncio.create_task(crawl_loop(async_queue)),
-        asyncio.create_task(index_loop(async_queue, indexer))
-    ]
-    await schedule_reindexing()
+    if INDEXER_ROLE == ROLE_WORKER:
+        tasks = [asyncio.create_task(work_loop(work_queue, indexer))]
+    else:
+        tasks = [asyncio.create_task(trigger_re_indexer())]
+        # its first run finds the startup pass running and skips
+        await schedule_reindexing()
     try:
         yield
     finally:
+        if reindex_request is not None:
+            tasks.append(reindex_request)
         for task in tasks:
             task.cancel()
         await asyncio.gather(*tasks, return_exceptions=True)
@@ -112,19 +396,44 @@ def create_app() -> FastAPI:
         docs_url="/indexer/docs",
         lifespan=lifespan
     )
+    app.middleware("http")(tracing.http_middleware)
     app.include_router(router)
+    if PROFILING_ENABLED:
+        app.include_router(admin_router)
+    if ADMIN_ENABLED:
+        app.include_router(maintenance_router)
     return app
 
-async def trigger_re_indexer():
-    logger.info("Reindexing triggered")
-    try:
-        await asyncio.gather(
-            crawl_loop(async_queue),
-            index_loop(async_queue, indexer)
-        )
-        logger.info("reindexing finished")
-    except Exception as e:
-        logger.error(f"error in scheduled reindexing {e}")
+def consume_crawl():
+    if INDEXER_ROLE == ROLE_CRAWLER:
+        return publish_loop(async_queue, work_queue, indexer)
+    return index_loop(async_queue, indexer)
+
+
+async def trigger_re_indexer(wait: bool = False):
+    """One pass at a time, the crawl and index loops share async_queue and the bulk load"""
+    if INDEXER_ROLE == ROLE_WORKER:
+        return
+    if reindex_lock.locked() and not wait:
+        logger.info("Reindexing already running, skipping")
+        return
+    async with reindex_lock:
+        logger.info("Reindexing triggered")
+        try:
+            await asyncio.gather(
+                crawl_loop(async_queue),
+                consume_crawl()
+            )
+            logger.info("reindexing finished")
+        except Exception as e:
+            logger.error(f"error in scheduled reindexing {e}")
+
+
+def request_re_indexer() -> None:
+    """Queue a pass after the running one, which may already have crawled past the changed files"""
+    global reindex_request
+    if reindex_request is None or reindex_request.done():
+        reindex_request = asyncio.create_task(trigger_re_indexer(wait=True))
 
 
 @repeat_every(seconds=60*20)
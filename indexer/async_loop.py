@@ -1,5 +1,6 @@
 import os
 import uuid
+import socket
 import asyncio
 import logging
 from indexer import Indexer
@@ -9,6 +10,11 @@ logger = logging.getLogger(__name__)
 executor = ThreadPoolExecutor()
 
 CONTAINER_PATH = os.environ.get("CONTAINER_PATH")
+INDEX_CONCURRENCY = int(os.environ.get("INDEX_CONCURRENCY", 1))
+WORK_LEASE_SECONDS = int(os.environ.get("WORK_LEASE_SECONDS", 300))
+WORK_POLL_SECONDS = float(os.environ.get("WORK_POLL_SECONDS", 2))
+PUBLISH_BATCH_SIZE = 500
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
 AVAILABLE_EXTENSIONS = [".pdf", ".xls", "xlsx", ".doc", ".docx", ".txt", ".md", ".csv", ".ppt", ".pptx"]
 
 
@@ -31,33 +37,134 @@ async def crawl_loop(async_queue):
             existing_file_paths.append(path)
             async_queue.enqueue(message)
             logger.info(f"File enqueue: {path}")
-        aggregate_message = {
-            "existing_file_paths": existing_file_paths,
-            "type": "all_files"
-        }
-        async_queue.enqueue(aggregate_message)
-        async_queue.enqueue({"type": "stop"})
+    aggregate_message = {
+        "existing_file_paths": existing_file_paths,
+        "type": "all_files"
+    }
+    async_queue.enqueue(aggregate_message)
+    async_queue.enqueue({"type": "stop"})
 
 
 async def index_loop(async_queue, indexer: Indexer):
     loop = asyncio.get_running_loop()
-    logger.info("Starting index loop")
-    while True:
-        if async_queue.size() == 0:
-            logger.info("No files to index. Indexing stopped, all files indexed.")
-            await asyncio.sleep(1)
-            continue
-        message = await async_queue.dequeue()
-        logger.info(f"Processing message: {message}")
+    logger.info(f"Starting index loop with concurrency {INDEX_CONCURRENCY}")
+    slots = asyncio.Semaphore(INDEX_CONCURRENCY)
+    in_flight: set[asyncio.Task] = set()
+
+    async def process(message, handler):
+        try:
+            await loop.run_in_executor(executor, handler, message)
+        except Exception as e:
+            logger.error(f"Error in processing message: {e}")
+            logger.error(f"Failed to process message: {message}")
+
+    async def process_file(message):
         try:
+            await process(message, indexer.index)
+        finally:
+            slots.release()
+
+    bulk_load_checked = False
+    # only end the bulk load this loop began, another pass or an import may hold one too
+    bulk_loading = False
+    try:
+        while True:
+            if async_queue.size() == 0:
+                logger.info("No files to index. Indexing stopped, all files indexed.")
+                await asyncio.sleep(1)
+                continue
+            message = await async_queue.dequeue()
+            logger.info(f"Processing message: {message}")
             if message["type"] == "file":
-                await loop.run_in_executor(executor, indexer.index, message)
-            elif message["type"] == "all_files":
-                await loop.run_in_executor(executor, indexer.purge, message)
+                if not bulk_load_checked:
+                    # the crawler enqueues a whole pass before the first file is picked up
+                    bulk_load_checked = True
+                    pending = [message["path"]] + [m["path"] for m in async_queue.items() if m["type"] == "file"]
+                    bulk_loading = await loop.run_in_executor(executor, indexer.begin_bulk_load, pending)
+                await slots.acquire()
+                task = asyncio.create_task(process_file(message))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                continue
+            # purge and stop must only run once every file enqueued before them is indexed
+            if in_flight:
+                await asyncio.gather(*in_flight)
+            if bulk_loading:
+                bulk_loading = False
+                await loop.run_in_executor(executor, indexer.end_bulk_load)
+            bulk_load_checked = False
+            if message["type"] == "all_files":
+                await process(message, indexer.purge)
             elif message["type"] == "stop":
                 break
+    finally:
+        if bulk_loading:
+            # never leave a collection with indexing disabled, without waiting on shutdown
+            await loop.run_in_executor(executor, lambda: indexer.end_bulk_load(wait=False))
+
+
+async def publish_loop(async_queue, work_queue, indexer: Indexer):
+    """Crawler role: hand the crawled files to the worker replicas instead of indexing them"""
+    loop = asyncio.get_running_loop()
+    batch = []
+    while True:
+        message = await async_queue.dequeue()
+        if message["type"] == "file":
+            batch.append(message)
+            if len(batch) < PUBLISH_BATCH_SIZE:
+                continue
+        if batch:
+            published = await loop.run_in_executor(executor, work_queue.publish, batch)
+            logger.info(f"Published {published} of {len(batch)} crawled files to the work queue")
+            batch = []
+        if message["type"] == "all_files":
+            try:
+                removed = await loop.run_in_executor(executor, work_queue.retain, message["existing_file_paths"])
+                logger.info(f"Removed {removed} deleted files from the work queue")
+                await loop.run_in_executor(executor, indexer.purge, message)
+            except Exception as e:
+                logger.error(f"Error in purging deleted files: {e}")
+        elif message["type"] == "stop":
+            break
+
+
+async def work_loop(work_queue, indexer: Indexer):
+    """Worker role: claim files from the shared work queue under a lease and index them"""
+    loop = asyncio.get_running_loop()
+    logger.info(f"Starting worker {WORKER_ID} with concurrency {INDEX_CONCURRENCY}")
+    slots = asyncio.Semaphore(INDEX_CONCURRENCY)
+    in_flight: set[asyncio.Task] = set()
+
+    async def keep_leases():
+        while True:
+            await asyncio.sleep(WORK_LEASE_SECONDS / 3)
+            paths = [task.get_name() for task in in_flight]
+            if paths:
+                await loop.run_in_executor(executor, work_queue.renew, WORKER_ID, paths, WORK_LEASE_SECONDS)
+
+    async def process_item(item):
+        try:
+            await loop.run_in_executor(executor, indexer.index, item)
+            if not await loop.run_in_executor(executor, work_queue.complete, WORKER_ID, item):
+                logger.info(f"{item['path']} changed or lost its lease while indexing, leaving it to be claimed again")
         except Exception as e:
-            logger.error(f"Error in processing message: {e}")
-            logger.error(f"Failed to process message: {message}")
-        await asyncio.sleep(1)
+            logger.error(f"Error in indexing {item['path']}: {e}")
+            await loop.run_in_executor(executor, work_queue.fail, WORKER_ID, item, str(e))
+        finally:
+            slots.release()
 
+    lease_keeper = asyncio.create_task(keep_leases())
+    try:
+        while True:
+            free = INDEX_CONCURRENCY - len(in_flight)
+            items = await loop.run_in_executor(executor, work_queue.claim, WORKER_ID, free, WORK_LEASE_SECONDS) if free else []
+            if not items:
+                await asyncio.sleep(WORK_POLL_SECONDS)
+                continue
+            for item in items:
+                await slots.acquire()
+                task = asyncio.create_task(process_item(item), name=item["path"])
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+    finally:
+        lease_keeper.cancel()
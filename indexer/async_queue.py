@@ -33,6 +33,9 @@ class AsyncQueue:
 
         return result
 
+    def items(self):
+        return list(self._data)
+
     def size(self):
         result = len(self._data)
         return result
@@ -0,0 +1,146 @@
+import time
+import logging
+import threading
+from typing import Dict, List
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import CollectionStatus, OptimizersConfigDiff
+
+logger = logging.getLogger(__name__)
+
+# Qdrant's own default, used when a collection does not report its threshold
+DEFAULT_INDEXING_THRESHOLD = 10000
+# weight of the latest normal-mode write in the seconds-per-point baseline
+BASELINE_SMOOTHING = 0.2
+
+
+class BulkLoader:
+    """
+    Defers HNSW construction while a large batch of points is written
+
+    begin() sets indexing_threshold to 0 on the target collections, so Qdrant only appends
+    points to unindexed segments instead of growing the graph with every upsert. end()
+    restores the original threshold, waits for the optimizer to build the index once and
+    reports the time saved, estimated from the write cost measured outside bulk loads.
+
+    Loads are reference counted: a begin() while a load is running joins it, and only the
+    end() of the last participant restores the thresholds.
+    """
+
+    def __init__(self, client: QdrantClient, wait_seconds: float = 600, poll_seconds: float = 1):
+        self.client = client
+        self.wait_seconds = wait_seconds
+        self.poll_seconds = poll_seconds
+        self.lock = threading.Lock()
+        self.active = False
+        self.holders = 0
+        self.saved_thresholds: Dict[str, int] = {}
+        self.started_at = 0.0
+        self.bulk_points = 0
+        self.bulk_write_seconds = 0.0
+        self.baseline_seconds_per_point: float | None = None
+        self.last_report: Dict[str, any] | None = None
+
+    def record_write(self, points: int, seconds: float) -> None:
+        """Account for the time spent writing points, called for every processed file"""
+        if points <= 0:
+            return
+        with self.lock:
+            if self.active:
+                self.bulk_points += points
+                self.bulk_write_seconds += seconds
+                return
+            seconds_per_point = seconds / points
+            if self.baseline_seconds_per_point is None:
+                self.baseline_seconds_per_point = seconds_per_point
+            else:
+                self.baseline_seconds_per_point += BASELINE_SMOOTHING * (seconds_per_point - self.baseline_seconds_per_point)
+
+    def begin(self, collection_names: List[str]) -> bool:
+        """Start a bulk load or join the running one, every begin() needs its own end()"""
+        with self.lock:
+            self.holders += 1
+            joined = self.active
+            if not joined:
+                self.active = True
+                self.started_at = time.monotonic()
+                self.bulk_points = 0
+                self.bulk_write_seconds = 0.0
+        try:
+            for name in collection_names:
+                self.defer(name)
+        except Exception:
+            self.end(wait=False)
+            raise
+        logger.info(f"Bulk load {'joined' if joined else 'started'}, HNSW indexing deferred for {collection_names}")
+        return True
+
+    def defer(self, collection_name: str) -> None:
+        """Add a collection to the running bulk load, for loads that discover their collections as they go"""
+        if not self.active or collection_name in self.saved_thresholds:
+            return
+        threshold = self.client.get_collection(collection_name).config.optimizer_config.indexing_threshold
+        # 0 is what a load interrupted before its end() leaves behind, restoring it would disable HNSW for good
+        self.saved_thresholds[collection_name] = threshold or DEFAULT_INDEXING_THRESHOLD
+        self.client.update_collection(
+            collection_name=collection_name,
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=0)
+        )
+
+    def _wait_for_index(self, name: str) -> str:
+        deadline = time.monotonic() + self.wait_seconds
+        while True:
+            status = self.client.get_collection(name).status
+            if status == CollectionStatus.GREEN or time.monotonic() > deadline:
+                return str(status)
+            if status == CollectionStatus.GREY:
+                # pending optimizations only start on the next update, an empty one is enough
+                self.client.update_collection(collection_name=name, optimizers_config=OptimizersConfigDiff())
+            time.sleep(self.poll_seconds)
+
+    def end(self, wait: bool = True) -> Dict[str, any] | None:
+        """Leave the bulk load, the last participant restores the indexing thresholds, waits for the index and reports"""
+        with self.lock:
+            if not self.active:
+                return None
+            self.holders -= 1
+            if self.holders > 0:
+                logger.info(f"Left the bulk load, {self.holders} still loading")
+                return None
+        load_seconds = time.monotonic() - self.started_at
+        statuses = {}
+        optimize_start = time.monotonic()
+        try:
+            for name, threshold in self.saved_thresholds.items():
+                self.client.update_collection(
+                    collection_name=name,
+                    optimizers_config=OptimizersConfigDiff(indexing_threshold=threshold)
+                )
+            for name in self.saved_thresholds:
+                statuses[name] = self._wait_for_index(name) if wait else "not awaited"
+        finally:
+            optimize_seconds = time.monotonic() - optimize_start
+            with self.lock:
+                # a begin() that joined while the thresholds were restored has nothing left to end
+                self.active = False
+                self.holders = 0
+                collections = list(self.saved_thresholds)
+                self.saved_thresholds = {}
+
+        estimated_saved = None
+        if self.baseline_seconds_per_point is not None:
+            estimated_saved = round(
+                self.bulk_points * self.baseline_seconds_per_point - self.bulk_write_seconds - optimize_seconds, 2
+            )
+        self.last_report = {
+            "collections": collections,
+            "statuses": statuses,
+            "points": self.bulk_points,
+            "load_seconds": round(load_seconds, 2),
+            "write_seconds": round(self.bulk_write_seconds, 2),
+            "optimize_seconds": round(optimize_seconds, 2),
+            "baseline_seconds_per_point": self.baseline_seconds_per_point,
+            "estimated_seconds_saved": estimated_saved,
+        }
+        logger.info(f"Bulk load finished: {self.last_report}")
+        return self.last_report
@@ -0,0 +1,121 @@
+import json
+import zlib
+import uuid
+import logging
+from typing import Dict, List, Tuple
+from sqlalchemy import MetaData, delete
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from storage import share_sqlite
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+# values per IN clause, SQLite before 3.32 allows only 999 bound parameters
+QUERY_BATCH_SIZE = 500
+
+
+def _batches(values: list) -> List[list]:
+    return [values[start:start + QUERY_BATCH_SIZE] for start in range(0, len(values), QUERY_BATCH_SIZE)]
+
+
+class ChunkStoreModel(SQLModel):
+    """Own metadata so the chunk tables are not created in the MinimaStore database"""
+    metadata = MetaData()
+
+
+class ChunkBlock(ChunkStoreModel, table=True):
+    """Compressed JSON list of consecutive chunks of one file"""
+    block_id: str = Field(primary_key=True)
+    fpath: str = Field(index=True)
+    codec: str
+    data: bytes
+
+
+class ChunkRef(ChunkStoreModel, table=True):
+    """Location of a chunk (keyed by its Qdrant point ID) inside a block"""
+    id: str = Field(primary_key=True)
+    block_id: str = Field(index=True)
+    position: int
+
+
+class ChunkStore:
+    """
+    Keeps chunk text and metadata outside of Qdrant, compressed in blocks in SQLite
+
+    Chunks are grouped per file into blocks of block_size so the compressor sees enough
+    text to be effective, zstd is used when installed and zlib otherwise.
+    """
+
+    def __init__(self, path: str, block_size: int = 16, level: int = 3):
+        self.block_size = block_size
+        self.level = level
+        self.codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+        share_sqlite(self.engine)
+        ChunkStoreModel.metadata.create_all(self.engine)
+        logger.info(f"Chunk store at {path} using {self.codec} compression")
+
+    def _compress(self, raw: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            return zstandard.ZstdCompressor(level=self.level).compress(raw)
+        return zlib.compress(raw, self.level)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise RuntimeError("Chunk store block is zstd compressed but zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def put(self, fpath: str, chunks: List[Tuple[str, str, dict]]) -> None:
+        """Store (id, page_content, metadata) chunks of one file"""
+        with Session(self.engine) as session:
+            for start in range(0, len(chunks), self.block_size):
+                block = chunks[start:start + self.block_size]
+                block_id = str(uuid.uuid4())
+                raw = json.dumps([[content, metadata] for _, content, metadata in block]).encode()
+                session.add(ChunkBlock(block_id=block_id, fpath=fpath, codec=self.codec, data=self._compress(raw)))
+                for position, (chunk_id, _, _) in enumerate(block):
+                    session.add(ChunkRef(id=chunk_id, block_id=block_id, position=position))
+            session.commit()
+
+    def get(self, ids: List[str]) -> Dict[str, Tuple[str, dict]]:
+        """Hydrate chunks by ID, each block is decompressed once however many of its chunks are asked for"""
+        if not ids:
+            return {}
+        found = {}
+        with Session(self.engine) as session:
+            refs = [
+                ref for batch in _batches(list(ids))
+                for ref in session.exec(select(ChunkRef).where(ChunkRef.id.in_(batch)))
+            ]
+            block_ids = list({ref.block_id for ref in refs})
+            blocks = [
+                block for batch in _batches(block_ids)
+                for block in session.exec(select(ChunkBlock).where(ChunkBlock.block_id.in_(batch)))
+            ]
+            decoded = {block.block_id: json.loads(self._decompress(block.codec, block.data)) for block in blocks}
+            for ref in refs:
+                if ref.block_id in decoded:
+                    content, metadata = decoded[ref.block_id][ref.position]
+                    found[ref.id] = (content, metadata)
+        return found
+
+    def delete_files(self, fpaths: List[str]) -> None:
+        if not fpaths:
+            return
+        with Session(self.engine) as session:
+            for batch in _batches(list(fpaths)):
+                block_ids = list(session.exec(select(ChunkBlock.block_id).where(ChunkBlock.fpath.in_(batch))))
+                for block_batch in _batches(block_ids):
+                    session.execute(delete(ChunkRef).where(ChunkRef.block_id.in_(block_batch)))
+                    session.execute(delete(ChunkBlock).where(ChunkBlock.block_id.in_(block_batch)))
+            session.commit()
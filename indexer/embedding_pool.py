@@ -0,0 +1,208 @@
+import os
+import math
+import queue
+import atexit
+import logging
+import itertools
+import threading
+import multiprocessing as mp
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_worker(model_name, device, threads, cores, normalize, current_job, input_queue, output_queue):
+    """Runs in a spawned process: pins itself to its cores, loads the model once and encodes jobs"""
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device=device)
+    while True:
+        job = input_queue.get()
+        if job is None:
+            break
+        job_id, texts, batch_size = job
+        # shared memory, unlike a queued message it is visible to the pool even if this process dies now
+        current_job.value = job_id
+        try:
+            vectors = model.encode(
+                texts,
+                batch_size=batch_size,
+                normalize_embeddings=normalize,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+            output_queue.put((job_id, vectors.tolist(), None))
+        except Exception as e:
+            output_queue.put((job_id, None, repr(e)))
+        # done with the job, dying from here on must not fail its call
+        current_job.value = -1
+
+
+class _Call:
+    def __init__(self, jobs: int):
+        self.results = [None] * jobs
+        self.remaining = jobs
+        self.error = None
+        self.done = threading.Event()
+
+
+class EmbeddingPool(Embeddings):
+    """
+    Embeds documents with a pool of SentenceTransformer processes, one per group of cores
+
+    Every embed_documents call is split into chunks that are spread over the workers, and
+    concurrent callers share the pool. Queries stay on the in-process model, a single short
+    text is not worth the inter-process round trip. A worker that dies fails the calls of
+    the job it was encoding and is started again, up to max_restarts times.
+    """
+
+    def __init__(
+            self,
+            model_name: str,
+            query_embeddings: Embeddings,
+            workers: int,
+            threads_per_worker: int = 1,
+            chunk_size: int = 64,
+            batch_size: int = 32,
+            device: str = "cpu",
+            normalize: bool = False,
+            pin_threads: bool = True,
+            max_restarts: int = 5,
+    ):
+        self.query_embeddings = query_embeddings
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self._job_ids = itertools.count()
+        self._jobs: dict[int, tuple[_Call, int]] = {}
+        self._jobs_lock = threading.Lock()
+        self._closed = False
+
+        self._context = mp.get_context("spawn")
+        self._input_queue = self._context.Queue()
+        self._output_queue = self._context.Queue()
+
+        # the job each worker took last, a dead worker's job is failed instead of waited for
+        self._current_jobs = [self._context.Value("q", -1, lock=False) for _ in range(workers)]
+
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+        can_pin = pin_threads and len(cores) >= workers * threads_per_worker
+        self._worker_args = [
+            (model_name, device, threads_per_worker,
+             cores[i * threads_per_worker:(i + 1) * threads_per_worker] if can_pin else None,
+             normalize, self._current_jobs[i], self._input_queue, self._output_queue)
+            for i in range(workers)
+        ]
+        self._processes = [self._start_worker(i) for i in range(workers)]
+
+        self._collector = threading.Thread(target=self._collect, name="embedding-pool-collector", daemon=True)
+        self._collector.start()
+        atexit.register(self.close)
+        logger.info(
+            f"Started embedding pool with {workers} workers on {device}, {threads_per_worker} threads each, "
+            f"pinned to cores: {can_pin}"
+        )
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(target=_encode_worker, args=self._worker_args[index], daemon=True)
+        process.start()
+        return process
+
+    def _collect(self) -> None:
+        """Routes results from the workers back to the call that submitted the job"""
+        while not self._closed:
+            self._check_workers()
+            try:
+                job_id, vectors, error = self._output_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self._jobs_lock:
+                call, index = self._jobs.pop(job_id, (None, None))
+            if call is None:
+                continue
+            if error:
+                call.error = error
+            call.results[index] = vectors
+            call.remaining -= 1
+            if call.remaining == 0:
+                call.done.set()
+
+    def _check_workers(self) -> None:
+        for index, process in enumerate(self._processes):
+            if process.is_alive() or self._closed:
+                continue
+            reason = f"Embedding pool worker {index} died with exit code {process.exitcode}"
+            self._fail_job(self._current_jobs[index].value, reason)
+            if self.restarts >= self.max_restarts:
+                if not any(p.is_alive() for p in self._processes):
+                    self._fail_all("All embedding pool workers died")
+                continue
+            self.restarts += 1
+            logger.warning(f"Embedding pool worker {index} died, restarting it ({self.restarts}/{self.max_restarts})")
+            self._processes[index] = self._start_worker(index)
+
+    def _fail_job(self, job_id: int, reason: str) -> None:
+        """
+        Fails the call of the job a dead worker was encoding, with all of the call's jobs, so
+        their later results are dropped. Jobs of other calls are still queued.
+        """
+        with self._jobs_lock:
+            call, _ = self._jobs.get(job_id, (None, None))
+            if call is None:
+                return
+            for other_id in [other_id for other_id, (other, _) in self._jobs.items() if other is call]:
+                del self._jobs[other_id]
+        call.error = reason
+        call.done.set()
+
+    def _fail_all(self, reason: str) -> None:
+        with self._jobs_lock:
+            calls = {call for call, _ in self._jobs.values()}
+            self._jobs.clear()
+        for call in calls:
+            call.error = reason
+            call.done.set()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self._closed:
+            raise RuntimeError("Embedding pool is closed")
+        # Small inputs are still spread over all workers instead of landing on one
+        chunk_size = max(1, min(self.chunk_size, math.ceil(len(texts) / self.workers)))
+        chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        call = _Call(len(chunks))
+        with self._jobs_lock:
+            for index, chunk in enumerate(chunks):
+                job_id = next(self._job_ids)
+                self._jobs[job_id] = (call, index)
+                self._input_queue.put((job_id, chunk, self.batch_size))
+        call.done.wait()
+        if call.error:
+            raise RuntimeError(f"Embedding pool failed: {call.error}")
+        return [vector for chunk in call.results for vector in chunk]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.query_embeddings.embed_query(text)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._processes:
+            self._input_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
@@ -3,14 +3,19 @@ import uuid
 import torch
 import logging
 import time
+import threading
 from dataclasses import dataclass
 from typing import List, Dict
 from pathlib import Path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 from qdrant_client import QdrantClient
 from langchain_qdrant import QdrantVectorStore
 from langchain_huggingface import HuggingFaceEmbeddings
-from qdrant_client.http.models import Distance, VectorParams, Filter, FieldCondition, MatchValue
+from qdrant_client.http.models import (
+    Distance, VectorParams, Filter, FieldCondition, MatchAny, PointStruct, OptimizersConfigDiff
+)
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 from langchain_community.document_loaders import (
@@ -22,7 +27,16 @@ from langchain_community.document_loaders import (
     UnstructuredPowerPointLoader,
 )
 
+import tracing
+from bulk_load import BulkLoader, DEFAULT_INDEXING_THRESHOLD
+from chunk_store import ChunkStore
+from embedding_pool import EmbeddingPool
+from sharding import ShardRouter, SHARDING_NONE
+from search_results import decode_cursor, pack_hits
+from search_filters import FILTER_FIELDS, build_filter, file_metadata
+from search_params import resolve as resolve_search_settings, to_search_params
 from storage import MinimaStore, IndexingStatus
+from write_gate import WriteGate
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +69,32 @@ class Config:
     QDRANT_BOOTSTRAP = "qdrant"
     EMBEDDING_MODEL_ID = os.environ.get("EMBEDDING_MODEL_ID")
     EMBEDDING_SIZE = os.environ.get("EMBEDDING_SIZE")
+    # "0" keeps embedding in-process, "auto" starts one worker per EMBEDDING_THREADS_PER_WORKER cores
+    EMBEDDING_WORKERS = os.environ.get("EMBEDDING_WORKERS", "0")
+    EMBEDDING_THREADS_PER_WORKER = int(os.environ.get("EMBEDDING_THREADS_PER_WORKER", 1))
+    EMBEDDING_POOL_CHUNK_SIZE = int(os.environ.get("EMBEDDING_POOL_CHUNK_SIZE", 64))
+    EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+
+    SHARDING = os.environ.get("SHARDING", "none")
+    SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 8))
+    SHARD_SEARCH_WORKERS = int(os.environ.get("SHARD_SEARCH_WORKERS", 8))
+    SHARD_CACHE_SECONDS = 10
+    SEARCH_K = 4
+    SEARCH_PROFILE = os.environ.get("SEARCH_PROFILE", "interactive")
+    MAX_SEARCH_OFFSET = 500
+
+    CHUNK_STORE_ENABLED = os.environ.get("CHUNK_STORE_ENABLED", "false").lower() in ("1", "true", "yes")
+    CHUNK_STORE_PATH = os.environ.get("CHUNK_STORE_PATH", "/indexer/storage/chunks.db")
+    CHUNK_STORE_BLOCK_SIZE = int(os.environ.get("CHUNK_STORE_BLOCK_SIZE", 16))
+    # metadata that stays in the Qdrant payload when chunk text lives in the chunk store
+    CHUNK_STORE_PAYLOAD_FIELDS = ("file_path", "start_index", *FILTER_FIELDS)
     
+    BULK_LOAD_ENABLED = os.environ.get("BULK_LOAD_ENABLED", "true").lower() in ("1", "true", "yes")
+    # new files that make a crawl a bulk load, or that many when a target collection is empty
+    BULK_LOAD_MIN_FILES = int(os.environ.get("BULK_LOAD_MIN_FILES", 500))
+    BULK_LOAD_EMPTY_MIN_FILES = int(os.environ.get("BULK_LOAD_EMPTY_MIN_FILES", 50))
+    BULK_LOAD_WAIT_SECONDS = int(os.environ.get("BULK_LOAD_WAIT_SECONDS", 600))
+
     CHUNK_SIZE = 500
     CHUNK_OVERLAP = 200
 
@@ -64,7 +103,23 @@ class Indexer:
         self.config = Config()
         self.qdrant = self._initialize_qdrant()
         self.embed_model = self._initialize_embeddings()
-        self.document_store = self._setup_collection()
+        self.index_embed_model = self._initialize_index_embeddings()
+        self.router = ShardRouter(
+            base_collection=self.config.QDRANT_COLLECTION,
+            mode=self.config.SHARDING,
+            shard_count=self.config.SHARD_COUNT,
+            root=self.config.CONTAINER_PATH
+        )
+        self.stores: Dict[str, QdrantVectorStore] = {}
+        self.stores_lock = threading.Lock()
+        self.search_executor = ThreadPoolExecutor(max_workers=self.config.SHARD_SEARCH_WORKERS)
+        self._shards_cache: List[str] | None = None
+        self._shards_cached_at = 0.0
+        self.bulk_loader = BulkLoader(self.qdrant, wait_seconds=self.config.BULK_LOAD_WAIT_SECONDS)
+        if self.router.mode == SHARDING_NONE:
+            self._get_store(self.config.QDRANT_COLLECTION)
+        self.chunk_store = self._initialize_chunk_store()
+        self.write_gate = WriteGate()
         self.text_splitter = self._initialize_text_splitter()
 
     def _initialize_qdrant(self) -> QdrantClient:
@@ -77,32 +132,209 @@ class Indexer:
             encode_kwargs={'normalize_embeddings': False}
         )
 
+    def _embedding_workers(self) -> int:
+        workers = self.config.EMBEDDING_WORKERS
+        if workers == "auto":
+            # the cores this container may run on, not all of the host's
+            cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+            return max(1, cores // self.config.EMBEDDING_THREADS_PER_WORKER)
+        return int(workers)
+
+    def _initialize_index_embeddings(self):
+        """Embeddings used for indexing, a multi-process pool when EMBEDDING_WORKERS is set"""
+        workers = self._embedding_workers()
+        if workers <= 0:
+            return self.embed_model
+        return EmbeddingPool(
+            model_name=self.config.EMBEDDING_MODEL_ID,
+            query_embeddings=self.embed_model,
+            workers=workers,
+            threads_per_worker=self.config.EMBEDDING_THREADS_PER_WORKER,
+            chunk_size=self.config.EMBEDDING_POOL_CHUNK_SIZE,
+            batch_size=self.config.EMBEDDING_BATCH_SIZE,
+            device=str(self.config.DEVICE),
+        )
+
+    def _initialize_chunk_store(self) -> ChunkStore | None:
+        if not self.config.CHUNK_STORE_ENABLED:
+            return None
+        return ChunkStore(
+            path=self.config.CHUNK_STORE_PATH,
+            block_size=self.config.CHUNK_STORE_BLOCK_SIZE
+        )
+
     def _initialize_text_splitter(self) -> RecursiveCharacterTextSplitter:
         return RecursiveCharacterTextSplitter(
             chunk_size=self.config.CHUNK_SIZE,
-            chunk_overlap=self.config.CHUNK_OVERLAP
+            chunk_overlap=self.config.CHUNK_OVERLAP,
+            add_start_index=True
         )
 
-    def _setup_collection(self) -> QdrantVectorStore:
-        if not self.qdrant.collection_exists(self.config.QDRANT_COLLECTION):
+    def _setup_collection(self, collection_name: str) -> QdrantVectorStore:
+        if not self.qdrant.collection_exists(collection_name):
             self.qdrant.create_collection(
-                collection_name=self.config.QDRANT_COLLECTION,
+                collection_name=collection_name,
                 vectors_config=VectorParams(
                     size=self.config.EMBEDDING_SIZE,
                     distance=Distance.COSINE
                 ),
             )
+            self._shards_cache = None
+        elif not self.bulk_loader.active and self._indexing_disabled(collection_name):
+            # left behind by a bulk load that was interrupted before it restored the threshold
+            logger.warning(f"HNSW indexing is disabled on {collection_name}, restoring the default threshold")
+            self.qdrant.update_collection(
+                collection_name=collection_name,
+                optimizers_config=OptimizersConfigDiff(indexing_threshold=DEFAULT_INDEXING_THRESHOLD)
+            )
         self.qdrant.create_payload_index(
-            collection_name=self.config.QDRANT_COLLECTION,
-            field_name="fpath",
+            collection_name=collection_name,
+            field_name="metadata.file_path",
             field_schema="keyword"
         )
+        for field, schema in FILTER_FIELDS.items():
+            self.qdrant.create_payload_index(
+                collection_name=collection_name,
+                field_name=f"metadata.{field}",
+                field_schema=schema
+            )
         return QdrantVectorStore(
             client=self.qdrant,
-            collection_name=self.config.QDRANT_COLLECTION,
-            embedding=self.embed_model,
+            collection_name=collection_name,
+            embedding=self.index_embed_model,
         )
 
+    def _indexing_disabled(self, collection_name: str) -> bool:
+        return self.qdrant.get_collection(collection_name).config.optimizer_config.indexing_threshold == 0
+
+    def _get_store(self, collection_name: str) -> QdrantVectorStore:
+        with self.stores_lock:
+            if collection_name not in self.stores:
+                self.stores[collection_name] = self._setup_collection(collection_name)
+            return self.stores[collection_name]
+
+    def list_shards(self) -> List[str]:
+        """Names of all collections belonging to the index, cached for a few seconds"""
+        now = time.monotonic()
+        if self._shards_cache is None or now - self._shards_cached_at > self.config.SHARD_CACHE_SECONDS:
+            collections = self.qdrant.get_collections().collections
+            self._shards_cache = sorted(c.name for c in collections if self.router.is_shard(c.name))
+            self._shards_cached_at = now
+        return self._shards_cache
+
+    def search_roots(self) -> List[str]:
+        return [root for root in (self.config.CONTAINER_PATH, self.config.LOCAL_FILES_PATH) if root]
+
+    def searchable_shards(self, folder: str = None) -> List[str]:
+        shards = self.list_shards()
+        if folder:
+            folder = folder.replace(self.config.LOCAL_FILES_PATH or "", self.config.CONTAINER_PATH or "", 1)
+            scoped = self.router.shards_for_folder(folder)
+            if scoped is not None:
+                return [shard for shard in scoped if shard in shards]
+        return shards
+
+    def migrate_sharding(self) -> List[str]:
+        """
+        Drop the collections of a previous sharding layout, which would otherwise keep serving
+        stale hits, and return the files to re-index. Without a recorded layout, collections of
+        the base name that the current mode does not use are taken as leftovers.
+        """
+        layout = self.router.layout
+        previous = MinimaStore.sharding_layout()
+        if previous == layout:
+            return []
+        base = self.config.QDRANT_COLLECTION
+        names = [c.name for c in self.qdrant.get_collections().collections]
+        if previous is not None:
+            old_router = ShardRouter.from_layout(base, previous, self.config.CONTAINER_PATH)
+            leftovers = [name for name in names if old_router.is_shard(name)]
+        else:
+            leftovers = [
+                name for name in names
+                if (name == base or name.startswith(f"{base}_")) and not self.router.is_shard(name)
+            ]
+            if not leftovers:
+                MinimaStore.record_sharding_layout(layout)
+                return []
+
+        def drop_leftovers():
+            with self.stores_lock:
+                for name in leftovers:
+                    self.qdrant.delete_collection(name)
+                    self.stores.pop(name, None)
+                self._shards_cache = None
+            logger.info(f"Dropped collections of the previous sharding layout {previous}: {leftovers}")
+
+        return MinimaStore.change_sharding_layout(previous, layout, drop_leftovers)
+
+    def shard_info(self) -> List[Dict[str, any]]:
+        info = []
+        for name in self.list_shards():
+            collection = self.qdrant.get_collection(name)
+            info.append({
+                "name": name,
+                "points_count": collection.points_count,
+                "status": str(collection.status),
+            })
+        return info
+
+    def drop_shard(self, collection_name: str) -> List[str]:
+        """
+        Delete a shard collection and forget its files, so the next crawl indexes them again
+
+        Returns:
+            list: Paths of the files that were stored in the shard
+        """
+        if collection_name not in self.list_shards():
+            raise ValueError(f"Unknown shard: {collection_name}")
+        files = [fpath for fpath in MinimaStore.all_fpaths() if self.router.shard_for(fpath) == collection_name]
+        with self.stores_lock:
+            self.qdrant.delete_collection(collection_name)
+            self.stores.pop(collection_name, None)
+            self._shards_cache = None
+        MinimaStore.delete_m_docs(files)
+        if self.chunk_store is not None:
+            self.chunk_store.delete_files(files)
+        MinimaStore.bump_generation()
+        logger.info(f"Dropped shard {collection_name} with {len(files)} files")
+        return files
+
+    def begin_bulk_load(self, pending_paths: List[str]) -> bool:
+        """
+        Switch to bulk loading when the pending files are a large backlog of new files,
+        or a smaller one going into an empty collection
+
+        Returns:
+            bool: Whether a bulk load was started
+        """
+        if not self.config.BULK_LOAD_ENABLED:
+            return False
+        try:
+            indexed = set(MinimaStore.all_fpaths())
+            new_paths = [path for path in pending_paths if path not in indexed]
+            if len(new_paths) < min(self.config.BULK_LOAD_MIN_FILES, self.config.BULK_LOAD_EMPTY_MIN_FILES):
+                return False
+            collection_names = sorted({self.router.shard_for(path) for path in new_paths})
+            for name in collection_names:
+                self._get_store(name)
+            empty = any(self.qdrant.count(name, exact=True).count == 0 for name in collection_names)
+            if len(new_paths) < self.config.BULK_LOAD_MIN_FILES and not empty:
+                return False
+            logger.info(f"Bulk loading {len(new_paths)} new files, empty collection: {empty}")
+            return self.bulk_loader.begin(collection_names)
+        except Exception as e:
+            # begin() leaves the load again when it fails part way
+            logger.error(f"Failed to start bulk load: {str(e)}")
+            return False
+
+    def end_bulk_load(self, wait: bool = True) -> Dict[str, any] | None:
+        try:
+            return self.bulk_loader.end(wait=wait)
+        except Exception as e:
+            logger.error(f"Failed to finish bulk load: {str(e)}")
+            return None
+
     def _create_loader(self, file_path: str):
         file_extension = Path(file_path).suffix.lower()
         loader_class = self.config.EXTENSIONS_TO_LOADERS.get(file_extension)
@@ -113,104 +345,275 @@ class Indexer:
         return loader_class(file_path=file_path)
 
     def _process_file(self, loader) -> List[str]:
-        try:
+        with tracing.span("load_and_split", file_path=loader.file_path):
             documents = loader.load_and_split(self.text_splitter)
-            if not documents:
-                logger.warning(f"No documents loaded from {loader.file_path}")
-                return []
+        if not documents:
+            logger.warning(f"No documents loaded from {loader.file_path}")
+            return []
 
-            for doc in documents:
-                doc.metadata['file_path'] = loader.file_path
+        file_metadata_fields = file_metadata(loader.file_path, self.config.CONTAINER_PATH)
+        for doc in documents:
+            doc.metadata['file_path'] = loader.file_path
+            doc.metadata.update(file_metadata_fields)
 
-            uuids = [str(uuid.uuid4()) for _ in range(len(documents))]
-            ids = self.document_store.add_documents(documents=documents, ids=uuids)
-            
-            logger.info(f"Successfully processed {len(ids)} documents from {loader.file_path}")
-            return ids
-            
-        except Exception as e:
-            logger.error(f"Error processing file {loader.file_path}: {str(e)}")
-            return []
+        uuids = [str(uuid.uuid4()) for _ in range(len(documents))]
+        document_store = self._get_store(self.router.shard_for(loader.file_path))
+        with tracing.span("add_documents", chunks=len(documents)):
+            write_start = time.perf_counter()
+            if self.chunk_store is not None:
+                ids = self._add_with_chunk_store(document_store, loader.file_path, documents, uuids)
+            else:
+                ids = document_store.add_documents(documents=documents, ids=uuids)
+            self.bulk_loader.record_write(len(ids), time.perf_counter() - write_start)
+
+        logger.info(f"Successfully processed {len(ids)} documents from {loader.file_path}")
+        return ids
+
+    def _add_with_chunk_store(self, document_store: QdrantVectorStore, file_path: str, documents, ids: List[str]) -> List[str]:
+        """Chunk text goes to the chunk store, Qdrant only gets the vector and a minimal payload"""
+        vectors = self.index_embed_model.embed_documents([doc.page_content for doc in documents])
+        points = [
+            PointStruct(
+                id=chunk_id,
+                vector=vector,
+                payload={
+                    document_store.content_payload_key: "",
+                    document_store.metadata_payload_key: {
+                        key: doc.metadata[key]
+                        for key in self.config.CHUNK_STORE_PAYLOAD_FIELDS if key in doc.metadata
+                    },
+                },
+            )
+            for chunk_id, vector, doc in zip(ids, vectors, documents)
+        ]
+        self.qdrant.upsert(collection_name=document_store.collection_name, points=points, wait=True)
+        # after the upsert, so a failed upsert leaves no chunks behind that get_chunks would serve
+        try:
+            self.chunk_store.put(file_path, [
+                (chunk_id, doc.page_content, doc.metadata) for chunk_id, doc in zip(ids, documents)
+            ])
+        except Exception:
+            self.qdrant.delete(collection_name=document_store.collection_name, points_selector=ids, wait=True)
+            raise
+        return ids
+
+    def hydrate(self, documents: list) -> list:
+        """Fill in chunk text from the chunk store for points stored with a minimal payload"""
+        if self.chunk_store is None:
+            return documents
+        missing = [doc.metadata["_id"] for doc in documents if not doc.page_content and "_id" in doc.metadata]
+        stored = self.chunk_store.get([str(chunk_id) for chunk_id in missing])
+        for doc in documents:
+            chunk = stored.get(str(doc.metadata.get("_id")))
+            if chunk is not None:
+                doc.page_content = chunk[0]
+                doc.metadata = {**chunk[1], **doc.metadata}
+        return documents
+
+    def get_chunks(self, ids: List[str]) -> Dict[str, Dict[str, any]]:
+        if self.chunk_store is None:
+            return {}
+        return {
+            chunk_id: {"page_content": content, "metadata": metadata}
+            for chunk_id, (content, metadata) in self.chunk_store.get(ids).items()
+        }
 
     def index(self, message: Dict[str, any]) -> None:
-        start = time.time()
-        path, file_id, last_updated_seconds = message["path"], message["file_id"], message["last_updated_seconds"]
-        logger.info(f"Processing file: {path} (ID: {file_id})")
-        indexing_status: IndexingStatus = MinimaStore.check_needs_indexing(fpath=path, last_updated_seconds=last_updated_seconds)
-        if indexing_status != IndexingStatus.no_need_reindexing:
-            logger.info(f"Indexing needed for {path} with status: {indexing_status}")
-            try:
-                if indexing_status == IndexingStatus.need_reindexing:
-                    logger.info(f"Removing {path} from index storage for reindexing")
-                    self.remove_from_storage(files_to_remove=[path])
-                loader = self._create_loader(path)
-                ids = self._process_file(loader)
-                if ids:
-                    logger.info(f"Successfully indexed {path} with IDs: {ids}")
-            except Exception as e:
-                logger.error(f"Failed to index file {path}: {str(e)}")
-        else:
-            logger.info(f"Skipping {path}, no indexing required. timestamp didn't change")
-        end = time.time()
-        logger.info(f"Processing took {end - start} seconds for file {path}")
+        """
+        Index one file unless its modification time is already indexed
+
+        Raises when the file could not be indexed, after removing whatever part of it was
+        written. The file is only recorded in MinimaStore once it is fully indexed, so the
+        next crawl, or the next claimant of a work queue item, indexes it again.
+        """
+        with self.write_gate.writing(), tracing.span("index_file", path=message["path"]):
+            start = time.time()
+            path, file_id, last_updated_seconds = message["path"], message["file_id"], message["last_updated_seconds"]
+            logger.info(f"Processing file: {path} (ID: {file_id})")
+            indexing_status: IndexingStatus = MinimaStore.check_needs_indexing(fpath=path, last_updated_seconds=last_updated_seconds)
+            if indexing_status != IndexingStatus.no_need_reindexing:
+                logger.info(f"Indexing needed for {path} with status: {indexing_status}")
+                # a worker that died on an earlier attempt may have left part of the file behind
+                retried = message.get("attempts", 1) > 1
+                try:
+                    if indexing_status == IndexingStatus.need_reindexing or retried:
+                        logger.info(f"Removing {path} from index storage for reindexing")
+                        self.remove_from_storage(files_to_remove=[path])
+                    loader = self._create_loader(path)
+                    ids = self._process_file(loader)
+                    MinimaStore.record_indexed(path, last_updated_seconds)
+                    if ids:
+                        logger.info(f"Successfully indexed {path} with IDs: {ids}")
+                except Exception as e:
+                    logger.error(f"Failed to index file {path}: {str(e)}")
+                    try:
+                        self.remove_from_storage(files_to_remove=[path])
+                    except Exception as cleanup_error:
+                        logger.error(f"Failed to remove partially indexed file {path}: {str(cleanup_error)}")
+                    raise
+                finally:
+                    MinimaStore.bump_generation()
+            else:
+                logger.info(f"Skipping {path}, no indexing required. timestamp didn't change")
+            end = time.time()
+            logger.info(f"Processing took {end - start} seconds for file {path}")
 
     def purge(self, message: Dict[str, any]) -> None:
         existing_file_paths: list[str] = message["existing_file_paths"]
-        files_to_remove = MinimaStore.find_removed_files(existing_file_paths=set(existing_file_paths))
-        if len(files_to_remove) > 0:
-            logger.info(f"purge processing removing old files {files_to_remove}")
-            self.remove_from_storage(files_to_remove)
-        else:
-            logger.info("Nothing to purge")
+        with self.write_gate.writing():
+            files_to_remove = MinimaStore.find_removed_files(existing_file_paths=set(existing_file_paths))
+            if len(files_to_remove) > 0:
+                logger.info(f"purge processing removing old files {files_to_remove}")
+                self.remove_from_storage(files_to_remove)
+            else:
+                logger.info("Nothing to purge")
 
     def remove_from_storage(self, files_to_remove: list[str]):
-        filter_conditions = Filter(
-            must=[
-                FieldCondition(
-                    key="fpath",
-                    match=MatchValue(value=fpath)
-                )
-                for fpath in files_to_remove
-            ]
-        )
-        response = self.qdrant.delete(
-            collection_name=self.config.QDRANT_COLLECTION,
-            points_selector=filter_conditions,
-            wait=True
+        files_by_shard = defaultdict(list)
+        for fpath in files_to_remove:
+            files_by_shard[self.router.shard_for(fpath)].append(fpath)
+        existing_shards = self.list_shards()
+        for collection_name, fpaths in files_by_shard.items():
+            if collection_name not in existing_shards:
+                continue
+            filter_conditions = Filter(
+                must=[
+                    FieldCondition(
+                        key="metadata.file_path",
+                        match=MatchAny(any=fpaths)
+                    )
+                ]
+            )
+            response = self.qdrant.delete(
+                collection_name=collection_name,
+                points_selector=filter_conditions,
+                wait=True
+            )
+            logger.info(f"Delete response for {len(fpaths)} for files: {fpaths} in {collection_name} is: {response}")
+        if self.chunk_store is not None:
+            self.chunk_store.delete_files(files_to_remove)
+        MinimaStore.bump_generation()
+
+    def _search_shard(self, collection_name: str, embedding: List[float], k: int, mmr: Dict[str, any] = None, **search_kwargs):
+        store = self._get_store(collection_name)
+        if mmr is not None:
+            return store.max_marginal_relevance_search_with_score_by_vector(
+                embedding,
+                k=k,
+                fetch_k=max(mmr["fetch_k"], k),
+                lambda_mult=mmr["lambda_mult"],
+                **search_kwargs
+            )
+        return store.similarity_search_with_score_by_vector(embedding, k=k, **search_kwargs)
+
+    def _fan_out_search(self, collection_names: List[str], embedding: List[float], k: int, **search_kwargs):
+        """Search the shards in parallel and merge their hits into a single top-k by score"""
+        if len(collection_names) == 1:
+            return self._search_shard(collection_names[0], embedding, k, **search_kwargs)
+        futures = [
+            self.search_executor.submit(self._search_shard, name, embedding, k, **search_kwargs)
+            for name in collection_names
+        ]
+        hits = [hit for future in futures for hit in future.result()]
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+
+    def _to_hit(self, document, score: float) -> Dict[str, any]:
+        path = document.metadata["file_path"].replace(
+            self.config.CONTAINER_PATH,
+            self.config.LOCAL_FILES_PATH
         )
-        logger.info(f"Delete response for {len(files_to_remove)} for files: {files_to_remove} is: {response}")
+        return {
+            "text": document.page_content,
+            "score": round(score, 4),
+            "path": path,
+            "link": f"file://{path}",
+            "chunk_offset": document.metadata.get("start_index"),
+            "truncated": False,
+        }
 
-    def find(self, query: str) -> Dict[str, any]:
+    def find(
+            self,
+            query: str,
+            folder: str = None,
+            top_k: int = None,
+            score_threshold: float = None,
+            max_chars: int = None,
+            cursor: str = None,
+            filters: Dict[str, any] = None,
+            profile: str = None,
+            search: Dict[str, any] = None,
+    ) -> Dict[str, any]:
+        """
+        Search the index and return one page of ranked hits
+
+        Args:
+            query: Text to search for
+            folder: Restrict the search to files under this folder
+            top_k: Page size, Config.SEARCH_K by default
+            score_threshold: Drop hits scoring below this similarity
+            max_chars: Upper bound for the text of the whole page
+            cursor: next_cursor of the previous page
+            filters: Payload filters applied inside the vector search, see search_filters.build_filter
+            profile: Search profile providing the defaults, Config.SEARCH_PROFILE by default
+            search: Overrides of the profile (hnsw_ef, exact, rescore, oversampling, mmr, mmr_lambda, mmr_fetch_k)
+
+        Returns:
+            dict: hits (text, score, path, link, chunk_offset), unique links, the hits joined as
+                  output, next_cursor when more hits are available, and the effective search settings
+        """
         try:
             logger.info(f"Searching for: {query}")
-            found = self.document_store.search(query, search_type="similarity")
-            
+            top_k = top_k or self.config.SEARCH_K
+            offset = decode_cursor(cursor, self.config.MAX_SEARCH_OFFSET)
+            settings = resolve_search_settings(profile or self.config.SEARCH_PROFILE, search)
+            mmr = {"fetch_k": settings["mmr_fetch_k"], "lambda_mult": settings["mmr_lambda"]} if settings["mmr"] else None
+            filters = dict(filters or {})
+            if folder:
+                if filters.get("path_prefix") and filters["path_prefix"] != folder:
+                    raise ValueError("folder and filters.path_prefix must not both be set")
+                filters["path_prefix"] = folder
+            search_filter = build_filter(filters, self.search_roots())
+            collection_names = self.searchable_shards(filters.get("path_prefix"))
+            if not collection_names:
+                logger.info("No shards to search")
+                return {**pack_hits([], offset, False, max_chars), "search": settings}
+            with tracing.span("embed"):
+                embedding = self.embed_model.embed_query(query)
+            with tracing.span("qdrant.search", shards=len(collection_names), **settings) as attributes:
+                # one extra hit tells whether there is a next page
+                found = self._fan_out_search(
+                    collection_names,
+                    embedding,
+                    offset + top_k + 1,
+                    mmr=mmr,
+                    filter=search_filter,
+                    search_params=to_search_params(settings),
+                    score_threshold=score_threshold
+                )
+                attributes["hits"] = len(found)
+            has_more = len(found) > offset + top_k
+            found = found[offset:offset + top_k]
+            with tracing.span("hydrate"):
+                self.hydrate([item for item, _score in found])
+
             if not found:
                 logger.info("No results found")
-                return {"links": set(), "output": ""}
-
-            links = set()
-            results = []
-            
-            for item in found:
-                path = item.metadata["file_path"].replace(
-                    self.config.CONTAINER_PATH,
-                    self.config.LOCAL_FILES_PATH
-                )
-                links.add(f"file://{path}")
-                results.append(item.page_content)
-
-            output = {
-                "links": links,
-                "output": ". ".join(results)
-            }
-            
+
+            output = pack_hits([self._to_hit(item, score) for item, score in found], offset, has_more, max_chars)
+            output["search"] = settings
             logger.info(f"Found {len(found)} results")
             return output
-            
+
+        except ValueError as e:
+            logger.error(f"Invalid search request: {str(e)}")
+            return {"error": str(e)}
         except Exception as e:
             logger.error(f"Search failed: {str(e)}")
             return {"error": "Unable to find anything for the given query"}
 
     def embed(self, query: str):
-        return self.embed_model.embed_query(query)
\ No newline at end of file
+        return self.embed_model.embed_query(query)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_model.embed_documents(texts)
\ No newline at end of file
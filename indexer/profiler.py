@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/indexer/storage/profiles")
+
+
+class SamplingProfiler:
+    """Samples the stacks of all other threads at a fixed interval, output is in collapsed-stack format"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.is_set():
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+
+def _write_and_compare(profiler: SamplingProfiler, before, after, profile_path: str, snapshot_path: str) -> list:
+    with open(profile_path, "w") as f:
+        f.write(profiler.collapsed())
+    after.dump(snapshot_path)
+    return after.compare_to(before, "lineno")
+
+
+async def capture(seconds: float, interval: float = 0.01, top: int = 25) -> dict:
+    """
+    Profile the running process for a number of seconds without blocking it
+
+    Args:
+        seconds: Capture duration
+        interval: Stack sampling interval in seconds
+        top: Number of hottest stacks and allocation sites to return
+
+    Returns:
+        dict: Summary of the capture and the paths of the full profile files
+    """
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    started_tracemalloc = not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start(25)
+    # snapshots, dumps and comparisons take seconds on a large heap, they run off the event loop
+    before = await asyncio.to_thread(tracemalloc.take_snapshot)
+
+    profiler = SamplingProfiler(interval=interval)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(profiler.stop)
+        after = await asyncio.to_thread(tracemalloc.take_snapshot)
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracemalloc:
+            tracemalloc.stop()
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    profile_path = os.path.join(PROFILE_DIR, f"cpu-{stamp}.collapsed")
+    snapshot_path = os.path.join(PROFILE_DIR, f"tracemalloc-{stamp}.dump")
+    growth = await asyncio.to_thread(_write_and_compare, profiler, before, after, profile_path, snapshot_path)
+
+    total_samples = sum(profiler.samples.values())
+    logger.info(f"Profile captured: {total_samples} samples in {profile_path}, tracemalloc snapshot in {snapshot_path}")
+    return {
+        "seconds": seconds,
+        "samples": total_samples,
+        "cpu_profile": profile_path,
+        "tracemalloc_snapshot": snapshot_path,
+        "traced_memory_mb": round(current / 1024 / 1024, 2),
+        "traced_peak_mb": round(peak / 1024 / 1024, 2),
+        "top_stacks": [
+            {"stack": stack, "samples": count}
+            for stack, count in profiler.samples.most_common(top)
+        ],
+        "top_allocations": [
+            {"location": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "diff_kb": round(stat.size_diff / 1024, 1)}
+            for stat in growth[:top]
+        ],
+    }
@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, List
+
+from qdrant_client.http.models import Filter, FieldCondition, MatchAny, MatchValue, Range
+
+# Payload fields written for every chunk, with the Qdrant payload index schema of each
+FILTER_FIELDS = {
+    "extension": "keyword",
+    "path_prefixes": "keyword",
+    "mtime": "integer",
+    "size": "integer",
+}
+# bump when the payload fields change, files indexed with an older version are re-indexed
+PAYLOAD_SCHEMA_VERSION = 1
+
+
+def relative_path(path: str, roots: List[str]) -> str:
+    for root in roots:
+        if root and path.startswith(root):
+            path = path[len(root):]
+            break
+    return path.strip(os.sep)
+
+
+def file_metadata(path: str, root: str) -> Dict[str, any]:
+    """Filterable metadata of a file: extension, every folder prefix under the root, mtime and size"""
+    stat = os.stat(path)
+    folders = relative_path(path, [root]).split(os.sep)[:-1]
+    return {
+        "extension": Path(path).suffix.lower(),
+        "path_prefixes": [os.sep.join(folders[:i]) for i in range(1, len(folders) + 1)],
+        "mtime": round(stat.st_mtime),
+        "size": stat.st_size,
+    }
+
+
+def _timestamp(value) -> int:
+    if isinstance(value, datetime):
+        return round(value.timestamp())
+    return round(value)
+
+
+def build_filter(filters: Dict[str, any] | None, roots: List[str]) -> Filter | None:
+    """
+    Translate a search filter object into a Qdrant filter that runs inside the vector search
+
+    Supported keys, all optional and combined with AND:
+        extensions:      list of file extensions, e.g. [".pdf", ".md"]
+        path_prefix:     folder relative to the indexed root, or an absolute local/container path
+        modified_after:  datetime or epoch seconds
+        modified_before: datetime or epoch seconds
+        min_size:        bytes
+        max_size:        bytes
+    """
+    if not filters:
+        return None
+    conditions = []
+    extensions = filters.get("extensions")
+    if extensions:
+        normalized = [ext.lower() if ext.startswith(".") else f".{ext.lower()}" for ext in extensions]
+        conditions.append(FieldCondition(key="metadata.extension", match=MatchAny(any=normalized)))
+    path_prefix = filters.get("path_prefix")
+    if path_prefix:
+        prefix = relative_path(path_prefix, roots)
+        if prefix:
+            conditions.append(FieldCondition(key="metadata.path_prefixes", match=MatchValue(value=prefix)))
+    modified_after, modified_before = filters.get("modified_after"), filters.get("modified_before")
+    if modified_after is not None or modified_before is not None:
+        conditions.append(FieldCondition(
+            key="metadata.mtime",
+            range=Range(
+                gte=_timestamp(modified_after) if modified_after is not None else None,
+                lte=_timestamp(modified_before) if modified_before is not None else None,
+            ),
+        ))
+    min_size, max_size = filters.get("min_size"), filters.get("max_size")
+    if min_size is not None or max_size is not None:
+        conditions.append(FieldCondition(key="metadata.size", range=Range(gte=min_size, lte=max_size)))
+    return Filter(must=conditions) if conditions else None
@@ -0,0 +1,69 @@
+from typing import Dict
+
+from qdrant_client.http.models import SearchParams, QuantizationSearchParams
+
+PROFILE_INTERACTIVE = "interactive"
+PROFILE_BATCH = "batch"
+
+# Server-side defaults per caller profile, a request can override single values within BOUNDS
+SEARCH_PROFILES = {
+    # low p99 for people waiting on an answer
+    PROFILE_INTERACTIVE: {
+        "hnsw_ef": 64,
+        "exact": False,
+        "rescore": False,
+        "oversampling": 1.0,
+        "mmr": False,
+        "mmr_lambda": 0.5,
+        "mmr_fetch_k": 20,
+    },
+    # higher recall for offline callers that can wait
+    PROFILE_BATCH: {
+        "hnsw_ef": 256,
+        "exact": False,
+        "rescore": True,
+        "oversampling": 2.0,
+        "mmr": False,
+        "mmr_lambda": 0.5,
+        "mmr_fetch_k": 100,
+    },
+}
+
+BOUNDS = {
+    "hnsw_ef": (4, 1024),
+    "oversampling": (1.0, 8.0),
+    "mmr_lambda": (0.0, 1.0),
+    "mmr_fetch_k": (1, 500),
+}
+
+
+def resolve(profile: str, overrides: Dict[str, any] | None = None) -> Dict[str, any]:
+    """Effective search settings: the profile defaults, then the overrides, clamped to BOUNDS"""
+    if profile not in SEARCH_PROFILES:
+        raise ValueError(f"Unknown search profile: {profile}, expected one of {tuple(SEARCH_PROFILES)}")
+    settings = dict(SEARCH_PROFILES[profile])
+    for key, value in (overrides or {}).items():
+        if key not in settings:
+            raise ValueError(f"Unknown search parameter: {key}")
+        if value is not None:
+            settings[key] = value
+    for key, (low, high) in BOUNDS.items():
+        settings[key] = min(max(settings[key], low), high)
+    return settings
+
+
+def to_search_params(settings: Dict[str, any]) -> SearchParams:
+    """
+    Qdrant search parameters for the settings
+
+    rescore and oversampling only take effect on collections with quantization enabled,
+    Qdrant ignores them otherwise.
+    """
+    return SearchParams(
+        hnsw_ef=settings["hnsw_ef"],
+        exact=settings["exact"],
+        quantization=QuantizationSearchParams(
+            rescore=settings["rescore"],
+            oversampling=settings["oversampling"],
+        ),
+    )
@@ -0,0 +1,52 @@
+import json
+import base64
+import binascii
+from typing import Dict, List
+
+# A hit is only truncated when at least this much of it fits, otherwise it goes to the next page
+MIN_SNIPPET_CHARS = 80
+ELLIPSIS = "…"
+
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+
+def decode_cursor(cursor: str | None, max_offset: int) -> int:
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if offset < 0 or offset > max_offset:
+        raise ValueError(f"Cursor offset {offset} is out of range")
+    return offset
+
+
+def pack_hits(hits: List[Dict[str, any]], offset: int, has_more: bool, max_chars: int | None) -> Dict[str, any]:
+    """
+    Bound the page to max_chars of text, in rank order
+
+    The hit that crosses the budget is cut with an ellipsis, or moved to the next page
+    when too little of it would fit. The cursor then points at the first hit left out.
+    """
+    packed = []
+    remaining = max_chars
+    for hit in hits:
+        if remaining is not None:
+            if len(hit["text"]) > remaining:
+                if remaining < MIN_SNIPPET_CHARS and packed:
+                    break
+                hit = {**hit, "text": hit["text"][:remaining - len(ELLIPSIS)] + ELLIPSIS, "truncated": True}
+            remaining -= len(hit["text"])
+        packed.append(hit)
+
+    next_offset = offset + len(packed)
+    links = list(dict.fromkeys(hit["link"] for hit in packed))
+    return {
+        "hits": packed,
+        "links": links,
+        "output": ". ".join(hit["text"] for hit in packed),
+        "next_cursor": encode_cursor(next_offset) if has_more or len(packed) < len(hits) else None,
+    }
@@ -0,0 +1,79 @@
+import os
+import re
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHARDING_NONE = "none"
+SHARDING_FOLDER = "folder"
+SHARDING_HASH = "hash"
+SHARDING_MODES = (SHARDING_NONE, SHARDING_FOLDER, SHARDING_HASH)
+
+ROOT_SHARD = "_root"
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_-]", "_", name)
+
+
+class ShardRouter:
+    """
+    Maps file paths to Qdrant collections
+
+    none:   everything lives in the base collection, as before sharding existed
+    folder: one collection per top-level folder under the indexed root, files in the root itself share one
+    hash:   a stable hash of the path relative to the root picks one of shard_count collections
+    """
+
+    def __init__(self, base_collection: str, mode: str, shard_count: int, root: str):
+        if mode not in SHARDING_MODES:
+            raise ValueError(f"Unsupported sharding mode: {mode}, expected one of {SHARDING_MODES}")
+        self.base_collection = base_collection
+        self.mode = mode
+        self.shard_count = max(1, shard_count)
+        self.root = root or ""
+
+    def _relative(self, path: str) -> str:
+        if self.root and path.startswith(self.root):
+            path = path[len(self.root):]
+        return path.strip(os.sep)
+
+    def shard_for(self, path: str) -> str:
+        if self.mode == SHARDING_NONE:
+            return self.base_collection
+        relative = self._relative(path)
+        if self.mode == SHARDING_FOLDER:
+            parts = relative.split(os.sep)
+            folder = parts[0] if len(parts) > 1 else ROOT_SHARD
+            return f"{self.base_collection}_{_slug(folder)}"
+        digest = hashlib.md5(relative.encode()).hexdigest()
+        return f"{self.base_collection}_{int(digest, 16) % self.shard_count:03d}"
+
+    def shards_for_folder(self, folder: str) -> list[str] | None:
+        """Collections that can hold files under folder, None when every shard has to be searched"""
+        if self.mode != SHARDING_FOLDER:
+            return None
+        relative = self._relative(folder)
+        if not relative:
+            return None
+        return [f"{self.base_collection}_{_slug(relative.split(os.sep)[0])}"]
+
+    def is_shard(self, collection: str) -> bool:
+        """Whether the collection belongs to this mode, collections left by another mode are not searched"""
+        if self.mode == SHARDING_NONE:
+            return collection == self.base_collection
+        if self.mode == SHARDING_HASH:
+            match = re.fullmatch(rf"{re.escape(self.base_collection)}_(\d{{3}})", collection)
+            return match is not None and int(match.group(1)) < self.shard_count
+        return collection.startswith(f"{self.base_collection}_")
+
+    @property
+    def layout(self) -> str:
+        """Mode and shard count, files have to be re-indexed when this changes"""
+        return f"{self.mode}:{self.shard_count}" if self.mode == SHARDING_HASH else self.mode
+
+    @classmethod
+    def from_layout(cls, base_collection: str, layout: str, root: str) -> "ShardRouter":
+        mode, _, shard_count = layout.partition(":")
+        return cls(base_collection, mode, int(shard_count or 1), root)
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Portable index snapshots: vectors, payloads, chunk text and MinimaStore state in one stream
+Usage: python snapshot.py export /indexer/storage/snapshots/node.jsonl.gz
+       python snapshot.py import node.jsonl.gz --remap /old/root=/usr/src/app/local_files
+"""
+
+import os
+import gzip
+import json
+import time
+import base64
+import logging
+import argparse
+from collections import defaultdict
+from typing import Dict, List, Set
+
+import numpy as np
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client.http.models import PointStruct
+
+from storage import MinimaStore, MinimaDoc
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "minima-snapshot"
+VERSION = 1
+SCROLL_BATCH = 256
+UPSERT_BATCH = 256
+DOC_BATCH = 500
+
+
+def encode_vector(vector: List[float]) -> str:
+    return base64.b64encode(np.asarray(vector, dtype="<f4").tobytes()).decode()
+
+
+def decode_vector(data: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(data), dtype="<f4").tolist()
+
+
+def remap_path(path: str, remap: Dict[str, str]) -> str:
+    """Replace the longest matching prefix"""
+    for old in sorted(remap, key=len, reverse=True):
+        if path.startswith(old):
+            return remap[old] + path[len(old):]
+    return path
+
+
+def _write(out, record: Dict[str, any]) -> None:
+    out.write(json.dumps(record, separators=(",", ":")))
+    out.write("\n")
+
+
+def export_snapshot(indexer, path: str, overwrite: bool = False) -> Dict[str, any]:
+    """
+    Write a gzip compressed JSON lines snapshot of the whole index
+
+    Records come in order: one header, MinimaStore docs, points, one footer. Indexing is
+    paused while the snapshot is written so all records describe the same state. Points
+    stored with a minimal payload carry their chunk from the chunk store inline, so the
+    snapshot can be imported whether or not the target node uses a chunk store. An existing
+    snapshot at path is only replaced with overwrite.
+    """
+    if not overwrite and os.path.exists(path):
+        raise FileExistsError(f"Snapshot {path} already exists")
+    start = time.time()
+    docs = points = 0
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with indexer.write_gate.exclusive(), gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+        indexer._shards_cache = None
+        collection_names = indexer.list_shards()
+        _write(out, {
+            "type": "header",
+            "format": FORMAT,
+            "version": VERSION,
+            "embedding_model_id": indexer.config.EMBEDDING_MODEL_ID,
+            "embedding_size": int(indexer.config.EMBEDDING_SIZE),
+            "container_path": indexer.config.CONTAINER_PATH,
+            "collections": collection_names,
+            "created_at": start,
+        })
+        for doc in MinimaStore.all_docs():
+            _write(out, {"type": "doc", "fpath": doc.fpath, "last_updated_seconds": doc.last_updated_seconds})
+            docs += 1
+        content_key = QdrantVectorStore.CONTENT_KEY
+        for collection_name in collection_names:
+            offset = None
+            while True:
+                batch, offset = indexer.qdrant.scroll(
+                    collection_name=collection_name,
+                    limit=SCROLL_BATCH,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True
+                )
+                chunks = indexer.get_chunks([str(point.id) for point in batch if not point.payload.get(content_key)])
+                for point in batch:
+                    record = {
+                        "type": "point",
+                        "id": str(point.id),
+                        "vector": encode_vector(point.vector),
+                        "payload": point.payload,
+                    }
+                    if str(point.id) in chunks:
+                        record["chunk"] = chunks[str(point.id)]
+                    _write(out, record)
+                    points += 1
+                if offset is None:
+                    break
+        _write(out, {"type": "footer", "docs": docs, "points": points})
+    os.replace(tmp_path, path)
+    stats = {
+        "path": path,
+        "docs": docs,
+        "points": points,
+        "bytes": os.path.getsize(path),
+        "seconds": round(time.time() - start, 2),
+    }
+    logger.info(f"Snapshot exported: {stats}")
+    return stats
+
+
+class _Importer:
+    """
+    Batches snapshot records into chunk store blocks and Qdrant upserts
+
+    MinimaStore rows are only written by commit(), once every point is in, so a file is never
+    recorded as indexed without its vectors. This node's own copy of a replaced file is
+    removed right before the snapshot's points for it are written.
+    """
+
+    def __init__(self, indexer, remap: Dict[str, str]):
+        self.indexer = indexer
+        self.remap = remap
+        self.indexed = set(MinimaStore.all_fpaths())
+        self.docs: Dict[str, int] = {}
+        self.points: Dict[str, List[PointStruct]] = defaultdict(list)
+        self.chunks: Dict[str, List[tuple]] = defaultdict(list)
+        self.batch_files: Set[str] = set()
+        self.written_files: Set[str] = set()
+        self.removed: Set[str] = set()
+        self.pending_points = 0
+        self.docs_read = 0
+        self.docs_imported = 0
+        self.points_imported = 0
+
+    def add_doc(self, record: Dict[str, any]) -> None:
+        self.docs[remap_path(record["fpath"], self.remap)] = record["last_updated_seconds"]
+        self.docs_read += 1
+
+    def _remove_replaced(self, fpaths) -> None:
+        replaced = [fpath for fpath in fpaths if fpath in self.indexed and fpath not in self.removed]
+        if replaced:
+            # the snapshot wins over what this node indexed for the same files
+            self.indexer.remove_from_storage(replaced)
+            self.removed.update(replaced)
+
+    def add_point(self, record: Dict[str, any]) -> None:
+        payload = record["payload"]
+        content_key, metadata_key = QdrantVectorStore.CONTENT_KEY, QdrantVectorStore.METADATA_KEY
+        content = payload.get(content_key) or ""
+        metadata = dict(payload.get(metadata_key) or {})
+        chunk = record.get("chunk")
+        if chunk is not None:
+            content = chunk["page_content"]
+            metadata = {**chunk["metadata"], **metadata}
+        metadata["file_path"] = remap_path(metadata["file_path"], self.remap)
+
+        collection_name = self.indexer.router.shard_for(metadata["file_path"])
+        self.indexer._get_store(collection_name)
+        self.indexer.bulk_loader.defer(collection_name)
+        if self.indexer.chunk_store is not None:
+            self.chunks[metadata["file_path"]].append((record["id"], content, metadata))
+            fields = self.indexer.config.CHUNK_STORE_PAYLOAD_FIELDS
+            payload = {content_key: "", metadata_key: {key: metadata[key] for key in fields if key in metadata}}
+        else:
+            payload = {content_key: content, metadata_key: metadata}
+        self.points[collection_name].append(
+            PointStruct(id=record["id"], vector=decode_vector(record["vector"]), payload=payload)
+        )
+        self.batch_files.add(metadata["file_path"])
+        self.pending_points += 1
+        if self.pending_points >= UPSERT_BATCH:
+            self.flush_points()
+
+    def flush_points(self) -> None:
+        self._remove_replaced(self.batch_files)
+        # before the upsert, so a rollback also finds a batch that was only partly written
+        self.written_files.update(self.batch_files)
+        for collection_name, points in self.points.items():
+            write_start = time.perf_counter()
+            self.indexer.qdrant.upsert(collection_name=collection_name, points=points, wait=True)
+            self.indexer.bulk_loader.record_write(len(points), time.perf_counter() - write_start)
+            self.points_imported += len(points)
+        for fpath, chunks in self.chunks.items():
+            self.indexer.chunk_store.put(fpath, chunks)
+        self.chunks = defaultdict(list)
+        self.points = defaultdict(list)
+        self.batch_files = set()
+        self.pending_points = 0
+
+    def commit(self) -> None:
+        """Record the snapshot's files as indexed, replaced files without points are removed first"""
+        self._remove_replaced(self.docs)
+        docs = [MinimaDoc(fpath=fpath, last_updated_seconds=seconds) for fpath, seconds in self.docs.items()]
+        for start in range(0, len(docs), DOC_BATCH):
+            MinimaStore.upsert_m_docs(docs[start:start + DOC_BATCH])
+        self.docs_imported = len(docs)
+
+    def rollback(self) -> None:
+        """Remove the imported points, and forget the replaced files so the next crawl indexes them again"""
+        self.indexer.remove_from_storage(list(self.written_files))
+        MinimaStore.delete_m_docs(list(self.removed))
+
+    @property
+    def docs_replaced(self) -> int:
+        return len(self.removed)
+
+
+def import_snapshot(indexer, path: str, remap: Dict[str, str] = None, force: bool = False) -> Dict[str, any]:
+    """
+    Load a snapshot into this node without re-embedding
+
+    Paths are rewritten with remap (old prefix to new prefix), by default from the snapshot's
+    container path to this node's. Points are routed to this node's shards, and HNSW
+    construction is deferred until all of them are written. The files are only recorded as
+    indexed once the footer confirms the snapshot is complete; a truncated or inconsistent
+    snapshot raises and its points are removed again.
+    """
+    start = time.time()
+    with gzip.open(path, "rt", encoding="utf-8") as snapshot:
+        header = json.loads(next(snapshot))
+        if header.get("type") != "header" or header.get("format") != FORMAT:
+            raise ValueError(f"{path} is not a Minima snapshot")
+        if header["version"] > VERSION:
+            raise ValueError(f"Snapshot version {header['version']} is newer than supported version {VERSION}")
+        if not force and (
+                header["embedding_model_id"] != indexer.config.EMBEDDING_MODEL_ID
+                or header["embedding_size"] != int(indexer.config.EMBEDDING_SIZE)
+        ):
+            raise ValueError(
+                f"Snapshot was embedded with {header['embedding_model_id']} ({header['embedding_size']}), "
+                f"this node uses {indexer.config.EMBEDDING_MODEL_ID} ({indexer.config.EMBEDDING_SIZE})"
+            )
+        if remap is None:
+            remap = {}
+            if header.get("container_path") and indexer.config.CONTAINER_PATH:
+                remap[header["container_path"]] = indexer.config.CONTAINER_PATH
+
+        importer = _Importer(indexer, remap)
+        footer = None
+        bulk_load = indexer.bulk_loader.begin([])
+        try:
+            with indexer.write_gate.writing():
+                try:
+                    for line in snapshot:
+                        record = json.loads(line)
+                        if record["type"] == "doc":
+                            importer.add_doc(record)
+                        elif record["type"] == "point":
+                            importer.add_point(record)
+                        elif record["type"] == "footer":
+                            footer = record
+                    importer.flush_points()
+                    if footer is None:
+                        raise ValueError(f"Snapshot {path} has no footer, it is truncated")
+                    if (footer["docs"], footer["points"]) != (importer.docs_read, importer.points_imported):
+                        raise ValueError(f"Snapshot {path} footer does not match the imported records: {footer}")
+                    importer.commit()
+                except Exception as e:
+                    logger.error(f"Snapshot import failed, rolling back: {e}")
+                    try:
+                        importer.rollback()
+                    except Exception as rollback_error:
+                        logger.error(f"Failed to roll back the snapshot import: {rollback_error}")
+                    raise
+        finally:
+            MinimaStore.bump_generation()
+            report = indexer.end_bulk_load() if bulk_load else None
+
+    stats = {
+        "path": path,
+        "docs": importer.docs_imported,
+        "docs_replaced": importer.docs_replaced,
+        "points": importer.points_imported,
+        "remap": remap,
+        "bulk_load": report,
+        "seconds": round(time.time() - start, 2),
+    }
+    logger.info(f"Snapshot imported: {stats}")
+    return stats
+
+
+def parse_remap(values: List[str]) -> Dict[str, str] | None:
+    if not values:
+        return None
+    remap = {}
+    for value in values:
+        old, sep, new = value.partition("=")
+        if not sep:
+            raise ValueError(f"Invalid remap {value}, expected OLD=NEW")
+        remap[old] = new
+    return remap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a Minima index snapshot")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write a snapshot of this node's index")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--overwrite", action="store_true", help="Replace an existing snapshot at PATH")
+    import_parser = commands.add_parser("import", help="Load a snapshot into this node's index")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--remap", action="append", help="OLD=NEW path prefix, repeatable")
+    import_parser.add_argument("--force", action="store_true", help="Import even if the embedding model differs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from indexer import Indexer
+    MinimaStore.create_db_and_tables()
+    indexer = Indexer()
+    if args.command == "export":
+        print(json.dumps(export_snapshot(indexer, args.path, args.overwrite), indent=2))
+    else:
+        print(json.dumps(import_snapshot(indexer, args.path, parse_remap(args.remap), args.force), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
+import os
 import logging
+from typing import Callable
+from sqlalchemy import event, text
 from sqlmodel import Field, Session, SQLModel, create_engine, select
 
 from singleton import Singleton
@@ -18,16 +21,45 @@ class MinimaDoc(SQLModel, table=True):
     last_updated_seconds: int | None = Field(default=None, index=True)
 
 
+class IndexGeneration(SQLModel, table=True):
+    """Single row counter, bumped whenever the indexed content changes"""
+    id: int = Field(default=1, primary_key=True)
+    generation: int = 0
+
+
+class PayloadSchema(SQLModel, table=True):
+    """Single row, version of the payload fields the indexed chunks were written with"""
+    id: int = Field(default=1, primary_key=True)
+    version: int = 0
+
+
+class IndexLayout(SQLModel, table=True):
+    """Single row, the sharding layout the indexed files were routed with"""
+    id: int = Field(default=1, primary_key=True)
+    sharding: str
+
+
 class MinimaDocUpdate(SQLModel):
     fpath: str | None = None
     last_updated_seconds: int | None = None
 
 
-sqlite_file_name = "/indexer/storage/database.db"
+sqlite_file_name = os.environ.get("DATABASE_PATH", "/indexer/storage/database.db")
 sqlite_url = f"sqlite:///{sqlite_file_name}"
 
-connect_args = {"check_same_thread": False}
+
+
+def share_sqlite(engine) -> None:
+    """Let the crawler and worker replicas use one SQLite file: WAL, and wait on locks instead of failing"""
+    def configure(connection, _record):
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA busy_timeout=30000")
+    event.listen(engine, "connect", configure)
+
+
+connect_args = {"check_same_thread": False, "timeout": 30}
 engine = create_engine(sqlite_url, connect_args=connect_args)
+share_sqlite(engine)
 
 
 class MinimaStore(metaclass=Singleton):
@@ -46,6 +78,117 @@ class MinimaStore(metaclass=Singleton):
             session.commit()
             print("doc deleted:", doc)
 
+    @staticmethod
+    def delete_m_docs(fpaths: list[str]) -> None:
+        if not fpaths:
+            return
+        with Session(engine) as session:
+            # batches stay below the 999 bound parameters of older SQLite versions
+            for start in range(0, len(fpaths), 500):
+                statement = select(MinimaDoc).where(MinimaDoc.fpath.in_(fpaths[start:start + 500]))
+                for doc in session.exec(statement):
+                    session.delete(doc)
+            session.commit()
+
+    @staticmethod
+    def all_fpaths() -> list[str]:
+        with Session(engine) as session:
+            return list(session.exec(select(MinimaDoc.fpath)))
+
+    @staticmethod
+    def all_docs() -> list[MinimaDoc]:
+        with Session(engine) as session:
+            return list(session.exec(select(MinimaDoc)))
+
+    @staticmethod
+    def upsert_m_docs(docs: list[MinimaDoc]) -> None:
+        with Session(engine) as session:
+            for doc in docs:
+                session.merge(doc)
+            session.commit()
+
+    @staticmethod
+    def generation() -> int:
+        with Session(engine) as session:
+            row = session.get(IndexGeneration, 1)
+            return row.generation if row is not None else 0
+
+    @staticmethod
+    def bump_generation() -> None:
+        # a single statement pair so crawler and worker processes sharing the file never lose a bump
+        with Session(engine) as session:
+            session.execute(text("INSERT OR IGNORE INTO indexgeneration (id, generation) VALUES (1, 0)"))
+            session.execute(text("UPDATE indexgeneration SET generation = generation + 1 WHERE id = 1"))
+            session.commit()
+
+    @staticmethod
+    def migrate_payload_schema(version: int) -> list[str]:
+        """
+        Mark every file stale when the indexed payload is older than version, so the next
+        crawl re-indexes them with the current fields
+
+        Returns:
+            list: Paths of the files marked stale, empty when the schema was already current
+        """
+        with Session(engine) as session:
+            session.execute(text("INSERT OR IGNORE INTO payloadschema (id, version) VALUES (1, 0)"))
+            # conditional, so only one of the processes sharing the file migrates
+            result = session.execute(
+                text("UPDATE payloadschema SET version = :version WHERE id = 1 AND version < :version"),
+                {"version": version}
+            )
+            if result.rowcount != 1:
+                session.commit()
+                return []
+            fpaths = list(session.exec(select(MinimaDoc.fpath)))
+            session.execute(text("UPDATE minimadoc SET last_updated_seconds = 0"))
+            session.commit()
+        logger.info(f"Payload schema upgraded to version {version}, {len(fpaths)} files will be re-indexed")
+        return fpaths
+
+    @staticmethod
+    def sharding_layout() -> str | None:
+        with Session(engine) as session:
+            row = session.get(IndexLayout, 1)
+            return row.sharding if row is not None else None
+
+    @staticmethod
+    def record_sharding_layout(layout: str) -> None:
+        with Session(engine) as session:
+            session.execute(text("INSERT OR IGNORE INTO indexlayout (id, sharding) VALUES (1, :layout)"), {"layout": layout})
+            session.commit()
+
+    @staticmethod
+    def change_sharding_layout(previous: str | None, layout: str, on_change: Callable[[], None]) -> list[str]:
+        """
+        Record a new sharding layout and mark every file stale, so the next crawl re-indexes
+        it into the new collections. on_change runs before the commit, the change is only
+        recorded once it succeeded.
+
+        Returns:
+            list: Paths of the files marked stale, empty when another process changed the layout first
+        """
+        with Session(engine) as session:
+            if previous is None:
+                result = session.execute(
+                    text("INSERT OR IGNORE INTO indexlayout (id, sharding) VALUES (1, :layout)"),
+                    {"layout": layout}
+                )
+            else:
+                result = session.execute(
+                    text("UPDATE indexlayout SET sharding = :layout WHERE id = 1 AND sharding = :previous"),
+                    {"layout": layout, "previous": previous}
+                )
+            if result.rowcount != 1:
+                session.rollback()
+                return []
+            fpaths = list(session.exec(select(MinimaDoc.fpath)))
+            session.execute(text("UPDATE minimadoc SET last_updated_seconds = 0"))
+            on_change()
+            session.commit()
+        logger.info(f"Sharding layout changed from {previous} to {layout}, {len(fpaths)} files will be re-indexed")
+        return fpaths
+
     @staticmethod
     def select_m_doc(fpath: str) -> MinimaDoc:
         with Session(engine) as session:
@@ -73,33 +216,27 @@ class MinimaStore(metaclass=Singleton):
 
     @staticmethod
     def check_needs_indexing(fpath: str, last_updated_seconds: int) -> IndexingStatus:
-        indexing_status: IndexingStatus = IndexingStatus.no_need_reindexing
-        try:
-            with Session(engine) as session:
-                statement = select(MinimaDoc).where(MinimaDoc.fpath == fpath)
-                results = session.exec(statement)
-                doc = results.first()
-                if doc is not None:
-                    logger.debug(
-                        f"file {fpath} new last updated={last_updated_seconds} old last updated: {doc.last_updated_seconds}"
-                    )
-                    if doc.last_updated_seconds < last_updated_seconds:
-                        indexing_status = IndexingStatus.need_reindexing
-                        logger.debug(f"file {fpath} needs indexing, timestamp changed")
-                        doc_update = MinimaDocUpdate(fpath=fpath, last_updated_seconds=last_updated_seconds)
-                        doc_data = doc_update.model_dump(exclude_unset=True)
-                        doc.sqlmodel_update(doc_data)
-                        session.add(doc)
-                        session.commit()
-                    else:
-                        logger.debug(f"file {fpath} doesn't need indexing, timestamp same")
-                else:
-                    doc = MinimaDoc(fpath=fpath, last_updated_seconds=last_updated_seconds)
-                    session.add(doc)
-                    session.commit()
-                    logger.debug(f"file {fpath} needs indexing, new file")
-                    indexing_status = IndexingStatus.new_file
-            return indexing_status
-        except Exception as e:
-            logger.error(f"error updating file in the store {e}, skipping indexing")
-            return IndexingStatus.no_need_reindexing
+        """
+        Only reads, the file is recorded with record_indexed once it is in the index, so a
+        file whose indexing failed or was interrupted is found again by the next attempt.
+        Store errors propagate, the file must not be taken as indexed.
+        """
+        with Session(engine) as session:
+            doc = session.get(MinimaDoc, fpath)
+        if doc is None:
+            logger.debug(f"file {fpath} needs indexing, new file")
+            return IndexingStatus.new_file
+        logger.debug(
+            f"file {fpath} new last updated={last_updated_seconds} old last updated: {doc.last_updated_seconds}"
+        )
+        if doc.last_updated_seconds < last_updated_seconds:
+            logger.debug(f"file {fpath} needs indexing, timestamp changed")
+            return IndexingStatus.need_reindexing
+        logger.debug(f"file {fpath} doesn't need indexing, timestamp same")
+        return IndexingStatus.no_need_reindexing
+
+    @staticmethod
+    def record_indexed(fpath: str, last_updated_seconds: int) -> None:
+        with Session(engine) as session:
+            session.merge(MinimaDoc(fpath=fpath, last_updated_seconds=last_updated_seconds))
+            session.commit()
@@ -0,0 +1,185 @@
+import time
+import uuid
+import logging
+from typing import Dict, List
+
+from sqlalchemy import MetaData, func, update
+from sqlmodel import Field, Session, SQLModel, create_engine, select
+
+from storage import share_sqlite
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+# paths per statement, below SQLite's limit of bound parameters
+REOPEN_BATCH_SIZE = 500
+
+
+class WorkQueueModel(SQLModel):
+    """Own metadata so the work queue tables are not created in the MinimaStore database"""
+    metadata = MetaData()
+
+
+class WorkItem(WorkQueueModel, table=True):
+    path: str = Field(primary_key=True)
+    last_updated_seconds: int
+    status: str = Field(default=STATUS_PENDING, index=True)
+    lease_owner: str | None = None
+    lease_expires: float | None = Field(default=None, index=True)
+    attempts: int = 0
+    enqueued_at: float = Field(default_factory=time.time, index=True)
+    error: str | None = None
+
+
+class WorkQueue:
+    """
+    Files to index, shared by one crawler and any number of worker replicas through SQLite
+
+    The crawler publishes every file it sees, a changed modification time puts a file back
+    to pending. Workers claim files with a lease: a claim is a conditional UPDATE that only
+    succeeds while the file is pending or its previous lease has expired, and SQLite runs
+    writes one at a time, so a file is never held by two workers. A worker that dies simply
+    lets its leases expire and the files go to the next claimant.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.max_attempts = max_attempts
+        self.engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 30})
+        share_sqlite(self.engine)
+        WorkQueueModel.metadata.create_all(self.engine)
+
+    def publish(self, messages: List[Dict[str, any]]) -> int:
+        """Add new files and reopen changed ones, returns how many became pending"""
+        published = 0
+        with Session(self.engine) as session:
+            paths = [message["path"] for message in messages]
+            existing = {item.path: item for item in session.exec(select(WorkItem).where(WorkItem.path.in_(paths)))}
+            for message in messages:
+                item = existing.get(message["path"])
+                if item is None:
+                    session.add(WorkItem(path=message["path"], last_updated_seconds=message["last_updated_seconds"]))
+                    published += 1
+                elif item.last_updated_seconds != message["last_updated_seconds"]:
+                    item.last_updated_seconds = message["last_updated_seconds"]
+                    item.status = STATUS_PENDING
+                    item.attempts = 0
+                    item.error = None
+                    item.enqueued_at = time.time()
+                    session.add(item)
+                    published += 1
+            session.commit()
+        return published
+
+    def retain(self, existing_paths: List[str]) -> int:
+        """Forget files that no longer exist"""
+        existing_paths = set(existing_paths)
+        with Session(self.engine) as session:
+            removed = [item for item in session.exec(select(WorkItem)) if item.path not in existing_paths]
+            for item in removed:
+                session.delete(item)
+            session.commit()
+        return len(removed)
+
+    def reopen(self, paths: List[str]) -> None:
+        """Queue files again although they did not change, e.g. after their shard was dropped"""
+        if not paths:
+            return
+        with Session(self.engine) as session:
+            for start in range(0, len(paths), REOPEN_BATCH_SIZE):
+                session.execute(
+                    update(WorkItem)
+                    .where(WorkItem.path.in_(paths[start:start + REOPEN_BATCH_SIZE]))
+                    .values(status=STATUS_PENDING, attempts=0, error=None, lease_expires=None, enqueued_at=time.time())
+                )
+            session.commit()
+
+    def claim(self, owner: str, limit: int, lease_seconds: float) -> List[Dict[str, any]]:
+        """Lease up to limit files, returned as index messages"""
+        now = time.time()
+        claimable = (WorkItem.status == STATUS_PENDING) | (
+            (WorkItem.status == STATUS_LEASED) & (WorkItem.lease_expires < now)
+        )
+        claimed = []
+        with Session(self.engine) as session:
+            candidates = session.exec(
+                select(WorkItem.path).where(claimable).order_by(WorkItem.enqueued_at).limit(limit * 2)
+            ).all()
+            for path in candidates:
+                result = session.execute(
+                    update(WorkItem)
+                    .where(WorkItem.path == path, claimable)
+                    .values(
+                        status=STATUS_LEASED,
+                        lease_owner=owner,
+                        lease_expires=now + lease_seconds,
+                        attempts=WorkItem.attempts + 1
+                    )
+                )
+                session.commit()
+                if result.rowcount == 1:
+                    item = session.get(WorkItem, path)
+                    claimed.append({
+                        "path": item.path,
+                        "file_id": str(uuid.uuid4()),
+                        "last_updated_seconds": item.last_updated_seconds,
+                        "attempts": item.attempts,
+                        "type": "file"
+                    })
+                    if len(claimed) >= limit:
+                        break
+        return claimed
+
+    def renew(self, owner: str, paths: List[str], lease_seconds: float) -> None:
+        with Session(self.engine) as session:
+            session.execute(
+                update(WorkItem)
+                .where(WorkItem.path.in_(paths), WorkItem.lease_owner == owner, WorkItem.status == STATUS_LEASED)
+                .values(lease_expires=time.time() + lease_seconds)
+            )
+            session.commit()
+
+    def complete(self, owner: str, item: Dict[str, any]) -> bool:
+        """Mark a claimed file done, unless it changed or the lease went to someone else meanwhile"""
+        with Session(self.engine) as session:
+            result = session.execute(
+                update(WorkItem)
+                .where(
+                    WorkItem.path == item["path"],
+                    WorkItem.lease_owner == owner,
+                    WorkItem.status == STATUS_LEASED,
+                    WorkItem.last_updated_seconds == item["last_updated_seconds"]
+                )
+                .values(status=STATUS_DONE, lease_expires=None, error=None)
+            )
+            session.commit()
+            return result.rowcount == 1
+
+    def fail(self, owner: str, item: Dict[str, any], error: str) -> None:
+        """Put a file back for another attempt, or park it as failed after max_attempts"""
+        with Session(self.engine) as session:
+            session.execute(
+                update(WorkItem)
+                .where(WorkItem.path == item["path"], WorkItem.lease_owner == owner, WorkItem.status == STATUS_LEASED)
+                .values(
+                    status=STATUS_FAILED if item["attempts"] >= self.max_attempts else STATUS_PENDING,
+                    lease_expires=None,
+                    error=error[:1000]
+                )
+            )
+            session.commit()
+
+    def stats(self) -> Dict[str, any]:
+        with Session(self.engine) as session:
+            counts = dict(session.exec(select(WorkItem.status, func.count()).group_by(WorkItem.status)).all())
+            owners = session.exec(
+                select(WorkItem.lease_owner, func.count())
+                .where(WorkItem.status == STATUS_LEASED)
+                .group_by(WorkItem.lease_owner)
+            ).all()
+        return {
+            "counts": {status: counts.get(status, 0) for status in (STATUS_PENDING, STATUS_LEASED, STATUS_DONE, STATUS_FAILED)},
+            "leases": dict(owners),
+        }
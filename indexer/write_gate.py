@@ -0,0 +1,45 @@
+import threading
+from contextlib import contextmanager
+
+
+class WriteGate:
+    """
+    Lets any number of index writers run together, or one exclusive holder alone
+
+    Snapshot export holds it exclusively so the vectors, payloads and MinimaStore rows it
+    reads all belong to the same moment. Writers arriving meanwhile wait for it to finish.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.writers = 0
+        self.exclusive_held = False
+
+    @contextmanager
+    def writing(self):
+        with self.condition:
+            while self.exclusive_held:
+                self.condition.wait()
+            self.writers += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.writers -= 1
+                self.condition.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self.condition:
+            while self.exclusive_held:
+                self.condition.wait()
+            # claim it before draining so new writers queue up behind us
+            self.exclusive_held = True
+            while self.writers:
+                self.condition.wait()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.exclusive_held = False
+                self.condition.notify_all()
@@ -3,8 +3,13 @@ import logging
 import asyncio
 import random
 import string
-from fastapi import FastAPI
+from typing import Optional
+from pydantic import BaseModel
+from fastapi import FastAPI, APIRouter
+import tracing
+import requestor
 from requestor import request_data
+from task_source import FirestoreTaskSource, LocalTaskSource, Task, TaskSource
 from contextlib import asynccontextmanager
 
 import json
@@ -36,16 +41,21 @@ TASKS_COLLECTION = os.environ.get("TASKS_COLLECTION")
 USER_ID = os.environ.get("USER_ID")
 PASSWORD = os.environ.get("PASSWORD")
 FB_PROJECT = os.environ.get("FB_PROJECT")
+SEARCH_TOP_K = int(os.environ.get("SEARCH_TOP_K", 5))
+SEARCH_MAX_CHARS = int(os.environ.get("SEARCH_MAX_CHARS", 8000))
 
-app = FastAPI()
-response = sign_in_with_email_and_password(USER_ID, PASSWORD)
-creds = Credentials(response["idToken"], response["refreshToken"])
-# noinspection PyTypeChecker
-db = Client(FB_PROJECT, creds)
+TASK_SOURCE = os.environ.get("TASK_SOURCE", "firestore")
+# listen: Firestore snapshot listener, poll: query the pending tasks every TASK_POLL_SECONDS
+TASK_SOURCE_MODE = os.environ.get("TASK_SOURCE_MODE", "listen")
+TASK_POLL_SECONDS = float(os.environ.get("TASK_POLL_SECONDS", 1))
+TASK_WORKERS = int(os.environ.get("TASK_WORKERS", 4))
+TASK_RETRIES = int(os.environ.get("TASK_RETRIES", 3))
+TASK_RETRY_SECONDS = float(os.environ.get("TASK_RETRY_SECONDS", 60))
+# pending tasks held in memory, more are read from the source once these are taken
+TASK_QUEUE_SIZE = int(os.environ.get("TASK_QUEUE_SIZE", 100))
 
 
-async def poll_firestore():
-    logger.info(f"Polling Firestore collection: {COLLECTION_NAME}")
+def register_otp(db: Client) -> str:
     random_otp = ''.join(random.choices(string.ascii_uppercase + string.digits, k=16))
     doc_ref = db.collection(USERS_COLLECTION_NAME).document(USER_ID)
     try:
@@ -57,36 +67,102 @@ async def poll_firestore():
         doc_ref.update({'otp': random_otp})
     else:
         doc_ref.create({'otp': random_otp})
-    
+    return random_otp
+
+
+def create_task_source() -> TaskSource:
+    if TASK_SOURCE == "local":
+        logger.info("Using the local task source, submit tasks with POST /linker/tasks")
+        return LocalTaskSource(max_queued=TASK_QUEUE_SIZE)
+    if TASK_SOURCE != "firestore":
+        raise ValueError(f"Unsupported TASK_SOURCE: {TASK_SOURCE}, expected firestore or local")
+    response = sign_in_with_email_and_password(USER_ID, PASSWORD)
+    creds = Credentials(response["idToken"], response["refreshToken"])
+    # noinspection PyTypeChecker
+    db = Client(FB_PROJECT, creds)
+    logger.info(f"Watching Firestore collection: {COLLECTION_NAME}")
+    random_otp = register_otp(db)
+    print(f"OTP for this computer in Minima GPT: {random_otp}")
+    collection = db.collection(COLLECTION_NAME).document(USER_ID).collection(TASKS_COLLECTION)
+    return FirestoreTaskSource(
+        collection,
+        mode=TASK_SOURCE_MODE,
+        poll_seconds=TASK_POLL_SECONDS,
+        max_queued=TASK_QUEUE_SIZE
+    )
+
+
+task_source = create_task_source()
+
+
+async def process_task(task: Task) -> None:
+    data = task.data
+    if not data.get('request'):
+        # retrying cannot help, the task would otherwise stay pending forever
+        logger.error(f"Task {task.id} has no request, marking it failed")
+        await task_source.fail(task, "The task has no request")
+        return
+    for attempt in range(TASK_RETRIES):
+        with tracing.trace(), tracing.span("linker.task", task_id=task.id, attempt=attempt):
+            response = await request_data(
+                data['request'],
+                top_k=data.get('top_k', SEARCH_TOP_K),
+                max_chars=data.get('max_chars', SEARCH_MAX_CHARS),
+                score_threshold=data.get('score_threshold'),
+                cursor=data.get('cursor'),
+                filters=data.get('filters'),
+                profile=data.get('profile'),
+                search=data.get('search')
+            )
+        if 'error' not in response:
+            logger.info(f"Updating task: {task.id}")
+            await task_source.complete(task, {
+                'links': response['result']['links'],
+                'result': response['result']['output'],
+                'hits': response['result']['hits'],
+                'next_cursor': response['result']['next_cursor']
+            })
+            return
+        logger.error(f"Error in processing request: {response['error']}")
+        if attempt < TASK_RETRIES - 1:
+            await asyncio.sleep(2 ** attempt)
+    # the task stays pending and is offered again later
+    task_source.release(task, retry_seconds=TASK_RETRY_SECONDS)
+
+
+async def task_worker(queue: asyncio.Queue) -> None:
     while True:
-        print(f"OTP for this computer in Minima GPT: {random_otp}")
+        task = await queue.get()
         try:
-            docs = db.collection(COLLECTION_NAME).document(USER_ID).collection(TASKS_COLLECTION).stream()
-            for doc in docs:
-                data = doc.to_dict()
-                if data['status'] == 'PENDING':
-                    response = await request_data(data['request'])
-                    if 'error' not in response:
-                        logger.info(f"Updating Firestore document: {doc.id}")
-                        doc_ref = db.collection(COLLECTION_NAME).document(USER_ID).collection(TASKS_COLLECTION).document(doc.id)
-                        doc_ref.update({
-                            'status': 'COMPLETED',
-                            'links': response['result']['links'],
-                            'result': response['result']['output']
-                        })
-                    else:
-                        logger.error(f"Error in processing request: {response['error']}")
-            await asyncio.sleep(0.5)
+            await process_task(task)
         except Exception as e:
-            logger.error(f"Error in polling Firestore collection: {e}")
-            await asyncio.sleep(0.5)
+            logger.error(f"Error in processing task {task.id}: {e}")
+            task_source.release(task, retry_seconds=TASK_RETRY_SECONDS)
+        finally:
+            queue.task_done()
+
+
+async def consume_tasks():
+    # bounded hand-off, the source is only read as fast as the workers take tasks
+    queue: asyncio.Queue[Task] = asyncio.Queue(maxsize=TASK_WORKERS)
+    workers = [asyncio.create_task(task_worker(queue)) for _ in range(TASK_WORKERS)]
+    try:
+        async for task in task_source.pending():
+            await queue.put(task)
+    finally:
+        for worker in workers:
+            worker.cancel()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info("Starting Firestore polling")
-    poll_task = asyncio.create_task(poll_firestore())
+    logger.info(f"Starting {TASK_SOURCE} task intake with {TASK_WORKERS} workers")
+    await task_source.start()
+    consume_task = asyncio.create_task(consume_tasks())
     yield
-    poll_task.cancel()
+    consume_task.cancel()
+    await task_source.stop()
+    await requestor.close()
 
 
 def create_app() -> FastAPI:
@@ -95,6 +171,37 @@ def create_app() -> FastAPI:
         docs_url="/linker/docs",
         lifespan=lifespan
     )
+    if isinstance(task_source, LocalTaskSource):
+        app.include_router(local_tasks_router())
     return app
 
+
+class LocalTask(BaseModel):
+    request: str
+    top_k: Optional[int] = None
+    max_chars: Optional[int] = None
+    score_threshold: Optional[float] = None
+    cursor: Optional[str] = None
+    filters: Optional[dict] = None
+    profile: Optional[str] = None
+    search: Optional[dict] = None
+
+
+def local_tasks_router() -> APIRouter:
+    router = APIRouter(prefix="/linker/tasks")
+
+    @router.post("")
+    async def add_task(task: LocalTask):
+        return {"result": {"id": task_source.add(task.model_dump(exclude_none=True))}}
+
+    @router.get("/{task_id}")
+    async def get_task(task_id: str):
+        task = task_source.get(task_id)
+        if task is None:
+            return {"error": f"Unknown task: {task_id}"}
+        return {"result": task}
+
+    return router
+
+
 app = create_app()
\ No newline at end of file
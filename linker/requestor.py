@@ -1,6 +1,7 @@
 import httpx
 import logging
 import asyncio
+import tracing
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,21 +12,42 @@ REQUEST_HEADERS = {
     'Content-Type': 'application/json'
 }
 
-async def request_data(query):
+# shared by all task workers, keeps connections to the indexer alive between tasks
+_client: httpx.AsyncClient | None = None
+
+
+def client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=30,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20)
+        )
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def request_data(query, **search_params):
     payload = {
-        "query": query
+        "query": query,
+        **{key: value for key, value in search_params.items() if value is not None}
     }
-    async with httpx.AsyncClient() as client:
-        try:
-            logger.info(f"Requesting data from indexer with query: {query}")
-            response = await client.post(REQUEST_DATA_URL, 
-                                         headers=REQUEST_HEADERS, 
-                                         json=payload)
-            response.raise_for_status()
-            data = response.json()
-            logger.info(f"Received data: {data}")
-            return data
-
-        except Exception as e:
-            logger.error(f"HTTP error: {e}")
-            return { "error": str(e) }
\ No newline at end of file
+    try:
+        logger.info(f"Requesting data from indexer with query: {query}")
+        response = await client().post(REQUEST_DATA_URL,
+                                       headers={**REQUEST_HEADERS, **tracing.trace_headers()},
+                                       json=payload)
+        response.raise_for_status()
+        data = response.json()
+        logger.info(f"Received {len(data.get('result', {}).get('hits', []))} hits")
+        return data
+
+    except Exception as e:
+        logger.error(f"HTTP error: {e}")
+        return { "error": str(e) }
@@ -0,0 +1,178 @@
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Set
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "PENDING"
+STATUS_COMPLETED = "COMPLETED"
+STATUS_FAILED = "FAILED"
+
+
+@dataclass
+class Task:
+    id: str
+    data: Dict[str, any]
+
+
+class TaskSource:
+    """
+    Where search tasks come from and where their results go
+
+    pending() yields every pending task once while it is being worked on. A task released
+    without being completed is yielded again after retry_seconds, or whenever the source
+    sees it next. At most max_queued tasks wait to be taken, tasks seen while the queue is
+    full are left in the source and read again by _refill once the queue has drained.
+    """
+
+    def __init__(self, max_queued: int = 100):
+        self.queue: asyncio.Queue[Task] = asyncio.Queue(maxsize=max_queued)
+        self.in_flight: Set[str] = set()
+        self.retrying: Set[str] = set()
+        self.overflowed = False
+
+    def _offer(self, task: Task) -> None:
+        if task.id in self.in_flight or task.id in self.retrying:
+            return
+        if self.queue.full():
+            self.overflowed = True
+            return
+        self.in_flight.add(task.id)
+        self.queue.put_nowait(task)
+
+    def _retry(self, task: Task) -> None:
+        self.retrying.discard(task.id)
+        self._offer(task)
+
+    async def _refill(self) -> None:
+        """Offer the pending tasks again, after some were dropped because the queue was full"""
+        pass
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def pending(self) -> AsyncIterator[Task]:
+        while True:
+            if self.overflowed and self.queue.empty():
+                self.overflowed = False
+                await self._refill()
+            yield await self.queue.get()
+
+    async def _finish(self, task: Task, fields: Dict[str, any]) -> None:
+        raise NotImplementedError
+
+    async def complete(self, task: Task, result: Dict[str, any]) -> None:
+        await self._finish(task, {"status": STATUS_COMPLETED, **result})
+
+    async def fail(self, task: Task, error: str) -> None:
+        """For tasks that can never succeed, they are not offered again"""
+        await self._finish(task, {"status": STATUS_FAILED, "error": error})
+
+    def release(self, task: Task, retry_seconds: float | None = None) -> None:
+        self.in_flight.discard(task.id)
+        if retry_seconds is not None:
+            self.retrying.add(task.id)
+            asyncio.get_running_loop().call_later(retry_seconds, self._retry, task)
+
+
+class FirestoreTaskSource(TaskSource):
+    """
+    Pending tasks of one user's Firestore task collection
+
+    The status filter runs on the server, so reads do not grow with the task history. In
+    listen mode a snapshot listener pushes tasks as they are created; in poll mode the
+    pending tasks are queried every poll_seconds.
+    """
+
+    def __init__(self, collection, mode: str = "listen", poll_seconds: float = 1, max_queued: int = 100):
+        super().__init__(max_queued)
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        self.collection = collection
+        self.query = collection.where(filter=FieldFilter("status", "==", STATUS_PENDING))
+        self.mode = mode
+        self.poll_seconds = poll_seconds
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.watch = None
+        self.poll_task: asyncio.Task | None = None
+        # completed tasks the query may still report as pending until their update shows up
+        self.done: Set[str] = set()
+
+    def _offer(self, task: Task) -> None:
+        if task.id not in self.done:
+            super()._offer(task)
+
+    def _on_snapshot(self, _snapshot, changes, _read_time) -> None:
+        # called on the listener's thread
+        for change in changes:
+            if change.type.name in ("ADDED", "MODIFIED"):
+                task = Task(id=change.document.id, data=change.document.to_dict())
+                self.loop.call_soon_threadsafe(self._offer, task)
+            elif change.type.name == "REMOVED":
+                self.loop.call_soon_threadsafe(self.done.discard, change.document.id)
+
+    async def _refill(self) -> None:
+        try:
+            docs = await asyncio.to_thread(lambda: list(self.query.stream()))
+            self.done &= {doc.id for doc in docs}
+            for doc in docs:
+                self._offer(Task(id=doc.id, data=doc.to_dict()))
+        except Exception as e:
+            logger.error(f"Error in querying pending tasks: {e}")
+            # try again once the queue has drained
+            self.overflowed = True
+
+    async def _poll(self) -> None:
+        while True:
+            await self._refill()
+            await asyncio.sleep(self.poll_seconds)
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        if self.mode == "listen":
+            self.watch = self.query.on_snapshot(self._on_snapshot)
+            logger.info("Listening for pending Firestore tasks")
+        else:
+            self.poll_task = asyncio.create_task(self._poll())
+            logger.info(f"Polling pending Firestore tasks every {self.poll_seconds}s")
+
+    async def stop(self) -> None:
+        if self.watch is not None:
+            self.watch.unsubscribe()
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+
+    async def _finish(self, task: Task, fields: Dict[str, any]) -> None:
+        await asyncio.to_thread(self.collection.document(task.id).update, fields)
+        self.done.add(task.id)
+        self.release(task)
+
+
+class LocalTaskSource(TaskSource):
+    """In-memory stand-in for Firestore, for running the linker and its tests without a project"""
+
+    def __init__(self, max_queued: int = 100):
+        super().__init__(max_queued)
+        self.tasks: Dict[str, Dict[str, any]] = {}
+
+    def add(self, data: Dict[str, any]) -> str:
+        task_id = str(uuid.uuid4())
+        self.tasks[task_id] = {**data, "status": STATUS_PENDING}
+        self._offer(Task(id=task_id, data=self.tasks[task_id]))
+        return task_id
+
+    def get(self, task_id: str) -> Dict[str, any] | None:
+        return self.tasks.get(task_id)
+
+    async def _refill(self) -> None:
+        for task_id, data in list(self.tasks.items()):
+            if data["status"] == STATUS_PENDING:
+                self._offer(Task(id=task_id, data=data))
+
+    async def _finish(self, task: Task, fields: Dict[str, any]) -> None:
+        self.tasks[task.id].update(fields)
+        self.release(task)
@@ -0,0 +1,167 @@
+import os
+import time
+import httpx
+import asyncio
+import logging
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION_URL = os.environ.get("INDEXER_URL", "http://indexer:8000") + "/index/version"
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    context: List[Document]
+    seconds: float
+    created_at: float = field(default_factory=time.time)
+    last_hit: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+@dataclass
+class CacheProbe:
+    """What a new answer is stored under: the question's vector and the generation it was answered in"""
+    vector: np.ndarray
+    generation: int
+
+
+class AnswerCache:
+    """
+    Answers to earlier standalone questions, looked up by embedding similarity
+
+    Vectors are kept normalized in one matrix, so a lookup is a single dot product. Every
+    entry belongs to the indexer's content generation (GET /index/version); as soon as the
+    generation changes the whole cache is dropped, and while the indexer cannot be reached
+    the cache is bypassed rather than serving answers that may be stale.
+    """
+
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            threshold: float,
+            max_entries: int,
+            ttl_seconds: float,
+            version_check_seconds: float = 5,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_check_seconds = version_check_seconds
+        self.entries: List[CachedAnswer] = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.lock = asyncio.Lock()
+        self.http_client: httpx.AsyncClient | None = None
+        self.generation: Optional[int] = None
+        self.generation_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.invalidations = 0
+        self.seconds_saved = 0.0
+
+    async def _current_generation(self) -> Optional[int]:
+        now = time.monotonic()
+        if self.generation is not None and now - self.generation_checked_at < self.version_check_seconds:
+            return self.generation
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(timeout=2)
+        try:
+            response = await self.http_client.get(INDEX_VERSION_URL)
+            response.raise_for_status()
+            generation = response.json()["result"]["generation"]
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            logger.warning(f"Index version unavailable, bypassing the answer cache: {e}")
+            self.generation = None
+            self._clear()
+            return None
+        if generation != self.generation:
+            if self.entries:
+                logger.info(f"Index generation {self.generation} -> {generation}, dropping {len(self.entries)} cached answers")
+                self.invalidations += 1
+            self._clear()
+            self.generation = generation
+        self.generation_checked_at = now
+        return generation
+
+    def _clear(self) -> None:
+        self.entries = []
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+
+    def _remove(self, keep: List[int]) -> None:
+        self.entries = [self.entries[i] for i in keep]
+        self.vectors = self.vectors[keep] if keep else np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def lookup(self, question: str) -> tuple[Optional[CachedAnswer], Optional[CacheProbe]]:
+        """
+        Returns:
+            tuple: The cached answer or None, and the probe to store a new answer with,
+                   None when the cache is bypassed
+        """
+        start = time.perf_counter()
+        generation = await self._current_generation()
+        if generation is None:
+            self.bypassed += 1
+            return None, None
+        vector = self._normalize(await self.embeddings.aembed_query(question))
+        probe = CacheProbe(vector=vector, generation=generation)
+        async with self.lock:
+            now = time.time()
+            fresh = [i for i, entry in enumerate(self.entries) if now - entry.created_at <= self.ttl_seconds]
+            if len(fresh) < len(self.entries):
+                self._remove(fresh)
+            if self.entries and self.vectors.shape[1] == vector.shape[0]:
+                similarities = self.vectors @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry = self.entries[best]
+                    entry.hits += 1
+                    entry.last_hit = now
+                    self.hits += 1
+                    self.seconds_saved += max(entry.seconds - (time.perf_counter() - start), 0)
+                    logger.info(f"Answer cache hit ({similarities[best]:.3f}): {question} ~ {entry.question}")
+                    return entry, probe
+            self.misses += 1
+            return None, probe
+
+    async def store(self, question: str, probe: CacheProbe, answer: str, context: List[Document], seconds: float) -> None:
+        vector = probe.vector
+        async with self.lock:
+            if probe.generation != self.generation:
+                # the index changed while this answer was being generated
+                return
+            if self.entries and self.vectors.shape[1] != vector.shape[0]:
+                self._clear()
+            if len(self.entries) >= self.max_entries:
+                # evict the least recently used entry
+                oldest = min(range(len(self.entries)), key=lambda i: self.entries[i].last_hit)
+                self._remove([i for i in range(len(self.entries)) if i != oldest])
+            self.entries.append(CachedAnswer(question=question, answer=answer, context=list(context), seconds=seconds))
+            self.vectors = np.vstack([self.vectors, vector[None, :]]) if self.entries[:-1] else vector[None, :]
+
+    def stats(self) -> Dict[str, any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "generation": self.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "invalidations": self.invalidations,
+            "seconds_saved": round(self.seconds_saved, 3),
+        }
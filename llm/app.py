@@ -1,24 +1,67 @@
+import os
 import logging
 import asyncio
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi import WebSocket
-from llm_chain import LLMChain
+from registry import Registry
+from warmup import Warmup
 from async_queue import AsyncQueue
+from contextlib import asynccontextmanager
 
 import async_socket_to_chat
 import async_question_to_answer
 import async_answer_to_socket
 
-app = FastAPI()
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("llm")
 
+# per connection: messages from the client waiting to be read, and answer chunks waiting to be sent
+QUESTION_QUEUE_SIZE = int(os.environ.get("QUESTION_QUEUE_SIZE", 16))
+RESPONSE_QUEUE_SIZE = int(os.environ.get("RESPONSE_QUEUE_SIZE", 256))
+
+
+warmup = Warmup(Registry(), timeout_seconds=Registry().config.warmup_timeout_seconds)
+
+
+async def start_background_tasks():
+    # load the shared models and warm up Ollama and the indexer before the first question needs them
+    await warmup.run()
+    await Registry().session_store.expire_loop()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background_task = asyncio.create_task(start_background_tasks())
+    yield
+    background_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/llm/ready")
+async def ready():
+    """Readiness probe, 503 until the warm-up has made every stage hot"""
+    return JSONResponse(status_code=200 if warmup.ready else 503, content={"result": warmup.report()})
+
+@app.get("/llm/stats")
+async def stats():
+    registry = Registry()
+    if not warmup.ready:
+        return {"result": {"warmup": warmup.report()}}
+    return {"result": {
+        "warmup": warmup.report(),
+        "rerank_cache": registry.llm_chain.rerank_engine.cache.stats(),
+        "sessions": registry.session_store.stats(),
+        "scheduler": registry.scheduler.stats(),
+        "answer_cache": registry.answer_cache.stats() if registry.answer_cache is not None else None,
+    }}
+
 @app.websocket("/llm/")
 async def chat_client(websocket: WebSocket):
 
-    question_queue = AsyncQueue()
-    response_queue = AsyncQueue()
+    question_queue = AsyncQueue(maxsize=QUESTION_QUEUE_SIZE)
+    response_queue = AsyncQueue(maxsize=RESPONSE_QUEUE_SIZE)
 
     answer_to_socket_promise = async_answer_to_socket.loop(response_queue, websocket)
     question_to_answer_promise = async_question_to_answer.loop(question_queue, response_queue)
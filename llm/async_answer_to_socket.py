@@ -8,14 +8,18 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("llm")
 
 async def loop(response_queue: AsyncQueue, websocket: WebSocket):
-    while True:
-        data = await response_queue.dequeue()
+    try:
+        while True:
+            data = await response_queue.dequeue()
 
-        if data == cfc.CFC_CLIENT_DISCONNECTED:
-            break
-        else:
-            logger.info(f"Sending data: {data}")
-            try:
-                await websocket.send_text(data)
-            except ws.WebSocketDisconnect:
-                break
\ No newline at end of file
+            if data == cfc.CFC_CLIENT_DISCONNECTED:
+                break
+            else:
+                logger.debug(f"Sending data: {data}")
+                try:
+                    await websocket.send_text(data)
+                except ws.WebSocketDisconnect:
+                    break
+    finally:
+        # nothing reads the queue any more, release an answer waiting for room in it
+        response_queue.shutdown()
\ No newline at end of file
@@ -1,55 +1,164 @@
+import os
 import json
+import asyncio
 import logging
-from llm_chain import LLMChain
-from async_queue import AsyncQueue
+import tracing
+from collections import deque
+from registry import Registry
+from async_queue import AsyncQueue, AsyncQueueDequeueInterrupted
+from chat_session import ChatSession
+from llm_chain import CacheLookup
+from scheduler import SchedulerBusy
 import control_flow_commands as cfc
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("chat")
 
+# questions a client may have waiting behind the one being answered
+MAX_QUEUED_QUESTIONS = int(os.environ.get("MAX_QUEUED_QUESTIONS", 3))
+
+
+def _output(message_type: str, **fields) -> str:
+    return json.dumps({"reporter": "output_message", "type": message_type, **fields})
+
+
 async def loop(
         questions_queue: AsyncQueue,
         response_queue: AsyncQueue,
 ):
 
-    llm_chain = LLMChain()
-
-    while True:
-        data = await questions_queue.dequeue()
-        data = data.replace("\n", "")
-
-        if data == cfc.CFC_CLIENT_DISCONNECTED:
-            response_queue.enqueue(
-                json.dumps({
-                    "reporter": "output_message",
-                    "type": "disconnect_message",
-                })
-            )
-            break
-
-        if data == cfc.CFC_CHAT_STARTED:
-            response_queue.enqueue(
-                json.dumps({
-                    "reporter": "output_message",
-                    "type": "start_message",
-                })
-            )
-            
-        elif data == cfc.CFC_CHAT_STOPPED:
-            response_queue.enqueue(
-                json.dumps({
-                    "reporter": "output_message",
-                    "type": "stop_message",
-                })
-            )
-            
-        elif data:
-            result = llm_chain.invoke(data)
-            response_queue.enqueue(
-                json.dumps({
-                    "reporter": "output_message",
-                    "type": "answer",
-                    "message": result["answer"],
-                    "links": list(result["links"])
-                })
-            )
\ No newline at end of file
+    # blocks until the models are loaded when the connection comes in during warm-up
+    sessions = await asyncio.get_running_loop().run_in_executor(None, lambda: Registry().session_store)
+    session = sessions.open()
+    try:
+        await _answer_questions(session, questions_queue, response_queue)
+    finally:
+        sessions.close(session.session_id)
+
+
+async def _answer(session: ChatSession, question: str, response_queue: AsyncQueue):
+    def on_position(position: int):
+        response_queue.enqueue(_output("queue_position", position=position), force=True)
+
+    with tracing.trace(), tracing.span("llm.question") as attributes:
+        try:
+            # a cached answer is not generated, so it never waits behind generations for a slot
+            lookup = await session.lookup(question)
+            if lookup.result is not None:
+                await _stream_answer(session, question, response_queue, attributes, lookup)
+                return
+            async with Registry().scheduler.slot(session.session_id, on_position):
+                await _stream_answer(session, question, response_queue, attributes, lookup)
+        except SchedulerBusy as e:
+            logger.info(f"Session {session.session_id} question refused: {e}")
+            attributes["refused"] = True
+            await response_queue.put(_output(
+                "answer",
+                message="The assistant is busy right now, please ask again in a moment.",
+                links=[]
+            ))
+        except asyncio.CancelledError:
+            attributes["cancelled"] = True
+            raise
+
+
+async def _stream_answer(
+        session: ChatSession,
+        question: str,
+        response_queue: AsyncQueue,
+        attributes: dict,
+        lookup: CacheLookup,
+):
+    deltas = 0
+    try:
+        async for event in session.astream(question, lookup):
+            if "delta" in event:
+                deltas += 1
+                # waits while the client reads slower than the model writes
+                await response_queue.put(_output("answer_delta", message=event["delta"]))
+            elif "error" in event:
+                await response_queue.put(_output(
+                    "answer",
+                    message=f"Sorry, something went wrong: {event['error']}",
+                    links=[]
+                ))
+            else:
+                await response_queue.put(_output(
+                    "answer",
+                    message=event["answer"],
+                    links=list(event["links"]),
+                    timings=event["timings"],
+                    cached=event.get("cached", False)
+                ))
+    finally:
+        attributes["deltas"] = deltas
+
+
+async def _cancel(task: asyncio.Task | None) -> None:
+    """Cancel the answer in progress, which closes its Ollama request and stops the generation"""
+    if task is None or task.done():
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.error(f"Cancelled answer failed: {e}")
+
+
+async def _answer_questions(session: ChatSession, questions_queue: AsyncQueue, response_queue: AsyncQueue):
+
+    pending: deque[str] = deque()
+    answering: asyncio.Task | None = None
+    receiving = asyncio.create_task(questions_queue.dequeue())
+
+    try:
+        while True:
+            waiting = {receiving} | ({answering} if answering is not None else set())
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if answering in done:
+                if not answering.cancelled() and answering.exception() is not None:
+                    logger.error(f"Answering failed: {answering.exception()}")
+                answering = None
+
+            if receiving in done:
+                try:
+                    data = receiving.result().replace("\n", "")
+                except AsyncQueueDequeueInterrupted:
+                    data = cfc.CFC_CLIENT_DISCONNECTED
+
+                if data == cfc.CFC_CLIENT_DISCONNECTED:
+                    pending.clear()
+                    await _cancel(answering)
+                    response_queue.enqueue(_output("disconnect_message"), force=True)
+                    break
+
+                if data == cfc.CFC_CHAT_STARTED:
+                    response_queue.enqueue(_output("start_message"), force=True)
+
+                elif data == cfc.CFC_CHAT_STOPPED:
+                    pending.clear()
+                    await _cancel(answering)
+                    answering = None
+                    response_queue.enqueue(_output("stop_message"), force=True)
+
+                elif data:
+                    if len(pending) >= MAX_QUEUED_QUESTIONS:
+                        logger.info(f"Session {session.session_id} has {len(pending)} questions waiting, rejecting")
+                        response_queue.enqueue(_output(
+                            "answer",
+                            message="Too many questions are waiting, please wait for the current answer.",
+                            links=[]
+                        ), force=True)
+                    else:
+                        pending.append(data)
+
+                receiving = asyncio.create_task(questions_queue.dequeue())
+
+            if answering is None and pending:
+                answering = asyncio.create_task(_answer(session, pending.popleft(), response_queue))
+    finally:
+        receiving.cancel()
+        await _cancel(answering)
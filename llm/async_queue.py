@@ -8,15 +8,41 @@ class AsyncQueueDequeueInterrupted(Exception):
         super().__init__(self.message)
 
 class AsyncQueue:
-    def __init__(self) -> None:
+    """
+    Queue between the loops of one connection
+
+    With maxsize, enqueue() refuses values while the queue is full unless forced (control
+    flow commands always get through), and put() waits for room, which slows the producer
+    down to the pace of the consumer. After shutdown() nothing waits any more.
+    """
+
+    def __init__(self, maxsize: int = 0) -> None:
+        self.maxsize = maxsize
         self._data = deque([])
         self._presence_of_data = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._closed = False
+
+    def full(self) -> bool:
+        return self.maxsize > 0 and len(self._data) >= self.maxsize
+
+    def enqueue(self, value, force: bool = False) -> bool:
+        if self._closed or (self.full() and not force):
+            return False
 
-    def enqueue(self, value):
         self._data.append(value)
 
         if len(self._data) == 1:
             self._presence_of_data.set()
+        if self.full():
+            self._room.clear()
+        return True
+
+    async def put(self, value) -> bool:
+        while self.full() and not self._closed:
+            await self._room.wait()
+        return self.enqueue(value)
 
     async def dequeue(self):
         await self._presence_of_data.wait()
@@ -28,6 +54,8 @@ class AsyncQueue:
 
         if not self._data:
             self._presence_of_data.clear()
+        if not self.full():
+            self._room.set()
 
         return result
 
@@ -36,4 +64,6 @@ class AsyncQueue:
         return result
 
     def shutdown(self):
+        self._closed = True
         self._presence_of_data.set()
+        self._room.set()
@@ -21,28 +21,35 @@ async def loop(
 
             if message == cfc.CFC_CHAT_STARTED:
                 logger.info(f"Start message {message}")
-                questions_queue.enqueue(message)
+                questions_queue.enqueue(message, force=True)
 
             elif message == cfc.CFC_CHAT_STOPPED:
                 logger.info(f"Stop message {message}")
-                questions_queue.enqueue(message)
+                questions_queue.enqueue(message, force=True)
                 respone_queue.enqueue(json.dumps({
                     "reporter": "input_message",
                     "type": "stop_message",
                     "message": message
-                }))
+                }), force=True)
 
             else:
                 logger.info(f"Question: {message}")
-                questions_queue.enqueue(message)
                 respone_queue.enqueue(json.dumps({
                     "reporter": "input_message",
                     "type": "question",
                     "message": message
-                }))
+                }), force=True)
+                if not questions_queue.enqueue(message):
+                    logger.info("Question queue full, rejecting question")
+                    respone_queue.enqueue(json.dumps({
+                        "reporter": "output_message",
+                        "type": "answer",
+                        "message": "Too many questions are waiting, please wait for the current answer.",
+                        "links": []
+                    }), force=True)
                 
         except ws.WebSocketDisconnect as e:
             logger.info("Client disconnected")
-            questions_queue.enqueue(cfc.CFC_CLIENT_DISCONNECTED)
-            respone_queue.enqueue(cfc.CFC_CLIENT_DISCONNECTED)
+            questions_queue.enqueue(cfc.CFC_CLIENT_DISCONNECTED, force=True)
+            respone_queue.enqueue(cfc.CFC_CLIENT_DISCONNECTED, force=True)
             break
\ No newline at end of file
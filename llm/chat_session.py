@@ -0,0 +1,78 @@
+import time
+import uuid
+import logging
+from typing import AsyncIterator, Callable, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from llm_chain import CacheLookup, LLMChain
+from tokens import approximate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    """
+    Per-connection state, the models and the chain are shared through the Registry
+
+    The session keeps the conversation's recent turns and hands them to the chain as chat
+    history. Only the last max_turns question/answer pairs are kept, and older turns are
+    dropped further until the history fits in max_tokens.
+    """
+
+    def __init__(
+            self,
+            llm_chain: LLMChain,
+            max_turns: int = 6,
+            max_tokens: int = 1500,
+            count_tokens: Callable[[str], int] = approximate_tokens,
+    ):
+        self.session_id = str(uuid.uuid4())
+        self.llm_chain = llm_chain
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.created_at = time.time()
+        self.last_active = time.monotonic()
+        self.questions = 0
+        self.history: List[BaseMessage] = []
+        self.history_tokens = 0
+        # set once the SessionStore drops the session, it then answers without history
+        self.closed = False
+
+    def clear(self) -> None:
+        self.history = []
+        self.history_tokens = 0
+
+    def _remember(self, question: str, answer: str) -> None:
+        if self.closed:
+            return
+        self.history.extend([HumanMessage(question), AIMessage(answer)])
+        self.history = self.history[-2 * self.max_turns:] if self.max_turns > 0 else []
+        tokens = [self.count_tokens(message.content) for message in self.history]
+        while self.history and sum(tokens) > self.max_tokens:
+            # drop the oldest question and its answer together
+            self.history = self.history[2:]
+            tokens = tokens[2:]
+        self.history_tokens = sum(tokens)
+
+    def _begin(self) -> List[BaseMessage]:
+        self.questions += 1
+        self.last_active = time.monotonic()
+        logger.info(f"Session {self.session_id} question {self.questions}, {len(self.history) // 2} turns of history")
+        return list(self.history)
+
+    async def ask(self, message: str) -> dict:
+        result = await self.llm_chain.ainvoke(message, self._begin())
+        if "answer" in result:
+            self._remember(message, result["answer"])
+        self.last_active = time.monotonic()
+        return result
+
+    async def lookup(self, message: str) -> CacheLookup:
+        return await self.llm_chain.lookup(message, self.history)
+
+    async def astream(self, message: str, lookup: Optional[CacheLookup] = None) -> AsyncIterator[dict]:
+        async for event in self.llm_chain.astream(message, self._begin(), lookup):
+            if "answer" in event:
+                self._remember(message, event["answer"])
+            yield event
+        self.last_active = time.monotonic()
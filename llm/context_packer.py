@@ -0,0 +1,104 @@
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Sequence
+
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Block:
+    """A span of one file, built from one or more chunks"""
+    file_path: str
+    start: int | None
+    text: str
+    rank: int
+    metadata: dict = field(default_factory=dict)
+    chunks: int = 1
+
+    @property
+    def end(self) -> int | None:
+        return None if self.start is None else self.start + len(self.text)
+
+
+class ContextPacker:
+    """
+    Turns reranked chunks into the context of the prompt, in as few tokens as possible
+
+    Chunks of the same file are placed by their start_index, and chunks that overlap or
+    touch are merged into one span, so the text they share with CHUNK_OVERLAP appears once.
+    Spans with the same text, e.g. from copies of a file, are kept once. The spans are then
+    added in order of their best ranked chunk until max_tokens is reached; the span that
+    crosses the budget is cut to fit if at least min_tokens of it fit.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int], max_tokens: int, min_tokens: int = 64):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.min_tokens = min_tokens
+
+    @staticmethod
+    def _merge(blocks: List[_Block]) -> List[_Block]:
+        placed = sorted((b for b in blocks if b.start is not None), key=lambda b: b.start)
+        merged: List[_Block] = []
+        for block in placed:
+            last = merged[-1] if merged else None
+            if last is not None and block.start <= last.end:
+                if block.end > last.end:
+                    last.text += block.text[last.end - block.start:]
+                last.rank = min(last.rank, block.rank)
+                last.chunks += block.chunks
+            else:
+                merged.append(block)
+        return merged + [b for b in blocks if b.start is None]
+
+    def _truncate(self, text: str, budget: int) -> str:
+        # cut by the character ratio first, then trim until it fits
+        tokens = self.count_tokens(text)
+        cut = text[:max(int(len(text) * budget / tokens), 1)]
+        while cut and self.count_tokens(cut) > budget:
+            cut = cut[:int(len(cut) * 0.9)]
+        return cut
+
+    def pack(self, documents: Sequence[Document]) -> List[Document]:
+        by_file = {}
+        for rank, doc in enumerate(documents):
+            start = doc.metadata.get("start_index")
+            block = _Block(
+                file_path=doc.metadata.get("file_path", ""),
+                start=int(start) if start is not None else None,
+                text=doc.page_content,
+                rank=rank,
+                metadata=dict(doc.metadata),
+            )
+            by_file.setdefault(block.file_path, []).append(block)
+        blocks = [block for file_blocks in by_file.values() for block in self._merge(file_blocks)]
+        blocks.sort(key=lambda b: b.rank)
+
+        packed: List[Document] = []
+        seen = set()
+        used = duplicates = 0
+        input_tokens = sum(self.count_tokens(doc.page_content) for doc in documents)
+        for block in blocks:
+            digest = hashlib.sha1(" ".join(block.text.split()).encode("utf-8")).hexdigest()
+            if digest in seen:
+                duplicates += 1
+                continue
+            seen.add(digest)
+            remaining = self.max_tokens - used
+            tokens = self.count_tokens(block.text)
+            text = block.text
+            if tokens > remaining:
+                if remaining < self.min_tokens:
+                    break
+                text = self._truncate(text, remaining)
+                tokens = self.count_tokens(text)
+            used += tokens
+            packed.append(Document(page_content=text, metadata={**block.metadata, "start_index": block.start}))
+        logger.info(
+            f"Packed {len(documents)} chunks ({input_tokens} tokens) into {len(packed)} spans ({used} tokens), "
+            f"{duplicates} duplicates removed"
+        )
+        return packed
@@ -1,29 +1,29 @@
 import os
-import uuid
+import re
+import time
 import torch
-import datetime
 import logging
+import tracing
 from dataclasses import dataclass
-from typing import Sequence, Optional
+from typing import AsyncIterator, Callable, Optional, Sequence
 from langchain.schema import Document
-from qdrant_client import QdrantClient
 from langchain_ollama import ChatOllama
-from minima_embed import MinimaEmbeddings
 from langgraph.graph import START, StateGraph
-from langchain_qdrant import QdrantVectorStore
+from retriever import ShardedQdrantRetriever
 from langchain_core.messages import BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_core.output_parsers import StrOutputParser
 from langgraph.graph.message import add_messages
 from typing_extensions import Annotated, TypedDict
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.messages import AIMessage, HumanMessage
-from langchain.chains.retrieval import create_retrieval_chain
 from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import CrossEncoderReranker
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain_community.cross_encoders.huggingface import HuggingFaceCrossEncoder
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
+from langchain_community.cross_encoders.base import BaseCrossEncoder
+from reranker import RerankEngine, ScoreCache
+from context_packer import ContextPacker
+from tokens import approximate_tokens
+from answer_cache import AnswerCache, CachedAnswer, CacheProbe
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +54,32 @@ QUERY_ENHANCEMENT_PROMPT = (
     "Do not change the original meaning of the question and do not add any additional information."
 )
 
+COMBINED_REWRITE_PROMPT = (
+    "You are an expert at converting user questions into search queries over a user's files. "
+    "Given a chat history and the latest user question, which might reference the chat history, "
+    "formulate one standalone query that can be understood without the chat history "
+    "and expand it with closely related terms. "
+    "If there are acronyms or words you are not familiar with, do not try to rephrase them. "
+    "Do NOT answer the question, just return the query and do not add any other text."
+)
+
+# full:     always expand the query, rewrite it against the chat history when there is one
+# fast:     only expand real questions, short and keyword queries are searched as typed
+# combined: one LLM call expands and rewrites against the chat history, when either is needed
+PIPELINE_FULL = "full"
+PIPELINE_FAST = "fast"
+PIPELINE_COMBINED = "combined"
+PIPELINE_MODES = (PIPELINE_FULL, PIPELINE_FAST, PIPELINE_COMBINED)
+
+QUESTION_WORDS = {
+    "what", "why", "how", "when", "where", "who", "whom", "whose", "which",
+    "is", "are", "was", "were", "do", "does", "did", "can", "could", "should", "would",
+    "explain", "describe", "summarize", "summarise", "compare", "list", "tell",
+}
+
+# marks the answering LLM call, whose tokens are streamed to the client
+ANSWER_TAG = "answer"
+
 class ParaphrasedQuery(BaseModel):
     paraphrased_query: str = Field(
         ...,
@@ -69,6 +95,40 @@ class LLMConfig:
     ollama_model: str = os.environ.get("OLLAMA_MODEL")
     rerank_model: str = os.environ.get("RERANKER_MODEL")
     temperature: float = 0.5
+    # how long Ollama keeps the model loaded after a request
+    ollama_keep_alive: str = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+    warmup_timeout_seconds: float = float(os.environ.get("WARMUP_TIMEOUT_SECONDS", 600))
+    pipeline_mode: str = os.environ.get("PIPELINE_MODE", PIPELINE_FULL)
+    # queries with fewer words are treated as keyword queries in the fast and combined modes
+    enhance_min_words: int = int(os.environ.get("ENHANCE_MIN_WORDS", 4))
+    # search the question as typed while the LLM rewrites it, and rerank both candidate sets
+    overlap_retrieval: bool = os.environ.get("OVERLAP_RETRIEVAL", "false").lower() == "true"
+    # retrieved candidates scored by the cross-encoder, and how many of them reach the prompt
+    rerank_candidates: int = int(os.environ.get("RERANK_CANDIDATES", 10))
+    rerank_top_n: int = int(os.environ.get("RERANK_TOP_N", 3))
+    rerank_batch_size: int = int(os.environ.get("RERANK_BATCH_SIZE", 16))
+    rerank_cache_size: int = int(os.environ.get("RERANK_CACHE_SIZE", 10000))
+    # 0 disables the budget
+    rerank_budget_ms: float = float(os.environ.get("RERANK_BUDGET_MS", 0))
+    rerank_backend: str = os.environ.get("RERANK_BACKEND", "torch")
+    rerank_onnx_dir: str = os.environ.get("RERANK_ONNX_DIR", "/root/.cache/minima/onnx")
+    answer_cache_enabled: bool = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    # cosine similarity between two questions for them to share an answer
+    answer_cache_threshold: float = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.92))
+    answer_cache_size: int = int(os.environ.get("ANSWER_CACHE_SIZE", 1000))
+    answer_cache_ttl_seconds: float = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 86400))
+    # token budget of the retrieved context in the prompt, counted with the CONTEXT_TOKENIZER
+    # Hugging Face tokenizer, by default the reranker's
+    context_max_tokens: int = int(os.environ.get("CONTEXT_MAX_TOKENS", 2000))
+    context_tokenizer: str = os.environ.get("CONTEXT_TOKENIZER", os.environ.get("RERANKER_MODEL"))
+    # questions answered at the same time across all connections, match Ollama's OLLAMA_NUM_PARALLEL
+    max_concurrent_generations: int = int(os.environ.get("MAX_CONCURRENT_GENERATIONS", 2))
+    max_waiting_questions: int = int(os.environ.get("MAX_WAITING_QUESTIONS", 32))
+    # chat history each websocket session keeps and sends with its questions
+    history_max_turns: int = int(os.environ.get("HISTORY_MAX_TURNS", 6))
+    history_max_tokens: int = int(os.environ.get("HISTORY_MAX_TOKENS", 1500))
+    session_idle_seconds: float = float(os.environ.get("SESSION_IDLE_SECONDS", 1800))
+    max_sessions: int = int(os.environ.get("MAX_SESSIONS", 200))
     device: torch.device = torch.device(
         "mps" if torch.backends.mps.is_available() else
         "cuda" if torch.cuda.is_available() else
@@ -82,6 +142,21 @@ class LocalConfig:
     CONTAINER_PATH = os.environ.get("CONTAINER_PATH")
 
 
+# stages that run before retrieval, on the critical path unless overlapped with raw retrieval
+@dataclass
+class CacheLookup:
+    """Answer cache result for one question: the cached answer or None, and the probe to store a new answer with"""
+    result: Optional[dict]
+    probe: Optional[CacheProbe]
+
+
+REWRITE_STAGES = ("enhance", "history_rewrite", "rewrite")
+
+
+def _merge_timings(current: dict, update: dict) -> dict:
+    return {**(current or {}), **(update or {})}
+
+
 class State(TypedDict):
     """State definition for the LLM Chain"""
     input: str
@@ -89,60 +164,70 @@ class State(TypedDict):
     context: str
     answer: str
     init_query: str
+    search_query: str
+    raw_candidates: list
+    # parallel nodes report their timings in the same step
+    timings: Annotated[dict, _merge_timings]
 
 
 class LLMChain:
     """A chain for processing LLM queries with context awareness and retrieval capabilities"""
 
-    def __init__(self, config: Optional[LLMConfig] = None):
-        """Initialize the LLM Chain with optional custom configuration"""
+    def __init__(
+            self,
+            config: LLMConfig,
+            llm: ChatOllama,
+            reranker: BaseCrossEncoder,
+            retriever: ShardedQdrantRetriever,
+            answer_cache: Optional[AnswerCache] = None,
+            count_tokens: Callable[[str], int] = approximate_tokens,
+    ):
+        """Build the chain and graph around models shared through the Registry"""
         self.localConfig = LocalConfig()
-        self.config = config or LLMConfig()
-        self.llm = self._setup_llm()
-        self.document_store = self._setup_document_store()
+        self.config = config
+        self.llm = llm
+        self.reranker = reranker
+        self.retriever = retriever
+        self.answer_cache = answer_cache
+        self.count_tokens = count_tokens
         self.chain = self._setup_chain()
         self.graph = self._create_graph()
 
-    def _setup_llm(self) -> ChatOllama:
-        """Initialize the LLM model"""
-        return ChatOllama(
-            base_url=self.config.ollama_url,
-            model=self.config.ollama_model,
-            temperature=self.config.temperature
-        )
-
-    def _setup_document_store(self) -> QdrantVectorStore:
-        """Initialize the document store with vector embeddings"""
-        qdrant = QdrantClient(host=self.config.qdrant_host)
-        embed_model = MinimaEmbeddings()
-        return QdrantVectorStore(
-            client=qdrant,
-            collection_name=self.config.qdrant_collection,
-            embedding=embed_model
-        )
-
     def _setup_chain(self):
-        """Set up the retrieval and QA chain"""
+        """Set up the query rewriting, reranking retrieval and QA chains"""
+        if self.config.pipeline_mode not in PIPELINE_MODES:
+            raise ValueError(f"Unsupported PIPELINE_MODE: {self.config.pipeline_mode}, expected one of {PIPELINE_MODES}")
+
         # Initialize retriever with reranking
-        base_retriever = self.document_store.as_retriever()
-        reranker = HuggingFaceCrossEncoder(
-            model_name=self.config.rerank_model,
-            model_kwargs={'device': self.config.device},
+        self.rerank_engine = RerankEngine(
+            model=self.reranker,
+            top_n=self.config.rerank_top_n,
+            candidates=self.config.rerank_candidates,
+            batch_size=self.config.rerank_batch_size,
+            budget_ms=self.config.rerank_budget_ms,
+            cache=ScoreCache(self.config.rerank_cache_size)
         )
-        compression_retriever = ContextualCompressionRetriever(
-            base_compressor=CrossEncoderReranker(model=reranker, top_n=3),
-            base_retriever=base_retriever
+        self.compression_retriever = ContextualCompressionRetriever(
+            base_compressor=self.rerank_engine,
+            base_retriever=self.retriever
         )
 
-        # Create history-aware retriever
-        contextualize_prompt = ChatPromptTemplate.from_messages([
+        self.context_packer = ContextPacker(self.count_tokens, self.config.context_max_tokens)
+
+        self.enhance_chain = ChatPromptTemplate.from_messages([
+            ("system", QUERY_ENHANCEMENT_PROMPT),
+            ("human", "{input}"),
+        ]) | self.llm | StrOutputParser()
+        self.history_rewrite_chain = ChatPromptTemplate.from_messages([
             ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
-        ])
-        history_aware_retriever = create_history_aware_retriever(
-            self.llm, compression_retriever, contextualize_prompt
-        )
+        ]) | self.llm | StrOutputParser()
+        self.combined_rewrite_chain = ChatPromptTemplate.from_messages([
+            ("system", COMBINED_REWRITE_PROMPT),
+            MessagesPlaceholder("chat_history"),
+            ("human", "{input}"),
+        ]) | self.llm | StrOutputParser()
 
         # Create QA chain
         qa_prompt = ChatPromptTemplate.from_messages([
@@ -150,82 +235,235 @@ class LLMChain:
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ])
-        qa_chain = create_stuff_documents_chain(self.llm, qa_prompt)
-        retrieval_chain = create_retrieval_chain(history_aware_retriever, qa_chain)
-
-        return retrieval_chain
+        return create_stuff_documents_chain(self.llm.with_config(tags=[ANSWER_TAG]), qa_prompt)
 
     def _create_graph(self) -> StateGraph:
         """Create the processing graph"""
         workflow = StateGraph(state_schema=State)
-        workflow.add_node("enhance", self._enhance_query)
+        workflow.add_node("rewrite", self._rewrite_query)
         workflow.add_node("retrieval", self._call_model)
-        workflow.add_edge(START, "enhance")
-        workflow.add_edge("enhance", "retrieval")
-        return workflow.compile(checkpointer=MemorySaver())
+        workflow.add_edge(START, "rewrite")
+        if self.config.overlap_retrieval:
+            workflow.add_node("raw_retrieval", self._raw_retrieval)
+            workflow.add_edge(START, "raw_retrieval")
+            workflow.add_edge(["rewrite", "raw_retrieval"], "retrieval")
+        else:
+            workflow.add_edge("rewrite", "retrieval")
+        # no checkpointer, the chat history comes with every call from the ChatSession
+        return workflow.compile()
 
-    def _enhance_query(self, state: State) -> str:
-        """Enhance the query using the LLM"""
-        prompt_enhancement = ChatPromptTemplate.from_messages([
-            ("system", QUERY_ENHANCEMENT_PROMPT),
-            ("human", "{input}"),
-        ])
-        query_enhancement = prompt_enhancement | self.llm
-        enhanced_query = query_enhancement.invoke({
-            "input": state["input"]
-        })
-        logger.info(f"Enhanced query: {enhanced_query}")
-        state["init_query"] = state["input"]
-        state["input"] = enhanced_query.content
-        return state
-
-    def _call_model(self, state: State) -> dict:
-        """Process the query through the model"""
+    def _needs_enhancement(self, query: str) -> bool:
+        """Short and keyword queries are searched as typed, only questions get expanded"""
+        words = re.findall(r"\w+", query.lower())
+        if len(words) < self.config.enhance_min_words:
+            return False
+        return query.strip().endswith("?") or any(word in QUESTION_WORDS for word in words)
+
+    @staticmethod
+    async def _timed(timings: dict, stage: str, awaitable):
+        start = time.perf_counter()
+        with tracing.span(stage):
+            result = await awaitable
+        timings[stage] = round(time.perf_counter() - start, 3)
+        return result
+
+    async def _rewrite_query(self, state: State, config: RunnableConfig) -> dict:
+        """Turn the question into a search query with as few LLM calls as the pipeline mode allows"""
+        query = state["input"]
+        history = state.get("chat_history") or []
+        mode = self.config.pipeline_mode
+        timings = {}
+        question = search_query = query
+        if mode == PIPELINE_COMBINED:
+            if history or self._needs_enhancement(query):
+                search_query = await self._timed(timings, "rewrite", self.combined_rewrite_chain.ainvoke(
+                    {"input": query, "chat_history": history}, config=config
+                ))
+        else:
+            if mode == PIPELINE_FULL or self._needs_enhancement(query):
+                question = search_query = await self._timed(timings, "enhance", self.enhance_chain.ainvoke(
+                    {"input": query}, config=config
+                ))
+            # without history there is nothing to resolve
+            if history:
+                search_query = await self._timed(timings, "history_rewrite", self.history_rewrite_chain.ainvoke(
+                    {"input": question, "chat_history": history}, config=config
+                ))
+        logger.info(f"Pipeline {mode}: {query} -> {search_query}")
+        return {"init_query": query, "input": question, "search_query": search_query, "timings": timings}
+
+    async def _raw_retrieval(self, state: State, config: RunnableConfig) -> dict:
+        """Search the question as typed, concurrently with the rewrite"""
+        timings = {}
+        candidates = await self._timed(timings, "raw_retrieval", self.retriever.ainvoke(state["input"], config=config))
+        return {"raw_candidates": candidates, "timings": timings}
+
+    @staticmethod
+    def _merge_candidates(*candidate_lists: Sequence[Document]) -> list:
+        """Interleave the candidate lists, so each keeps its best hits within the rerank candidate count"""
+        merged, seen = [], set()
+        for rank in range(max((len(candidates) for candidates in candidate_lists), default=0)):
+            for candidates in candidate_lists:
+                if rank < len(candidates):
+                    doc = candidates[rank]
+                    key = str(doc.metadata.get("_id", doc.page_content))
+                    if key not in seen:
+                        seen.add(key)
+                        merged.append(doc)
+        return merged
+
+    async def _retrieve_overlapped(self, state: State, config: RunnableConfig, timings: dict) -> list:
+        raw_candidates = state.get("raw_candidates") or []
+        candidates = raw_candidates
+        if state["search_query"] != state["init_query"]:
+            rewritten_candidates = await self._timed(timings, "retrieval", self.retriever.ainvoke(
+                state["search_query"], config=config
+            ))
+            candidates = self._merge_candidates(rewritten_candidates, raw_candidates)
+        return await self._timed(timings, "rerank", self.rerank_engine.acompress_documents(
+            candidates, state["search_query"]
+        ))
+
+    @staticmethod
+    def _total(timings: dict) -> float:
+        """Critical path: the raw retrieval only adds the time it outlasts the rewrite"""
+        rewrite = sum(timings.get(stage, 0) for stage in REWRITE_STAGES)
+        sequential = sum(seconds for stage, seconds in timings.items() if stage not in REWRITE_STAGES + ("raw_retrieval",))
+        return round(sequential + max(rewrite, timings.get("raw_retrieval", 0)), 3)
+
+    async def _call_model(self, state: State, config: RunnableConfig) -> dict:
+        """Retrieve and rerank context for the search query, then answer"""
         logger.info(f"Processing query: {state['init_query']}")
-        logger.info(f"Enhanced query: {state['input']}")
-        response = self.chain.invoke(state)
-        logger.info(f"Received response: {response['answer']}")
+        logger.info(f"Search query: {state['search_query']}")
+        timings = dict(state.get("timings") or {})
+        if self.config.overlap_retrieval:
+            context = await self._retrieve_overlapped(state, config, timings)
+        else:
+            context = await self._timed(timings, "retrieval", self.compression_retriever.ainvoke(
+                state["search_query"], config=config
+            ))
+        start = time.perf_counter()
+        context = self.context_packer.pack(context)
+        timings["pack"] = round(time.perf_counter() - start, 3)
+        answer = await self._timed(timings, "answer", self.chain.ainvoke({
+            "input": state["input"],
+            "chat_history": state.get("chat_history") or [],
+            "context": context,
+        }, config=config))
+        timings["total"] = self._total(timings)
+        logger.info(f"Received response: {answer}")
+        logger.info(f"Stage timings: {timings}")
         return {
-            "chat_history": [
-                HumanMessage(state["init_query"]),
-                AIMessage(response["answer"]),
-            ],
-            "context": response["context"],
-            "answer": response["answer"],
+            "context": context,
+            "answer": answer,
+            "timings": timings,
         }
     
-    def invoke(self, message: str) -> dict:
+    def _links(self, context: Sequence[Document]) -> set:
+        links = set()
+        for doc in context:
+            path = doc.metadata["file_path"].replace(
+                self.localConfig.CONTAINER_PATH,
+                self.localConfig.LOCAL_FILES_PATH
+            )
+            links.add(f"file://{path}")
+        return links
+
+    async def _cache_lookup(self, message: str, chat_history: Sequence[BaseMessage]) -> tuple[Optional[CachedAnswer], Optional[CacheProbe]]:
+        """Only questions without chat history are standalone, so only they are answered from the cache"""
+        if self.answer_cache is None or chat_history:
+            return None, None
+        try:
+            return await self.answer_cache.lookup(message)
+        except Exception as e:
+            logger.error(f"Answer cache lookup failed: {e}")
+            return None, None
+
+    def _cached_result(self, entry: CachedAnswer, start: float) -> dict:
+        seconds = round(time.perf_counter() - start, 3)
+        return {
+            "answer": entry.answer,
+            "links": self._links(entry.context),
+            "timings": {"cache": seconds, "total": seconds},
+            "cached": True,
+        }
+
+    async def lookup(self, message: str, chat_history: Sequence[BaseMessage] = ()) -> CacheLookup:
+        """Check the answer cache without generating, so a hit needs no generation slot"""
+        start = time.perf_counter()
+        entry, probe = await self._cache_lookup(message, chat_history)
+        return CacheLookup(result=self._cached_result(entry, start) if entry is not None else None, probe=probe)
+
+    async def _cache_store(self, message: str, probe: Optional[CacheProbe], result: dict) -> None:
+        if probe is None:
+            return
+        try:
+            await self.answer_cache.store(message, probe, result["answer"], result["context"], result["timings"]["total"])
+        except Exception as e:
+            logger.error(f"Answer cache store failed: {e}")
+
+    async def ainvoke(self, message: str, chat_history: Sequence[BaseMessage] = ()) -> dict:
         """
         Process a user message and return the response
         
         Args:
             message: The user's input message
+            chat_history: Earlier questions and answers of the conversation
             
         Returns:
             dict: Contains the model's response or error information
         """
         try:
             logger.info(f"Processing query: {message}")
-            config = {
-                "configurable": {
-                    "thread_id": uuid.uuid4(),
-                    "thread_ts": datetime.datetime.now().isoformat()
-                }   
-            }
-            result = self.graph.invoke(
-                {"input": message},
-                config=config
-            )
+            start = time.perf_counter()
+            entry, probe = await self._cache_lookup(message, chat_history)
+            if entry is not None:
+                return self._cached_result(entry, start)
+            result = await self.graph.ainvoke({"input": message, "chat_history": list(chat_history)})
             logger.info(f"OUTPUT: {result}")
-            links = set()
-            for ctx in result["context"]:
-                doc: Document = ctx
-                path = doc.metadata["file_path"].replace(
-                    self.localConfig.CONTAINER_PATH,
-                    self.localConfig.LOCAL_FILES_PATH
-                )
-                links.add(f"file://{path}")
-            return {"answer": result["answer"], "links": links}
+            await self._cache_store(message, probe, result)
+            return {"answer": result["answer"], "links": self._links(result["context"]), "timings": result["timings"]}
         except Exception as e:
             logger.error(f"Error processing query", exc_info=True)
-            return {"error": str(e), "status": "error"}
\ No newline at end of file
+            return {"error": str(e), "status": "error"}
+
+    async def astream(
+            self,
+            message: str,
+            chat_history: Sequence[BaseMessage] = (),
+            lookup: Optional[CacheLookup] = None,
+    ) -> AsyncIterator[dict]:
+        """
+        Process a user message, streaming the answer as it is generated
+
+        Args:
+            lookup: Result of an earlier lookup() of the same message, the cache is checked otherwise
+
+        Yields:
+            dict: {"delta": text} for every answer token, then {"answer": ..., "links": ..., "timings": ...},
+                  or {"error": ...} when processing fails
+        """
+        try:
+            logger.info(f"Streaming query: {message}")
+            if lookup is None:
+                lookup = await self.lookup(message, chat_history)
+            if lookup.result is not None:
+                yield lookup.result
+                return
+            probe = lookup.probe
+            result = None
+            async for event in self.graph.astream_events(
+                    {"input": message, "chat_history": list(chat_history)}, version="v2"
+            ):
+                if event["event"] == "on_chat_model_stream" and ANSWER_TAG in event.get("tags", []):
+                    text = event["data"]["chunk"].content
+                    if text:
+                        yield {"delta": text}
+                elif event["event"] == "on_chain_end" and not event.get("parent_ids"):
+                    result = event["data"]["output"]
+            logger.info(f"OUTPUT: {result}")
+            await self._cache_store(message, probe, result)
+            yield {"answer": result["answer"], "links": self._links(result["context"]), "timings": result["timings"]}
+        except Exception as e:
+            logger.error(f"Error streaming query", exc_info=True)
+            yield {"error": str(e), "status": "error"}
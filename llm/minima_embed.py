@@ -1,49 +1,121 @@
-import requests
+import os
+import time
+import httpx
+import asyncio
 import logging
-from typing import Any, List
-from pydantic import BaseModel
+import tracing
+from typing import Any, List, Optional
+from pydantic import BaseModel, PrivateAttr
 from langchain_core.embeddings import Embeddings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-REQUEST_DATA_URL = "http://indexer:8000/embedding"
+INDEXER_URL = os.environ.get("INDEXER_URL", "http://indexer:8000")
+REQUEST_DATA_URL = INDEXER_URL + "/embedding"
+REQUEST_BATCH_URL = INDEXER_URL + "/embedding/batch"
 REQUEST_HEADERS = {
     'Accept': 'application/json',
     'Content-Type': 'application/json'
 }
 
+class EmbeddingError(Exception):
+    pass
+
 class MinimaEmbeddings(BaseModel, Embeddings):
+    """
+    Embeddings computed by the indexer
+
+    Texts are sent in batches of batch_size to /embedding/batch, over clients that keep
+    their connections alive. Timeouts, connection errors and 5xx responses are retried
+    with exponential backoff, an error is raised once retries are exhausted so callers
+    never get fewer vectors than texts.
+    """
+
+    batch_size: int = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+    timeout: float = float(os.environ.get("EMBEDDING_TIMEOUT", 30))
+    retries: int = int(os.environ.get("EMBEDDING_RETRIES", 3))
+    backoff: float = 0.5
+    max_connections: int = 10
+
+    _client: Optional[httpx.Client] = PrivateAttr(default=None)
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
 
     def __init__(self, **kwargs: Any):
         super().__init__(**kwargs)
 
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+    @property
+    def client(self) -> httpx.Client:
+        if self._client is None:
+            self._client = httpx.Client(timeout=self.timeout, limits=self._limits(), headers=REQUEST_HEADERS)
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self._limits(), headers=REQUEST_HEADERS)
+        return self._async_client
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError)
+
+    @staticmethod
+    def _result(response: httpx.Response):
+        response.raise_for_status()
+        data = response.json()
+        if "error" in data:
+            raise EmbeddingError(data["error"])
+        return data["result"]
+
+    def _post(self, url: str, payload: dict):
+        for attempt in range(self.retries + 1):
+            try:
+                with tracing.span("embedding.request", url=url, attempt=attempt):
+                    response = self.client.post(url, headers=tracing.trace_headers(), json=payload)
+                return self._result(response)
+            except httpx.HTTPError as e:
+                if attempt == self.retries or not self._retryable(e):
+                    raise EmbeddingError(f"Embedding request to {url} failed: {e}") from e
+                logger.warning(f"Embedding request failed, retrying: {e}")
+                time.sleep(self.backoff * 2 ** attempt)
+
+    async def _apost(self, url: str, payload: dict):
+        for attempt in range(self.retries + 1):
+            try:
+                with tracing.span("embedding.request", url=url, attempt=attempt):
+                    response = await self.async_client.post(url, headers=tracing.trace_headers(), json=payload)
+                return self._result(response)
+            except httpx.HTTPError as e:
+                if attempt == self.retries or not self._retryable(e):
+                    raise EmbeddingError(f"Embedding request to {url} failed: {e}") from e
+                logger.warning(f"Embedding request failed, retrying: {e}")
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
         results = []
-        for text in texts:
-            embedding = self.request_data(text)
-            if "error" in embedding:
-                logger.error(f"Error in embedding: {embedding['error']}")
-            else:
-                embedding = embedding["result"]
-                results.append(embedding)
+        for batch in self._batches(texts):
+            results.extend(self._post(REQUEST_BATCH_URL, {"texts": batch}))
+        logger.info(f"Embedded {len(texts)} texts in {time.perf_counter() - start:.3f}s")
         return results
 
     def embed_query(self, text: str) -> list[float]:
-        return self.embed_documents([text])[0]
-
-    def request_data(self, query):
-        payload = {
-            "query": query
-        }
-        try:
-            logger.info(f"Requesting data from indexer with query: {query}")
-            response = requests.post(REQUEST_DATA_URL, headers=REQUEST_HEADERS, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            logger.info(f"Received data: {data}")
-            return data
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"HTTP error: {e}")
-            return {"error": str(e)}
\ No newline at end of file
+        return self._post(REQUEST_DATA_URL, {"query": text})
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        start = time.perf_counter()
+        batches = await asyncio.gather(*(self._apost(REQUEST_BATCH_URL, {"texts": batch}) for batch in self._batches(texts)))
+        logger.info(f"Embedded {len(texts)} texts in {time.perf_counter() - start:.3f}s")
+        return [vector for batch in batches for vector in batch]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return await self._apost(REQUEST_DATA_URL, {"query": text})
@@ -0,0 +1,134 @@
+import time
+import logging
+import threading
+from typing import Callable, Dict, Optional
+
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from langchain_ollama import ChatOllama
+from minima_embed import MinimaEmbeddings
+from answer_cache import AnswerCache
+from retriever import ShardSearcher, ShardedQdrantRetriever
+from langchain_community.cross_encoders.base import BaseCrossEncoder
+from langchain_community.cross_encoders.huggingface import HuggingFaceCrossEncoder
+from reranker import BACKEND_ONNX, BACKENDS, OnnxCrossEncoder
+
+from singleton import Singleton
+from llm_chain import LLMChain, LLMConfig
+from session_store import SessionStore
+from scheduler import GenerationScheduler
+from tokens import load_token_counter
+
+logger = logging.getLogger(__name__)
+
+
+class Registry(metaclass=Singleton):
+    """
+    Process-wide models and clients, loaded once and shared by every websocket session
+
+    Each instance is created on first use, under a lock so concurrent sessions never load
+    the same model twice. load_all() loads everything up front, at startup.
+    """
+
+    def __init__(self, config: Optional[LLMConfig] = None):
+        self.config = config or LLMConfig()
+        self.lock = threading.RLock()
+        self.instances: Dict[str, object] = {}
+        self.load_seconds: Dict[str, float] = {}
+
+    def _get(self, name: str, factory: Callable[[], object]):
+        with self.lock:
+            if name not in self.instances:
+                start = time.perf_counter()
+                self.instances[name] = factory()
+                self.load_seconds[name] = round(time.perf_counter() - start, 3)
+                logger.info(f"Loaded {name} in {self.load_seconds[name]}s")
+            return self.instances[name]
+
+    @property
+    def llm(self) -> ChatOllama:
+        return self._get("llm", lambda: ChatOllama(
+            base_url=self.config.ollama_url,
+            model=self.config.ollama_model,
+            temperature=self.config.temperature,
+            keep_alive=self.config.ollama_keep_alive
+        ))
+
+    @property
+    def reranker(self) -> BaseCrossEncoder:
+        def create():
+            if self.config.rerank_backend not in BACKENDS:
+                raise ValueError(f"Unsupported RERANK_BACKEND: {self.config.rerank_backend}, expected one of {BACKENDS}")
+            if self.config.rerank_backend == BACKEND_ONNX:
+                try:
+                    return OnnxCrossEncoder(self.config.rerank_model, self.config.rerank_onnx_dir)
+                except ImportError as e:
+                    logger.warning(f"ONNX reranker unavailable ({e}), install optimum[onnxruntime]; using torch")
+            return HuggingFaceCrossEncoder(
+                model_name=self.config.rerank_model,
+                model_kwargs={'device': self.config.device},
+            )
+        return self._get("reranker", create)
+
+    @property
+    def embeddings(self) -> MinimaEmbeddings:
+        return self._get("embeddings", MinimaEmbeddings)
+
+    @property
+    def answer_cache(self) -> Optional[AnswerCache]:
+        if not self.config.answer_cache_enabled:
+            return None
+        return self._get("answer_cache", lambda: AnswerCache(
+            embeddings=self.embeddings,
+            threshold=self.config.answer_cache_threshold,
+            max_entries=self.config.answer_cache_size,
+            ttl_seconds=self.config.answer_cache_ttl_seconds
+        ))
+
+    @property
+    def retriever(self) -> ShardedQdrantRetriever:
+        def create():
+            searcher = ShardSearcher(
+                client=QdrantClient(host=self.config.qdrant_host),
+                embeddings=self.embeddings,
+                base_collection=self.config.qdrant_collection,
+                async_client=AsyncQdrantClient(host=self.config.qdrant_host)
+            )
+            return ShardedQdrantRetriever(searcher=searcher, k=self.config.rerank_candidates)
+        return self._get("retriever", create)
+
+    @property
+    def llm_chain(self) -> LLMChain:
+        return self._get("llm_chain", lambda: LLMChain(
+            config=self.config,
+            llm=self.llm,
+            reranker=self.reranker,
+            retriever=self.retriever,
+            answer_cache=self.answer_cache,
+            count_tokens=self.token_counter
+        ))
+
+    @property
+    def scheduler(self) -> GenerationScheduler:
+        return self._get("scheduler", lambda: GenerationScheduler(
+            max_concurrent=self.config.max_concurrent_generations,
+            max_queue=self.config.max_waiting_questions
+        ))
+
+    @property
+    def token_counter(self) -> Callable[[str], int]:
+        return self._get("token_counter", lambda: load_token_counter(self.config.context_tokenizer))
+
+    @property
+    def session_store(self) -> SessionStore:
+        return self._get("session_store", lambda: SessionStore(
+            llm_chain=self.llm_chain,
+            max_sessions=self.config.max_sessions,
+            idle_seconds=self.config.session_idle_seconds,
+            max_turns=self.config.history_max_turns,
+            max_tokens=self.config.history_max_tokens,
+            count_tokens=self.token_counter
+        ))
+
+    def load_all(self) -> Dict[str, float]:
+        self.session_store
+        return dict(self.load_seconds)
@@ -0,0 +1,168 @@
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain.schema import Document
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor
+from langchain_community.cross_encoders.base import BaseCrossEncoder
+
+logger = logging.getLogger(__name__)
+
+BACKEND_TORCH = "torch"
+BACKEND_ONNX = "onnx"
+BACKENDS = (BACKEND_TORCH, BACKEND_ONNX)
+
+
+class ScoreCache:
+    """LRU of cross-encoder scores keyed by (query hash, chunk ID)"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.scores: OrderedDict[Tuple[str, str], float] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def query_key(query: str) -> str:
+        return hashlib.sha1(query.encode("utf-8")).hexdigest()
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self.lock:
+            score = self.scores.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self.scores.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key: Tuple[str, str], score: float) -> None:
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.scores[key] = score
+            self.scores.move_to_end(key)
+            while len(self.scores) > self.max_size:
+                self.scores.popitem(last=False)
+
+    def stats(self) -> Dict[str, any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.scores),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+class OnnxCrossEncoder(BaseCrossEncoder):
+    """
+    Cross-encoder exported to ONNX and dynamically quantized to int8, for CPU inference
+
+    The exported and quantized model is kept in cache_dir so the export only runs once.
+    Needs optimum[onnxruntime].
+    """
+
+    def __init__(self, model_name: str, cache_dir: str, max_length: int = 512):
+        import os
+        from transformers import AutoTokenizer
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        model_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        quantized_dir = os.path.join(model_dir, "int8")
+        if not os.path.isdir(quantized_dir):
+            logger.info(f"Exporting {model_name} to ONNX int8 in {quantized_dir}")
+            model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+            model.save_pretrained(model_dir)
+            quantizer = ORTQuantizer.from_pretrained(model_dir)
+            quantizer.quantize(save_dir=quantized_dir, quantization_config=AutoQuantizationConfig.avx2(is_static=False))
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(quantized_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(quantized_dir)
+        self.model = ORTModelForSequenceClassification.from_pretrained(quantized_dir, file_name="model_quantized.onnx")
+        self.max_length = max_length
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        features = self.tokenizer(
+            [pair[0] for pair in text_pairs],
+            [pair[1] for pair in text_pairs],
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="pt"
+        )
+        logits = self.model(**features).logits
+        # same convention as HuggingFaceCrossEncoder: one logit per pair, or the positive class
+        scores = logits[:, 0] if logits.shape[1] == 1 else logits[:, 1]
+        return scores.tolist()
+
+
+class RerankEngine(BaseDocumentCompressor):
+    """
+    Cross-encoder reranking with a score cache, batching and a latency budget
+
+    Only the first `candidates` retrieved documents are scored, in batches of `batch_size`.
+    Scores are cached per (query, chunk), so follow-up questions that retrieve the same
+    chunks for the same search query do not pay for them again. Once scoring has taken
+    longer than budget_ms, the remaining unscored candidates are dropped rather than
+    delaying the answer; at least one batch is always scored.
+    """
+
+    model: BaseCrossEncoder
+    top_n: int = 3
+    candidates: int = 20
+    batch_size: int = 16
+    budget_ms: float = 0
+    cache: ScoreCache
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @staticmethod
+    def _chunk_id(doc: Document) -> str:
+        if "_id" in doc.metadata:
+            return str(doc.metadata["_id"])
+        return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+    def rerank(self, query: str, documents: Sequence[Document]) -> List[Tuple[Document, float]]:
+        start = time.perf_counter()
+        documents = list(documents)[:self.candidates]
+        query_key = ScoreCache.query_key(query)
+        keys = [(query_key, self._chunk_id(doc)) for doc in documents]
+        scores: Dict[int, float] = {}
+        for i, key in enumerate(keys):
+            score = self.cache.get(key)
+            if score is not None:
+                scores[i] = score
+        pending = [i for i in range(len(documents)) if i not in scores]
+        truncated = 0
+        for offset in range(0, len(pending), self.batch_size):
+            if offset and self.budget_ms and (time.perf_counter() - start) * 1000 > self.budget_ms:
+                truncated = len(pending) - offset
+                break
+            batch = pending[offset:offset + self.batch_size]
+            batch_scores = self.model.score([(query, documents[i].page_content) for i in batch])
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self.cache.put(keys[i], float(score))
+        ranked = sorted(((documents[i], score) for i, score in scores.items()), key=lambda hit: hit[1], reverse=True)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(
+            f"Reranked {len(scores)} of {len(documents)} candidates in {elapsed_ms}ms, "
+            f"{len(documents) - len(pending)} cached, {truncated} dropped over budget"
+        )
+        return ranked[:self.top_n]
+
+    def compress_documents(
+            self,
+            documents: Sequence[Document],
+            query: str,
+            callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        return [doc for doc, _score in self.rerank(query, documents)]
@@ -0,0 +1,183 @@
+import os
+import time
+import httpx
+import asyncio
+import logging
+import requests
+import threading
+from typing import Any, Callable, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain.schema import Document
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from langchain_qdrant import QdrantVectorStore
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+
+logger = logging.getLogger(__name__)
+
+CHUNKS_URL = os.environ.get("INDEXER_URL", "http://indexer:8000") + "/chunks"
+REQUEST_HEADERS = {
+    'Accept': 'application/json',
+    'Content-Type': 'application/json'
+}
+
+
+def hydrate_from_indexer(documents: List[Document]) -> List[Document]:
+    """Fetch the text of chunks indexed with a minimal payload from the indexer's chunk store"""
+    missing = [str(doc.metadata["_id"]) for doc in documents if not doc.page_content and "_id" in doc.metadata]
+    if not missing:
+        return documents
+    try:
+        response = requests.post(CHUNKS_URL, headers=REQUEST_HEADERS, json={"ids": missing}, timeout=10)
+        response.raise_for_status()
+        stored = response.json().get("result", {})
+    except requests.exceptions.RequestException as e:
+        logger.error(f"HTTP error while hydrating chunks: {e}")
+        return documents
+    return _apply_chunks(documents, stored)
+
+
+def _apply_chunks(documents: List[Document], stored: dict) -> List[Document]:
+    for doc in documents:
+        chunk = stored.get(str(doc.metadata.get("_id")))
+        if chunk is not None:
+            doc.page_content = chunk["page_content"]
+            doc.metadata = {**chunk["metadata"], **doc.metadata}
+    return documents
+
+
+async def ahydrate_from_indexer(documents: List[Document], client: httpx.AsyncClient) -> List[Document]:
+    """hydrate_from_indexer on a shared async HTTP client"""
+    missing = [str(doc.metadata["_id"]) for doc in documents if not doc.page_content and "_id" in doc.metadata]
+    if not missing:
+        return documents
+    try:
+        response = await client.post(CHUNKS_URL, headers=REQUEST_HEADERS, json={"ids": missing}, timeout=10)
+        response.raise_for_status()
+        stored = response.json().get("result", {})
+    except httpx.HTTPError as e:
+        logger.error(f"HTTP error while hydrating chunks: {e}")
+        return documents
+    return _apply_chunks(documents, stored)
+
+
+class ShardSearcher:
+    """Searches every collection of a (possibly sharded) index in parallel and merges the top-k"""
+
+    def __init__(
+            self,
+            client: QdrantClient,
+            embeddings: Embeddings,
+            base_collection: str,
+            max_workers: int = 8,
+            cache_seconds: float = 10,
+            hydrate: Optional[Callable[[List[Document]], List[Document]]] = hydrate_from_indexer,
+            async_client: Optional[AsyncQdrantClient] = None,
+    ):
+        self.client = client
+        self.async_client = async_client
+        self.http_client: httpx.AsyncClient | None = None
+        self.embeddings = embeddings
+        self.base_collection = base_collection
+        self.hydrate = hydrate
+        self.cache_seconds = cache_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.stores: dict[str, QdrantVectorStore] = {}
+        self.lock = threading.Lock()
+        self._shards: List[str] | None = None
+        self._shards_cached_at = 0.0
+
+    def _is_shard(self, name: str) -> bool:
+        return name == self.base_collection or name.startswith(f"{self.base_collection}_")
+
+    def shards(self) -> List[str]:
+        now = time.monotonic()
+        if self._shards is None or now - self._shards_cached_at > self.cache_seconds:
+            collections = self.client.get_collections().collections
+            self._shards = sorted(c.name for c in collections if self._is_shard(c.name))
+            self._shards_cached_at = now
+        return self._shards
+
+    def _store(self, collection_name: str) -> QdrantVectorStore:
+        with self.lock:
+            if collection_name not in self.stores:
+                self.stores[collection_name] = QdrantVectorStore(
+                    client=self.client,
+                    collection_name=collection_name,
+                    embedding=self.embeddings
+                )
+            return self.stores[collection_name]
+
+    def _search_shard(self, collection_name: str, embedding: List[float], k: int):
+        return self._store(collection_name).similarity_search_with_score_by_vector(embedding, k=k)
+
+    def search(self, query: str, k: int) -> List[Document]:
+        collection_names = self.shards()
+        if not collection_names:
+            logger.info("No collections to search")
+            return []
+        embedding = self.embeddings.embed_query(query)
+        futures = [
+            self.executor.submit(self._search_shard, name, embedding, k)
+            for name in collection_names
+        ]
+        hits = [hit for future in futures for hit in future.result()]
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        documents = [doc for doc, _score in hits[:k]]
+        if self.hydrate is not None:
+            documents = self.hydrate(documents)
+        return documents
+
+    async def _asearch_shard(self, collection_name: str, embedding: List[float], k: int):
+        response = await self.async_client.query_points(
+            collection_name=collection_name,
+            query=embedding,
+            limit=k,
+            with_payload=True
+        )
+        hits = []
+        for point in response.points:
+            payload = point.payload or {}
+            metadata = {**(payload.get(QdrantVectorStore.METADATA_KEY) or {}), "_id": point.id, "_collection_name": collection_name}
+            hits.append((Document(page_content=payload.get(QdrantVectorStore.CONTENT_KEY) or "", metadata=metadata), point.score))
+        return hits
+
+    async def asearch(self, query: str, k: int) -> List[Document]:
+        """search() without blocking the event loop, native async when an AsyncQdrantClient is set"""
+        if self.async_client is None:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.search, query, k)
+        collection_names = await asyncio.get_running_loop().run_in_executor(self.executor, self.shards)
+        if not collection_names:
+            logger.info("No collections to search")
+            return []
+        embedding = await self.embeddings.aembed_query(query)
+        results = await asyncio.gather(*(self._asearch_shard(name, embedding, k) for name in collection_names))
+        hits = [hit for result in results for hit in result]
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        documents = [doc for doc, _score in hits[:k]]
+        if self.hydrate is hydrate_from_indexer:
+            if self.http_client is None:
+                self.http_client = httpx.AsyncClient()
+            documents = await ahydrate_from_indexer(documents, self.http_client)
+        elif self.hydrate is not None:
+            documents = await asyncio.get_running_loop().run_in_executor(self.executor, self.hydrate, documents)
+        return documents
+
+
+class ShardedQdrantRetriever(BaseRetriever):
+    """Retriever over all shards of the indexer's Qdrant collections"""
+
+    searcher: Any
+    k: int = 4
+
+    def _get_relevant_documents(
+            self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.searcher.search(query, self.k)
+
+    async def _aget_relevant_documents(
+            self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return await self.searcher.asearch(query, self.k)
@@ -0,0 +1,139 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerBusy(Exception):
+    pass
+
+
+@dataclass
+class _Waiter:
+    client_id: str
+    future: asyncio.Future
+    on_position: Optional[Callable[[int], None]]
+    position: int = 0
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class GenerationScheduler:
+    """
+    Admission control for the questions of all connections
+
+    At most max_concurrent questions are answered at the same time, so Ollama keeps working
+    on as many requests as it has parallel slots for instead of thrashing them. Waiting
+    questions are granted round-robin across clients, a client with many questions cannot
+    hold the others back. Beyond max_queue waiting questions new ones are refused with
+    SchedulerBusy. Waiters are told their position whenever it changes, and 0 once they run.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queues: OrderedDict[str, deque[_Waiter]] = OrderedDict()
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    def _order(self) -> List[_Waiter]:
+        """The order in which waiters will be granted: one per client, in turns"""
+        queues = [list(queue) for queue in self.queues.values()]
+        order = []
+        for turn in range(max((len(queue) for queue in queues), default=0)):
+            order.extend(queue[turn] for queue in queues if turn < len(queue))
+        return order
+
+    @staticmethod
+    def _tell(waiter: _Waiter, position: int) -> None:
+        waiter.position = position
+        if waiter.on_position is not None:
+            try:
+                waiter.on_position(position)
+            except Exception as e:
+                logger.error(f"Failed to notify queue position: {e}")
+
+    def _notify(self) -> None:
+        for position, waiter in enumerate(self._order(), start=1):
+            if waiter.position != position:
+                self._tell(waiter, position)
+
+    def _grant(self) -> None:
+        while self.active < self.max_concurrent and self.queues:
+            client_id, queue = next(iter(self.queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                # the client's next question waits for the other clients' turns
+                self.queues.move_to_end(client_id)
+            else:
+                del self.queues[client_id]
+            if waiter.future.done():
+                continue
+            self.active += 1
+            waited = time.monotonic() - waiter.enqueued_at
+            self.waited += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            waiter.future.set_result(None)
+            self._tell(waiter, 0)
+        self._notify()
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._grant()
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self.queues.get(waiter.client_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[waiter.client_id]
+        self._notify()
+
+    @asynccontextmanager
+    async def slot(self, client_id: str, on_position: Optional[Callable[[int], None]] = None):
+        if self.active < self.max_concurrent and not self.queues:
+            self.active += 1
+        else:
+            if self.waiting() >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerBusy(f"{self.waiting()} questions are already waiting")
+            waiter = _Waiter(client_id=client_id, future=asyncio.get_running_loop().create_future(), on_position=on_position)
+            self.queues.setdefault(client_id, deque()).append(waiter)
+            self._notify()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # granted just before the cancellation arrived
+                    self._release()
+                else:
+                    self._remove(waiter)
+                raise
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "waiting": self.waiting(),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "average_wait_seconds": round(self.wait_seconds / self.waited, 3) if self.waited else 0,
+            "max_wait_seconds": round(self.max_wait_seconds, 3),
+        }
@@ -0,0 +1,87 @@
+import time
+import asyncio
+import logging
+from typing import Callable, Dict
+
+from llm_chain import LLMChain
+from chat_session import ChatSession
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """
+    Chat sessions of the open websocket connections
+
+    A session lives as long as its connection. Sessions idle for longer than idle_seconds
+    lose their history, and beyond max_sessions the least recently active session is
+    dropped. Together with the per-session history budget this bounds the memory held for
+    conversations however long the service runs.
+    """
+
+    def __init__(
+            self,
+            llm_chain: LLMChain,
+            max_sessions: int,
+            idle_seconds: float,
+            max_turns: int,
+            max_tokens: int,
+            count_tokens: Callable[[str], int],
+    ):
+        self.llm_chain = llm_chain
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.count_tokens = count_tokens
+        self.sessions: Dict[str, ChatSession] = {}
+        self.evicted = 0
+        self.expired = 0
+
+    def open(self) -> ChatSession:
+        session = ChatSession(
+            self.llm_chain,
+            max_turns=self.max_turns,
+            max_tokens=self.max_tokens,
+            count_tokens=self.count_tokens
+        )
+        self.sessions[session.session_id] = session
+        while len(self.sessions) > self.max_sessions:
+            oldest = min(self.sessions.values(), key=lambda s: s.last_active)
+            logger.info(f"Session cap {self.max_sessions} reached, dropping session {oldest.session_id}")
+            self.close(oldest.session_id)
+            self.evicted += 1
+        return session
+
+    def close(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.closed = True
+            session.clear()
+
+    def expire_idle(self) -> int:
+        """Forget the history of sessions idle for too long, their connections can keep asking"""
+        now = time.monotonic()
+        expired = 0
+        for session in self.sessions.values():
+            if session.history and now - session.last_active > self.idle_seconds:
+                session.clear()
+                expired += 1
+        self.expired += expired
+        return expired
+
+    async def expire_loop(self, interval_seconds: float = 60) -> None:
+        while True:
+            await asyncio.sleep(interval_seconds)
+            expired = self.expire_idle()
+            if expired:
+                logger.info(f"Expired the history of {expired} idle sessions")
+
+    def stats(self) -> Dict[str, any]:
+        return {
+            "sessions": len(self.sessions),
+            "history_messages": sum(len(s.history) for s in self.sessions.values()),
+            "history_tokens": sum(s.history_tokens for s in self.sessions.values()),
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
@@ -0,0 +1,32 @@
+import logging
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+def approximate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def load_token_counter(model_name: str | None) -> Callable[[str], int]:
+    """
+    Count tokens with the Hugging Face tokenizer of model_name
+
+    Ollama does not expose its tokenizer, so this should name the Hugging Face repository
+    of the chat model, or a model with a similar vocabulary. Falls back to an estimate of
+    four characters per token when the tokenizer cannot be loaded.
+    """
+    if not model_name:
+        return approximate_tokens
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        logger.warning(f"Tokenizer {model_name} unavailable ({e}), estimating token counts")
+        return approximate_tokens
+
+    def count_tokens(text: str) -> int:
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    logger.info(f"Counting tokens with the {model_name} tokenizer")
+    return count_tokens
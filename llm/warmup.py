@@ -0,0 +1,97 @@
+import time
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict
+
+from ollama import AsyncClient
+
+logger = logging.getLogger(__name__)
+
+STAGE_PENDING = "pending"
+STAGE_READY = "ready"
+STAGE_FAILED = "failed"
+
+
+class Warmup:
+    """
+    Makes the first question as fast as any other
+
+    At startup the shared models are loaded, the cross-encoder scores a first pair, Ollama
+    loads the chat model into memory and keeps it there for keep_alive, and the indexer's
+    embedding path answers a first request. Stages run concurrently and are retried until
+    timeout_seconds, as Ollama and the indexer may still be starting. The service is ready
+    once every stage is.
+    """
+
+    def __init__(self, registry, timeout_seconds: float, retry_seconds: float = 5):
+        self.registry = registry
+        self.timeout_seconds = timeout_seconds
+        self.retry_seconds = retry_seconds
+        self.stages: Dict[str, Dict[str, any]] = {
+            name: {"status": STAGE_PENDING, "seconds": None, "attempts": 0, "error": None}
+            for name in ("models", "reranker", "ollama", "embedding")
+        }
+
+    @property
+    def ready(self) -> bool:
+        return all(stage["status"] == STAGE_READY for stage in self.stages.values())
+
+    async def _load_models(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.registry.load_all)
+
+    async def _score_pair(self) -> None:
+        # in the executor, the registry blocks while another stage loads the models
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.registry.reranker.score([("warm up", "warm up")])
+        )
+
+    async def _load_ollama_model(self) -> None:
+        config = self.registry.config
+        # an empty prompt only loads the model, keep_alive keeps it loaded between questions
+        await AsyncClient(host=config.ollama_url).generate(
+            model=config.ollama_model,
+            prompt="",
+            keep_alive=config.ollama_keep_alive
+        )
+
+    async def _embed(self) -> None:
+        embeddings = await asyncio.get_running_loop().run_in_executor(None, lambda: self.registry.embeddings)
+        await embeddings.aembed_query("warm up")
+
+    async def _run(self, name: str, step: Callable[[], Awaitable[None]]) -> None:
+        stage = self.stages[name]
+        start = time.perf_counter()
+        while True:
+            stage["attempts"] += 1
+            try:
+                await step()
+                stage["status"] = STAGE_READY
+                stage["error"] = None
+                break
+            except Exception as e:
+                stage["error"] = str(e)
+                if time.perf_counter() - start + self.retry_seconds > self.timeout_seconds:
+                    stage["status"] = STAGE_FAILED
+                    logger.error(f"Warm-up stage {name} failed: {e}")
+                    break
+                logger.info(f"Warm-up stage {name} not ready yet, retrying: {e}")
+                await asyncio.sleep(self.retry_seconds)
+        stage["seconds"] = round(time.perf_counter() - start, 3)
+        logger.info(f"Warm-up stage {name}: {stage['status']} in {stage['seconds']}s")
+
+    async def run(self) -> None:
+        start = time.perf_counter()
+        await asyncio.gather(
+            self._run("models", self._load_models),
+            self._run("reranker", self._score_pair),
+            self._run("ollama", self._load_ollama_model),
+            self._run("embedding", self._embed),
+        )
+        logger.info(f"Warm-up finished in {time.perf_counter() - start:.3f}s, ready: {self.ready}")
+
+    def report(self) -> Dict[str, any]:
+        return {
+            "ready": self.ready,
+            "stages": self.stages,
+            "load_seconds": dict(self.registry.load_seconds),
+        }
@@ -1,5 +1,6 @@
 import httpx
 import logging
+from . import tracing
 
 
 logging.basicConfig(level=logging.INFO)
@@ -11,15 +12,16 @@ REQUEST_HEADERS = {
     'Content-Type': 'application/json'
 }
 
-async def request_data(query):
+async def request_data(query, **search_params):
     payload = {
-        "query": query
+        "query": query,
+        **{key: value for key, value in search_params.items() if value is not None}
     }
     async with httpx.AsyncClient() as client:
         try:
             logger.info(f"Requesting data from indexer with query: {query}")
             response = await client.post(REQUEST_DATA_URL, 
-                                         headers=REQUEST_HEADERS, 
+                                         headers={**REQUEST_HEADERS, **tracing.trace_headers()}, 
                                          json=payload)
             response.raise_for_status()
             data = response.json()
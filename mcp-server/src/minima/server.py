@@ -1,7 +1,8 @@
 import logging
 import mcp.server.stdio
-from typing import Annotated
+from typing import Annotated, Optional
 from mcp.server import Server
+from . import tracing
 from .requestor import request_data
 from pydantic import BaseModel, Field
 from mcp.server.stdio import stdio_server
@@ -36,6 +37,59 @@ class Query(BaseModel):
         str, 
         Field(description="context to find")
     ]
+    top_k: Annotated[
+        int,
+        Field(default=5, ge=1, le=50, description="maximum number of passages to return")
+    ]
+    max_chars: Annotated[
+        int,
+        Field(default=8000, ge=200, le=200_000, description="maximum total characters of the returned passages")
+    ]
+    score_threshold: Annotated[
+        Optional[float],
+        Field(default=None, ge=-1, le=1, description="skip passages with a lower similarity score")
+    ]
+    cursor: Annotated[
+        Optional[str],
+        Field(default=None, description="next_cursor from a previous call, to get the following passages")
+    ]
+    file_types: Annotated[
+        Optional[list[str]],
+        Field(default=None, description="only search files with these extensions, e.g. [\".pdf\", \".md\"]")
+    ]
+    folder: Annotated[
+        Optional[str],
+        Field(default=None, description="only search files under this folder, relative to the indexed root")
+    ]
+    modified_after: Annotated[
+        Optional[str],
+        Field(default=None, description="only search files modified after this ISO 8601 date, e.g. 2024-05-01")
+    ]
+    modified_before: Annotated[
+        Optional[str],
+        Field(default=None, description="only search files modified before this ISO 8601 date")
+    ]
+
+    def filters(self) -> Optional[dict]:
+        filters = {
+            "extensions": self.file_types,
+            "path_prefix": self.folder,
+            "modified_after": self.modified_after,
+            "modified_before": self.modified_before,
+        }
+        filters = {key: value for key, value in filters.items() if value}
+        return filters or None
+
+
+def format_hits(result: dict) -> str:
+    """Render ranked hits as compact text blocks with their source and score"""
+    blocks = [
+        f"[{hit['score']:.3f}] {hit['path']}\n{hit['text']}"
+        for hit in result["hits"]
+    ]
+    if result.get("next_cursor"):
+        blocks.append(f"More results available, cursor: {result['next_cursor']}")
+    return "\n\n".join(blocks)
 
 @server.list_tools()
 async def list_tools() -> list[Tool]:
@@ -81,14 +135,21 @@ async def call_tool(name, arguments: dict) -> list[TextContent]:
         logging.error("Context is required")
         raise McpError(INVALID_PARAMS, "Context is required")
 
-    output = await request_data(context)
+    with tracing.trace(), tracing.span("minima-query"):
+        output = await request_data(
+            context,
+            top_k=args.top_k,
+            max_chars=args.max_chars,
+            score_threshold=args.score_threshold,
+            cursor=args.cursor,
+            filters=args.filters()
+        )
     if "error" in output:
         logging.error(output["error"])
         raise McpError(INTERNAL_ERROR, output["error"])
     
     logging.info(f"Get prompt: {output}")    
-    output = output['result']['output']
-    #links = output['result']['links']
+    output = format_hits(output['result'])
     result = []
     result.append(TextContent(type="text", text=output))
     return result
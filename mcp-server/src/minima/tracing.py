@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from typing import Optional
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "/tmp/minima-traces.jsonl")
+SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "mcp-server")
+
+TRACE_HEADER = "X-Minima-Trace-Id"
+PARENT_SPAN_HEADER = "X-Minima-Parent-Span-Id"
+
+_trace_id = contextvars.ContextVar("minima_trace_id", default=None)
+_span_id = contextvars.ContextVar("minima_span_id", default=None)
+_export_lock = threading.Lock()
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def trace_headers() -> dict:
+    """Headers that propagate the current trace to the next hop"""
+    if not TRACING_ENABLED or _trace_id.get() is None:
+        return {}
+    headers = {TRACE_HEADER: _trace_id.get()}
+    if _span_id.get() is not None:
+        headers[PARENT_SPAN_HEADER] = _span_id.get()
+    return headers
+
+
+def export(record: dict) -> None:
+    line = json.dumps(record, default=str)
+    try:
+        with _export_lock:
+            with open(TRACE_EXPORT_PATH, "a") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.error(f"Failed to export span {record['name']}: {e}")
+
+
+@contextmanager
+def trace(trace_id: str = None, parent_span_id: str = None):
+    """Start (or continue, when trace_id comes from an upstream hop) a trace in the current context"""
+    trace_token = _trace_id.set(trace_id or new_id())
+    span_token = _span_id.set(parent_span_id)
+    try:
+        yield _trace_id.get()
+    finally:
+        _span_id.reset(span_token)
+        _trace_id.reset(trace_token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block of work and export it as a span, a no-op unless TRACING_ENABLED is set"""
+    if not TRACING_ENABLED:
+        yield attributes
+        return
+    trace_token = None
+    if _trace_id.get() is None:
+        trace_token = _trace_id.set(new_id())
+    parent_id = _span_id.get()
+    span_id = new_id()
+    span_token = _span_id.set(span_id)
+    error = None
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        error = repr(e)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        export({
+            "trace_id": _trace_id.get(),
+            "span_id": span_id,
+            "parent_id": parent_id,
+            "service": SERVICE_NAME,
+            "name": name,
+            "start": started,
+            "duration_ms": round(duration * 1000, 3),
+            "attributes": attributes,
+            "error": error,
+        })
+        _span_id.reset(span_token)
+        if trace_token is not None:
+            _trace_id.reset(trace_token)
+
+
+async def http_middleware(request, call_next):
+    """FastAPI http middleware continuing the caller's trace for every inbound request"""
+    if not TRACING_ENABLED:
+        return await call_next(request)
+    with trace(request.headers.get(TRACE_HEADER), request.headers.get(PARENT_SPAN_HEADER)) as trace_id:
+        with span(f"{request.method} {request.url.path}") as attributes:
+            response = await call_next(request)
+            attributes["status_code"] = response.status_code
+    response.headers[TRACE_HEADER] = trace_id
+    return response
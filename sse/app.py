@@ -8,7 +8,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import httpx
 import os
-from typing import AsyncGenerator
+import tracing
+from typing import AsyncGenerator, Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("sse-server")
@@ -23,6 +24,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.middleware("http")(tracing.http_middleware)
 
 # Configuration - should match your existing Minima setup
 INDEXER_URL = os.getenv("INDEXER_URL", "http://localhost:8001")
@@ -30,18 +32,27 @@ INDEXER_URL = os.getenv("INDEXER_URL", "http://localhost:8001")
 class QueryRequest(BaseModel):
     query: str
     stream: bool = True
+    top_k: Optional[int] = None
+    score_threshold: Optional[float] = None
+    max_chars: Optional[int] = None
+    cursor: Optional[str] = None
+    filters: Optional[dict] = None
+    profile: Optional[str] = None
+    search: Optional[dict] = None
 
 async def format_sse_data(data: dict) -> str:
     """Format data as Server-Sent Events"""
     return f"data: {json.dumps(data)}\n\n"
 
-async def query_indexer(query: str) -> dict:
+async def query_indexer(query: str, **search_params) -> dict:
     """Query the indexer service for relevant documents"""
+    payload = {"query": query, **{k: v for k, v in search_params.items() if v is not None}}
     async with httpx.AsyncClient() as client:
         try:
             response = await client.post(
                 f"{INDEXER_URL}/query",
-                json={"query": query},
+                json=payload,
+                headers=tracing.trace_headers(),
                 timeout=30.0
             )
             return response.json()
@@ -49,7 +60,7 @@ async def query_indexer(query: str) -> dict:
             logger.error(f"Error querying indexer: {e}")
             return {"error": str(e)}
 
-async def stream_query_results(query: str) -> AsyncGenerator[str, None]:
+async def stream_query_results(query: str, **search_params) -> AsyncGenerator[str, None]:
     """Stream query results as SSE"""
     try:
         # Send initial status
@@ -67,7 +78,8 @@ async def stream_query_results(query: str) -> AsyncGenerator[str, None]:
         })
         
         # Get results from indexer
-        results = await query_indexer(query)
+        with tracing.span("query_indexer"):
+            results = await query_indexer(query, **search_params)
         
         if "error" in results:
             yield await format_sse_data({
@@ -128,7 +140,16 @@ async def stream_query(request: QueryRequest):
     logger.info(f"Received streaming query: {request.query}")
     
     return StreamingResponse(
-        stream_query_results(request.query),
+        stream_query_results(
+            request.query,
+            top_k=request.top_k,
+            score_threshold=request.score_threshold,
+            max_chars=request.max_chars,
+            cursor=request.cursor,
+            filters=request.filters,
+            profile=request.profile,
+            search=request.search
+        ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -138,12 +159,36 @@ async def stream_query(request: QueryRequest):
     )
 
 @app.get("/stream/query")
-async def stream_query_get(query: str):
+async def stream_query_get(
+    query: str,
+    top_k: Optional[int] = None,
+    score_threshold: Optional[float] = None,
+    max_chars: Optional[int] = None,
+    cursor: Optional[str] = None,
+    extensions: Optional[str] = None,
+    path_prefix: Optional[str] = None,
+    modified_after: Optional[str] = None,
+    modified_before: Optional[str] = None
+):
     """Stream query results using Server-Sent Events (GET method)"""
     logger.info(f"Received streaming query (GET): {query}")
+    filters = {
+        "extensions": extensions.split(",") if extensions else None,
+        "path_prefix": path_prefix,
+        "modified_after": modified_after,
+        "modified_before": modified_before,
+    }
+    filters = {k: v for k, v in filters.items() if v is not None}
     
     return StreamingResponse(
-        stream_query_results(query),
+        stream_query_results(
+            query,
+            top_k=top_k,
+            score_threshold=score_threshold,
+            max_chars=max_chars,
+            cursor=cursor,
+            filters=filters or None
+        ),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",